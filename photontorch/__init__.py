@@ -30,6 +30,7 @@ from . import components
 from . import environment
 from . import networks
 from . import nn
+from . import analysis
 
 
 ## Components
@@ -82,9 +83,12 @@ from .networks.rings import RingNetwork
 
 # Reck Network
 from .networks.reck import ReckNxN
+from .networks.reck import reck_decomposition
 
 # Clements Network
 from .networks.clements import ClementsNxN
+from .networks.clements import FlatClementsNxN
+from .networks.clements import clements_decomposition
 
 
 ## Environment
@@ -96,7 +100,8 @@ from .environment.environment import current_environment
 
 ## Detectors
 
-from .detectors.lowpassdetector import lfilter
+from .detectors.filters import lfilter
+from .detectors.filters import sosfilt
 from .detectors.lowpassdetector import LowpassDetector
 from .detectors.photodetector import Photodetector
 
@@ -110,4 +115,16 @@ from .nn.nn import BoundedParameter
 from .nn.nn import Module
 from .nn.nn import BERLoss
 from .nn.nn import MSELoss
+from .nn.nn import BERAccumulator
+from .nn.nn import MSEAccumulator
+from .nn.nn import estimate_latency
 from .nn.nn import BitStreamGenerator
+from .nn.nn import RidgeReadout
+from .nn.nn import MatrixLayer
+from .nn.nn import prbs
+from .nn.nn import prbs_chunks
+
+
+## Analysis
+
+from .analysis.eye import EyeDiagram
@@ -0,0 +1,9 @@
+""" analysis
+
+Vectorized analysis tools for (detected) bitstreams, such as eye diagrams,
+eye openings and Q-factors.
+
+"""
+
+from .eye import fold
+from .eye import EyeDiagram
@@ -0,0 +1,278 @@
+""" Eye diagram analysis
+
+The detected bitstream is folded onto the bit period, after which the eye
+histograms, the eye opening and the Q-factor are calculated for all
+(wavelength, detector, batch) channels at once.
+
+"""
+
+#############
+## Imports ##
+#############
+
+# Torch
+import torch
+
+# Relative
+from ..environment.environment import current_environment
+
+
+##########
+## Fold ##
+##########
+
+
+def fold(x, bitrate=None, samplerate=None, latency=0.0, warmup=0):
+    """fold a bitstream onto the bit period
+
+    Args:
+        x (Tensor): the bitstream. Should be broadcastable to tensor with shape (# timesteps, # wavelengths, # readouts, # batches)
+        bitrate (optional, float): [1/s] data rate of the bitstream (defaults to bitrate found in environment)
+        samplerate (optional, float): [1/s] sample rate of the bitstream (defaults to samplerate found in environment)
+        latency (float): [bits] fractional latency of the bitstream.
+        warmup (int): [bits] number of warmup bits to disregard.
+
+    Returns:
+        Tensor: the folded bitstream with shape (# bits, # samples per bit,
+            # wavelengths, # readouts, # batches). This is a view of the
+            original tensor whenever possible.
+
+    """
+    spb = _samples_per_bit(bitrate, samplerate)
+    x = _to_4d(x)
+    start = int((int(warmup + 0.5) + latency) * spb + 0.5)
+    if start < 0:
+        raise ValueError(
+            "please add more warmup bits for negative latency %.2f" % latency
+        )
+    num_bits = max(x.shape[0] - start, 0) // spb
+    x = x[start : start + num_bits * spb]
+    return x.reshape(num_bits, spb, *x.shape[1:])
+
+
+################
+## EyeDiagram ##
+################
+
+
+class EyeDiagram(object):
+    """ Streaming eye diagram analysis
+
+    The eye diagram accumulates (chunks of) a detected bitstream. For each
+    sample position within the bit period (phase) and for each channel, it
+    keeps a histogram of the detected values and the statistics of the
+    one-level and the zero-level. A bit is classified as a one or a zero by
+    its value in the middle of the bit period.
+
+    Example:
+        >>> eye = pt.analysis.EyeDiagram(bitrate=40e9, samplerate=160e9)
+        >>> for chunk in torch.split(detected, 10000):
+        >>>     eye.update(chunk)
+        >>> eye.q_factor, eye.eye_height, eye.eye_width
+
+    """
+
+    def __init__(
+        self,
+        bitrate=None,
+        samplerate=None,
+        num_bins=100,
+        range=None,
+        threshold=None,
+        latency=0.0,
+        warmup=0,
+    ):
+        """
+        Args:
+            bitrate (optional, float): [1/s] data rate of the bitstream (defaults to bitrate found in environment)
+            samplerate (optional, float): [1/s] sample rate of the bitstream (defaults to samplerate found in environment)
+            num_bins (int): number of histogram bins.
+            range (optional, tuple): (min, max) range of the histogram. If
+                None: the range of the first chunk (with a 10% margin).
+            threshold (optional, float): decision threshold between ones and
+                zeros. If None: the mean of the first chunk.
+            latency (float): [bits] fractional latency of the bitstream.
+            warmup (int): [bits] number of warmup bits to disregard.
+        """
+        self.samples_per_bit = _samples_per_bit(bitrate, samplerate)
+        self.num_bins = int(num_bins)
+        self.range = None if range is None else (float(range[0]), float(range[1]))
+        self.threshold = None if threshold is None else float(threshold)
+        self.latency = float(latency)
+        self.warmup = int(warmup + 0.5)
+        self.reset()
+
+    def reset(self):
+        """ clear the accumulated statistics """
+        start = int((self.warmup + self.latency) * self.samples_per_bit + 0.5)
+        if start < 0:
+            raise ValueError(
+                "please add more warmup bits for negative latency %.2f" % self.latency
+            )
+        self._skip = start  # number of samples still to skip
+        self._rest = None  # samples of an incomplete bit
+        self._range = self.range
+        self._threshold = self.threshold
+        self.num_bits = 0
+        self.histogram = None
+        self._stats = None
+
+    def update(self, x):
+        """ add the next chunk of the bitstream to the eye diagram
+
+        Args:
+            x (Tensor): the next chunk of the bitstream. Should be broadcastable to tensor with shape (# timesteps, # wavelengths, # readouts, # batches)
+
+        Returns:
+            EyeDiagram: the eye diagram itself.
+        """
+        spb = self.samples_per_bit
+        with torch.no_grad():
+            x = _to_4d(x)
+            if self._rest is not None:
+                x = torch.cat([self._rest, x], 0)
+            skip = min(self._skip, x.shape[0])
+            self._skip -= skip
+            x = x[skip:]
+            num_bits = x.shape[0] // spb
+            self._rest = x[num_bits * spb :]
+            if num_bits == 0:
+                return self
+            eye = x[: num_bits * spb].reshape(num_bits, spb, *x.shape[1:])
+            eye = eye.to(torch.float64)
+
+            if self._threshold is None:
+                self._threshold = eye.mean((0, 1))
+            if self._range is None:
+                lo, hi = float(eye.min()), float(eye.max())
+                margin = 0.1 * (hi - lo) if hi > lo else 1.0
+                self._range = (lo - margin, hi + margin)
+            if self._stats is None:
+                zeros = eye.new_zeros(eye.shape[1:])
+                self._stats = {
+                    "n1": zeros.clone(),
+                    "s1": zeros.clone(),
+                    "ss1": zeros.clone(),
+                    "n0": zeros.clone(),
+                    "s0": zeros.clone(),
+                    "ss0": zeros.clone(),
+                    "min1": zeros + float("inf"),
+                    "max0": zeros - float("inf"),
+                }
+                self.histogram = torch.zeros(
+                    (spb, self.num_bins) + eye.shape[2:],
+                    dtype=torch.long,
+                    device=eye.device,
+                )
+
+            # classify the bits by their value in the middle of the bit period:
+            ones = (eye[:, spb // 2] > self._threshold)[:, None].expand_as(eye)
+            m1 = ones.to(eye.dtype)
+            m0 = 1.0 - m1
+            stats = self._stats
+            stats["n1"] += m1.sum(0)
+            stats["s1"] += (m1 * eye).sum(0)
+            stats["ss1"] += (m1 * eye ** 2).sum(0)
+            stats["n0"] += m0.sum(0)
+            stats["s0"] += (m0 * eye).sum(0)
+            stats["ss0"] += (m0 * eye ** 2).sum(0)
+            inf = torch.full_like(eye, float("inf"))
+            min1 = torch.where(ones, eye, inf).min(0)[0]
+            max0 = torch.where(ones, -inf, eye).max(0)[0]
+            stats["min1"] = torch.min(stats["min1"], min1)
+            stats["max0"] = torch.max(stats["max0"], max0)
+
+            # histogram: scatter the counts into the (phase, bin) rows
+            lo, hi = self._range
+            bins = ((eye - lo) / (hi - lo) * self.num_bins).floor().long()
+            bins = bins.clamp(0, self.num_bins - 1)
+            phase = torch.arange(spb, device=eye.device).reshape(1, spb, 1, 1, 1)
+            idx = (phase * self.num_bins + bins).reshape(num_bits * spb, -1)
+            hist = self.histogram.view(spb * self.num_bins, -1)
+            hist.scatter_add_(0, idx, torch.ones_like(idx))
+
+            self.num_bits += num_bits
+
+        return self
+
+    def _levels(self):
+        """ mean and standard deviation of the one- and zero-levels per phase """
+        if self._stats is None:
+            raise RuntimeError("no bits accumulated yet.")
+        s = self._stats
+        mu1, mu0 = s["s1"] / s["n1"], s["s0"] / s["n0"]
+        sigma1 = (s["ss1"] / s["n1"] - mu1 ** 2).clamp(min=0) ** 0.5
+        sigma0 = (s["ss0"] / s["n0"] - mu0 ** 2).clamp(min=0) ** 0.5
+        return mu1, sigma1, mu0, sigma0
+
+    @property
+    def q(self):
+        """ Q-factor for each phase with shape (# samples per bit, # wavelengths, # readouts, # batches) """
+        mu1, sigma1, mu0, sigma0 = self._levels()
+        return (mu1 - mu0) / (sigma1 + sigma0)
+
+    @property
+    def q_factor(self):
+        """ Q-factor at the best phase with shape (# wavelengths, # readouts, # batches) """
+        return self.q.max(0)[0]
+
+    @property
+    def best_phase(self):
+        """ sample index within the bit period with the highest Q-factor """
+        return self.q.argmax(0)
+
+    @property
+    def eye_height(self):
+        """ vertical eye opening (worst-case one-level minus worst-case zero-level) at the phase where the eye is most open """
+        if self._stats is None:
+            raise RuntimeError("no bits accumulated yet.")
+        return (self._stats["min1"] - self._stats["max0"]).max(0)[0].clamp(min=0)
+
+    @property
+    def decision_threshold(self):
+        """ the threshold used to classify the bits (None before the first update) """
+        return self._threshold
+
+    @property
+    def eye_width(self):
+        """ [bits] horizontal eye opening: the fraction of the bit period where the eye is open """
+        if self._stats is None:
+            raise RuntimeError("no bits accumulated yet.")
+        is_open = self._stats["min1"] > self._stats["max0"]
+        return is_open.to(torch.float64).sum(0) / self.samples_per_bit
+
+
+#############
+## Helpers ##
+#############
+
+
+def _samples_per_bit(bitrate=None, samplerate=None):
+    """ get the (integer) number of samples per bit """
+    try:
+        env = current_environment()
+        bitrate = env.bitrate if bitrate is None else bitrate
+        samplerate = env.samplerate if samplerate is None else samplerate
+    except RuntimeError:
+        pass
+    if bitrate is None or samplerate is None:
+        raise ValueError("please specify a bitrate and samplerate.")
+    spb = int(float(samplerate) / float(bitrate) + 0.5)
+    if spb < 1 or abs(spb * float(bitrate) - float(samplerate)) > 1e-6 * float(
+        samplerate
+    ):
+        raise ValueError(
+            "eye diagrams require an integer number of samples per bit. "
+            "Got %.3f samples per bit." % (float(samplerate) / float(bitrate))
+        )
+    return spb
+
+
+def _to_4d(x):
+    """ bring a bitstream in the (t, w, d, b) shape """
+    if not torch.is_tensor(x):
+        x = torch.tensor(x, dtype=torch.get_default_dtype())
+    x = x.detach()
+    while x.ndim < 4:
+        x = x[:, None]
+    return x
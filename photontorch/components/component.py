@@ -35,6 +35,11 @@ class Component(Module):
     num_ports = 0
     """ Number of ports of the component. """
 
+    # components of this class with equal public attributes, parameters and
+    # buffers have the same S-matrix, which a network then only sets once.
+    # Only enable this if set_S does not depend on any private state.
+    _share_S = False
+
     def __init__(self, name=None):
         """ Component
 
@@ -118,6 +123,23 @@ class Component(Module):
         """
         pass
 
+    @classmethod
+    def batched_set_S(cls, components, S):
+        """ Set the elements of the scattering matrices of several components at once.
+
+        Args:
+            components (list): the components (all of this class) to set the
+                scattering matrices for.
+            S (Tensor[2, #wavelengths, #components, #ports, #ports]): the empty
+                scattering matrices of the components.
+
+        Note:
+            Subclasses can overwrite this classmethod with a vectorized version
+            of ``set_S``. By default, ``set_S`` is called for each component.
+        """
+        for i, comp in enumerate(components):
+            comp.set_S(S[:, :, i])
+
     def set_C(self, C):
         """ Set the connection matrix of the component.
 
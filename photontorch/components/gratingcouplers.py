@@ -60,8 +60,8 @@ class GratingCoupler(Component):
     def set_S(self, S):
         fwhm2sigma = 1.0 / (2 * np.sqrt(2 * np.log(2)))
         sigma = fwhm2sigma * self.bandwidth
-        wls = torch.tensor(
-            self.env.wl, device=self.device, dtype=torch.get_default_dtype()
+        wls = self.env.tensor(
+            "wl", dtype=torch.get_default_dtype(), device=self.device
         )
         loss = torch.sqrt(
             self.Tmax * torch.exp(-((self.wl0 - wls) ** 2) / (2 * sigma ** 2))
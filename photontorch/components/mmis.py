@@ -18,6 +18,7 @@ import numpy as np
 ## Relative
 from .component import Component
 from ..nn.nn import Buffer, Parameter
+from ..environment import current_environment
 
 
 #########
@@ -87,3 +88,29 @@ class Mmi(Component):
         _, _, m, n = weights.shape
         S[:, :, :m, m:] = weights
         S[:, :, m:, :m] = torch.transpose(weights, -1, -2)
+
+    def transfer_matrix(self, inputs=None, outputs=None):
+        """the frequency domain transfer matrix between free ports of the MMI
+
+        Args:
+            inputs (optional, list): the indices of the free ports to use as
+                inputs. Default: the m input ports.
+            outputs (optional, list): the indices of the free ports to use as
+                outputs. Default: the n output ports.
+
+        Returns:
+            Tensor: the real and imaginary part of the transfer matrix with
+                shape (2, # wavelengths, # outputs, # inputs).
+        """
+        env = current_environment()
+        _, m, n = self.weights.shape
+        S = torch.zeros(
+            (2, env.num_wl, self.num_ports, self.num_ports),
+            dtype=self.weights.dtype,
+            device=self.device,
+        )
+        self.set_S(S)
+        free = self.port_order[self.free_ports_at[self.port_order]]
+        inputs = free[:m] if inputs is None else free[torch.as_tensor(list(inputs))]
+        outputs = free[m:] if outputs is None else free[torch.as_tensor(list(outputs))]
+        return S[:, :, outputs][:, :, :, inputs]
@@ -40,6 +40,7 @@ class Mzi(Component):
     """
 
     num_ports = 4
+    _share_S = True
 
     def __init__(
         self,
@@ -83,7 +84,7 @@ class Mzi(Component):
         delays[:] = self.ng * self.length / self.env.c
 
     def set_S(self, S):
-        wls = torch.tensor(self.env.wl, dtype=torch.float64, device=self.device)
+        wls = self.env.tensor("wl", dtype=torch.float64, device=self.device)
 
         # neff depends on the wavelength:
         neff = self.neff - (wls - self.wl0) * (self.ng - self.neff) / self.wl0
@@ -110,4 +111,40 @@ class Mzi(Component):
 
         # add loss
         loss = self.loss * self.length
-        return S * 10 ** (-loss / 20)  # 20 bc loss is defined on power.
+        S *= 10 ** (-loss / 20)  # 20 bc loss is defined on power.
+
+    @classmethod
+    def batched_set_S(cls, components, S):
+        device = components[0].device
+        wls = components[0].env.tensor("wl", dtype=torch.float64, device=device)
+        wls = wls[:, None]
+        attributes = [[c.neff, c.ng, c.wl0, c.length, c.loss] for c in components]
+        attributes = torch.tensor(attributes, dtype=torch.float64, device=device)
+        neff, ng, wl0, length, loss = attributes.t()
+        phi = torch.stack([c.phi for c in components]).to(device)
+        theta = torch.stack([c.theta for c in components]).to(device)
+
+        # neff depends on the wavelength:
+        neff = neff - (wls - wl0) * (ng - neff) / wl0
+        phi0 = (2 * np.pi * neff * length / wls) % (2 * np.pi)
+        phi1 = phi0 + phi
+
+        # cos / sin of phases
+        dtype = torch.get_default_dtype()
+        cos_phi0, sin_phi0 = torch.cos(phi0).to(dtype), torch.sin(phi0).to(dtype)
+        cos_phi1, sin_phi1 = torch.cos(phi1).to(dtype), torch.sin(phi1).to(dtype)
+        cos_theta, sin_theta = torch.cos(theta).to(dtype), torch.sin(theta).to(dtype)
+
+        # scattering matrix
+        S[0, :, :, 0, 1] = S[0, :, :, 1, 0] = cos_phi1 * cos_theta
+        S[1, :, :, 0, 1] = S[1, :, :, 1, 0] = sin_phi1 * cos_theta
+        S[0, :, :, 0, 2] = S[0, :, :, 2, 0] = cos_phi1 * sin_theta
+        S[1, :, :, 0, 2] = S[1, :, :, 2, 0] = sin_phi1 * sin_theta
+        S[0, :, :, 1, 3] = S[0, :, :, 3, 1] = -cos_phi0 * sin_theta
+        S[1, :, :, 1, 3] = S[1, :, :, 3, 1] = -sin_phi0 * sin_theta
+        S[0, :, :, 2, 3] = S[0, :, :, 3, 2] = cos_phi0 * cos_theta
+        S[1, :, :, 2, 3] = S[1, :, :, 3, 2] = sin_phi0 * cos_theta
+
+        # add loss
+        loss = 10 ** (-loss * length / 20)  # 20 bc loss is defined on power.
+        S *= loss.to(dtype)[:, None, None]
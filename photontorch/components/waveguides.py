@@ -31,6 +31,8 @@ class Waveguide(Connection):
 
     """
 
+    _share_S = True
+
     def __init__(
         self,
         length=1e-5,
@@ -73,7 +75,7 @@ class Waveguide(Connection):
         delays[:] = self.ng * self.length / self.env.c
 
     def set_S(self, S):
-        wls = torch.tensor(self.env.wl, dtype=torch.float64, device=self.device)
+        wls = self.env.tensor("wl", dtype=torch.float64, device=self.device)
 
         # neff depends on the wavelength:
         neff = self.neff - (wls - self.wl0) * (self.ng - self.neff) / self.wl0
@@ -89,3 +91,27 @@ class Waveguide(Connection):
         # calculate real part and imag part
         S[0, :, 0, 1] = S[0, :, 1, 0] = re
         S[1, :, 0, 1] = S[1, :, 1, 0] = ie
+
+    @classmethod
+    def batched_set_S(cls, components, S):
+        device = components[0].device
+        wls = components[0].env.tensor("wl", dtype=torch.float64, device=device)
+        wls = wls[:, None]
+        attributes = [[c.neff, c.ng, c.wl0, c.length, c.loss] for c in components]
+        attributes = torch.tensor(attributes, dtype=torch.float64, device=device)
+        neff, ng, wl0, length, loss = attributes.t()
+        phase = torch.stack([c.phase for c in components]).to(device)
+
+        # neff depends on the wavelength:
+        neff = neff - (wls - wl0) * (ng - neff) / wl0
+        phase = (2 * np.pi * neff * length / wls) % (2 * np.pi) + phase
+
+        # calculate loss
+        loss = 10 ** (-loss * length / 20)  # 20 because loss works on power
+        dtype = torch.get_default_dtype()
+        re = (loss * torch.cos(phase)).to(dtype)
+        ie = (loss * torch.sin(phase)).to(dtype)
+
+        # calculate real part and imag part
+        S[0, :, :, 0, 1] = S[0, :, :, 1, 0] = re
+        S[1, :, :, 0, 1] = S[1, :, :, 1, 0] = ie
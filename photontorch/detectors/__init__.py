@@ -5,6 +5,10 @@ power of the fields.
 
 """
 
-from .lowpassdetector import lfilter
+from .filters import lfilter
+from .filters import sosfilt
+from .filters import FilterPlanCache
+from .filters import filter_plan_cache
+from .noise import philox4x32
 from .lowpassdetector import LowpassDetector
 from .photodetector import Photodetector
@@ -0,0 +1,365 @@
+""" Differentiable IIR filters
+
+Fast PyTorch implementations of (cascaded) IIR filters. The filters are
+evaluated as second-order sections (sos), each section being a 2-state linear
+recurrence. Three backends are available to evaluate that recurrence:
+
+* ``"scan"``: a parallel (associative) prefix scan over time. This needs
+  O(#timesteps) work in O(log(#timesteps)) vectorized steps.
+* ``"chunked"``: a blocked recurrence. The signal is split in chunks, each chunk
+  is filtered with a single matrix multiplication and the filter state is
+  carried to the next chunk.
+* ``"fft"``: FFT-based convolution with the impulse response of the filter.
+  This is usually the fastest method for long signals, but it does not accept
+  an initial filter state.
+
+All backends are differentiable and filter along dimension 0. They are
+equivalent to ``scipy.signal.sosfilt`` and ``scipy.signal.lfilter``.
+
+The ``"chunked"`` method is the default. Best-of-three timings [s] of a 4th
+order Butterworth filter applied to 16 float64 signals on a CPU:
+
+============  =====================  ========  ===========  =======
+#timesteps    scipy.signal.sosfilt   scan      chunked      fft
+============  =====================  ========  ===========  =======
+1 000         1.6e-4                 2.7e-3    4.9e-3       2.6e-3
+10 000        1.4e-3                 1.5e-2    1.0e-2       1.9e-2
+100 000       2.1e-2                 1.6e-1    6.7e-2       1.6e-1
+1 000 000     3.0e-1                 3.6e+0    7.1e-1       1.4e+0
+============  =====================  ========  ===========  =======
+
+"""
+
+#############
+## Imports ##
+#############
+
+# Standard Library
+from collections import OrderedDict
+
+# Torch
+import torch
+
+# 3rd Party
+import numpy as np
+from scipy.signal import tf2sos, butter
+
+
+#############
+## sosfilt ##
+#############
+
+
+def sosfilt(sos, x, zi=None, method="chunked", chunk_size=256):
+    """PyTorch sosfilt
+
+    Args:
+        sos (Tensor): array of second-order filter coefficients with shape
+            (# sections, 6). Each row corresponds to a second-order section,
+            with the first three columns providing the numerator coefficients
+            and the last three providing the denominator coefficients.
+        x (Tensor): An N-dimensional input tensor.
+        zi (optional, Tensor): Initial conditions for the cascaded filter
+            delays with shape (# sections, 2, *x.shape[1:]).
+        method (str): the method to evaluate the filter with: "scan",
+            "chunked" or "fft".
+        chunk_size (int): the chunk size used by the "chunked" method.
+
+    Returns:
+        y (Tensor): the filtered signal.
+        zf (Tensor): [only if zi is given] the final filter delay values.
+
+    Note:
+        The filtering happens along dimension (axis) 0.
+    """
+    if method not in ("scan", "chunked", "fft"):
+        raise ValueError(
+            "Unknown filter method '%s'. Valid methods are 'scan', 'chunked' and "
+            "'fft'." % method
+        )
+    sos = _sos_tensor(sos, x)
+
+    if method == "fft":
+        if zi is not None:
+            raise ValueError("the 'fft' method does not accept initial conditions.")
+        return _fftfilt(sos, x)
+
+    original_shape = x.shape
+    x = x.reshape(x.shape[0], -1)
+    if zi is not None:
+        zi = torch.as_tensor(zi, dtype=x.dtype, device=x.device)
+        zi = zi.reshape(sos.shape[0], 2, x.shape[1])
+
+    zf = []
+    for i, section in enumerate(sos):
+        z0 = None if zi is None else zi[i]
+        if method == "scan":
+            x, z = _scan_section(section, x, z0)
+        else:
+            x, z = _chunked_section(section, x, z0, chunk_size)
+        zf.append(z)
+
+    y = x.reshape(original_shape)
+    if zi is None:
+        return y
+
+    zf = torch.stack(zf, 0).reshape((sos.shape[0], 2) + original_shape[1:])
+    return y, zf
+
+
+def lfilter(b, a, x, method=None):
+    """PyTorch lfilter
+
+    Args:
+        b (array): The numerator coefficient vector in a 1-D sequence.
+        a (array): The denominator coefficient vector in a 1-D sequence.
+            if ``a[0]`` is not 1, then both ``a`` and ``b`` are normalized by ``a[0]``.
+        x (torch.Tensor): An N-dimensional input tensor.
+        method (optional, str): the method to evaluate the filter with (see
+            ``sosfilt``). By default, the compiled ``torch_lfilter`` is used if
+            it's installed, otherwise the "chunked" method is used.
+
+    Note:
+        The filtering happens along dimension (axis) 0.
+    """
+    if torch.is_tensor(b):
+        b = b.detach().cpu().numpy()
+    if torch.is_tensor(a):
+        a = a.detach().cpu().numpy()
+    b, a = np.asarray(b, dtype=np.float64), np.asarray(a, dtype=np.float64)
+    if not (b.ndim == a.ndim == 1):
+        raise ValueError("filter vectors b and a should be 1D.")
+
+    if method is None and _torch_lfilter is not None:
+        return _torch_lfilter(b, a, x)
+
+    return sosfilt(tf2sos(b, a), x, method="chunked" if method is None else method)
+
+
+##################
+## Filter Plans ##
+##################
+
+
+class FilterPlan(object):
+    """ Ready-to-use coefficient tensors of a filter
+
+    Attributes:
+        b (Tensor): the numerator coefficients of the filter.
+        a (Tensor): the denominator coefficients of the filter.
+        sos (Tensor): the second-order sections of the filter.
+
+    """
+
+    def __init__(self, b, a, sos):
+        """
+        Args:
+            b (Tensor): the numerator coefficients of the filter.
+            a (Tensor): the denominator coefficients of the filter.
+            sos (Tensor): the second-order sections of the filter.
+        """
+        self.b = b
+        self.a = a
+        self.sos = sos
+
+    def __call__(self, x, zi=None, method=None):
+        """ filter a signal along dimension 0 (see ``sosfilt``) """
+        if zi is None and method is None and _torch_lfilter is not None:
+            b = self.b.detach().cpu().numpy()
+            a = self.a.detach().cpu().numpy()
+            return _torch_lfilter(b, a, x)
+        method = "chunked" if method is None else method
+        return sosfilt(self.sos, x, zi=zi, method=method)
+
+
+class FilterPlanCache(object):
+    """ Least-recently-used cache of Butterworth filter plans
+
+    Designing a Butterworth filter and converting its coefficients to tensors
+    is pure overhead when a detector is called many times with the same
+    settings. The cache stores the resulting ``FilterPlan`` for each
+    (order, normal cutoff, dtype, device) combination.
+
+    """
+
+    def __init__(self, maxsize=64):
+        """
+        Args:
+            maxsize (int): the maximum number of plans kept in the cache.
+        """
+        self.maxsize = int(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+
+    def __len__(self):
+        return len(self._plans)
+
+    def butter(self, order, normal_cutoff, dtype=None, device=None):
+        """ get the plan of a digital lowpass Butterworth filter
+
+        Args:
+            order (int): the order of the filter.
+            normal_cutoff (float): the cutoff frequency normalized to the
+                nyquist frequency.
+            dtype (optional, torch.dtype): the dtype of the coefficient tensors.
+                None -> "torch.get_default_dtype()"
+            device (optional, torch.device): the device of the coefficient
+                tensors. None -> "cpu"
+
+        Returns:
+            FilterPlan: the filter plan.
+
+        """
+        dtype = torch.get_default_dtype() if dtype is None else dtype
+        device = torch.device("cpu") if device is None else torch.device(device)
+        key = (int(order), float(normal_cutoff), dtype, device)
+
+        plan = self._plans.pop(key, None)
+        if plan is None:
+            self.misses += 1
+            b, a = butter(key[0], key[1], btype="lowpass", analog=False)
+            sos = butter(key[0], key[1], btype="lowpass", analog=False, output="sos")
+            plan = FilterPlan(
+                b=torch.tensor(b, dtype=dtype, device=device),
+                a=torch.tensor(a, dtype=dtype, device=device),
+                sos=torch.tensor(sos, dtype=dtype, device=device),
+            )
+        else:
+            self.hits += 1
+
+        self._plans[key] = plan  # (re)insert as most recently used
+        while len(self._plans) > self.maxsize:
+            self._plans.popitem(last=False)
+
+        return plan
+
+    def clear(self):
+        """ remove all plans from the cache and reset the hit/miss counters """
+        self._plans.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+filter_plan_cache = FilterPlanCache()
+""" the filter plan cache used by the detectors and the bitstream generator """
+
+
+#############
+## Helpers ##
+#############
+
+try:
+    from torch_lfilter import lfilter as _torch_lfilter  # C++ compiled lfilter
+except ImportError:
+    _torch_lfilter = None
+
+
+def _sos_tensor(sos, x):
+    """ convert second order sections into a tensor of the same dtype as x """
+    if not torch.is_tensor(sos):
+        sos = torch.tensor(np.asarray(sos, dtype=np.float64))
+    sos = sos.to(dtype=x.dtype, device=x.device)
+    if sos.ndim != 2 or sos.shape[1] != 6:
+        raise ValueError("sos array should have shape (# sections, 6).")
+    return sos / sos[:, 3:4]  # normalize: a0 = 1
+
+
+def _state_space(section):
+    """ state space representation (A, B, D) of a transposed direct form II section """
+    b0, b1, b2, _, a1, a2 = section
+    one, zero = torch.ones_like(a1), torch.zeros_like(a1)
+    A = torch.stack([torch.stack([-a1, one]), torch.stack([-a2, zero])])
+    B = torch.stack([b1 - a1 * b0, b2 - a2 * b0])
+    return A, B, b0
+
+
+def _scan_section(section, x, zi=None):
+    """filter a 2D signal (t, m) with a single section using a parallel scan
+
+    The state s[n] = A s[n-1] + B x[n] of the section is found with a
+    work-efficient (odd-even) prefix scan: O(#timesteps) work in
+    O(log(#timesteps)) vectorized steps.
+    """
+    A, B, D = _state_space(section)
+    u = B[None, :, None] * x[:, None, :]  # (t, 2, m)
+    s0 = torch.zeros_like(u[:1]) if zi is None else zi[None]
+    if zi is not None:
+        u = torch.cat([u[:1] + A @ s0, u[1:]], 0)
+    s = _linear_scan(A, u)  # s[n] is the state after input n
+    y = torch.cat([s0[:, 0], s[:-1, 0]], 0) + D * x
+    return y, s[-1]
+
+
+def _linear_scan(A, u):
+    """solve s[n] = A s[n-1] + u[n] with s[-1] = 0 for a (t, 2, m) input u
+
+    Neighbouring timesteps are merged pairwise, the odd states follow from the
+    (recursive) scan of the merged pairs and the even states from the odd ones.
+    """
+    num_t = u.shape[0]
+    if num_t == 1:
+        return u
+    n = num_t - num_t % 2
+    even, odd = u[0:n:2], u[1:n:2]
+    s_odd = _linear_scan(A @ A, odd + torch.einsum("ij,tjm->tim", A, even))
+    s_even = torch.cat(
+        [even[:1], even[1:] + torch.einsum("ij,tjm->tim", A, s_odd[:-1])], 0
+    )
+    s = torch.stack([s_even, s_odd], 1).reshape((n,) + u.shape[1:])
+    if n < num_t:
+        s = torch.cat([s, u[n:] + (A @ s[-1])[None]], 0)
+    return s
+
+
+def _chunked_section(section, x, zi=None, chunk_size=256):
+    """filter a 2D signal (t, m) with a single section in chunks
+
+    Within a chunk of length L, the output is the sum of the response to the
+    incoming state (L x 2 matrix) and the convolution of the input with the
+    impulse response (L x L Toeplitz matrix). The state is carried from chunk
+    to chunk.
+    """
+    A, B, D = _state_space(section)
+    L = max(min(int(chunk_size), x.shape[0]), 1)
+
+    # powers of A: P[n] = A^n
+    P = [torch.eye(2, dtype=x.dtype, device=x.device)]
+    for _ in range(L):
+        P.append(A @ P[-1])
+    P = torch.stack(P, 0)  # (L + 1, 2, 2)
+
+    # output response to the incoming state: y[n] = (A^n s)[0]
+    O = P[:L, 0, :]  # (L, 2)
+    # impulse response: h[0] = D, h[n] = (A^(n-1) B)[0]
+    h = torch.cat([D[None], (P[: L - 1] @ B)[:, 0]], 0)  # (L,)
+    n = torch.arange(L, device=x.device)
+    k = n[:, None] - n[None, :]
+    T = torch.where(k >= 0, h[k.clamp(min=0)], torch.zeros_like(h[k.clamp(min=0)]))
+    # state response to the inputs: s_end = sum_j A^(L-1-j) B x[j]
+    S = (P[:L].flip(0) @ B).t()  # (2, L)
+
+    s = torch.zeros_like(x[:2]) if zi is None else zi
+    ys = []
+    for i in range(0, x.shape[0], L):
+        xc = x[i : i + L]
+        l = xc.shape[0]
+        ys.append(O[:l] @ s + T[:l, :l] @ xc)
+        if l == L:
+            s = P[L] @ s + S @ xc
+        else:
+            s = P[l] @ s + S[:, L - l :] @ xc
+    return torch.cat(ys, 0), s
+
+
+def _fftfilt(sos, x):
+    """ filter a signal by FFT convolution with the impulse response of the filter """
+    num_t = x.shape[0]
+    impulse = torch.zeros(num_t, dtype=x.dtype, device=x.device)
+    impulse[0] = 1.0
+    h = sosfilt(sos, impulse, method="chunked")
+    n = 1 << (2 * num_t - 2).bit_length()  # power of 2 without circular wrap-around
+    H = torch.fft.rfft(h, n=n)
+    X = torch.fft.rfft(x, n=n, dim=0)
+    H = H.reshape((H.shape[0],) + (1,) * (x.ndim - 1))
+    return torch.fft.irfft(X * H, n=n, dim=0)[:num_t]
@@ -18,10 +18,9 @@ following numpy/scipy function: ::
 # Torch
 import torch
 
-# 3rd Party
-from scipy.signal import butter
-
 # Relative
+from .filters import lfilter  # for backward compatibility
+from .filters import filter_plan_cache
 from ..nn.nn import Module
 from ..environment.environment import current_environment
 
@@ -33,64 +32,6 @@ q = 1.602176563e-19  # [C] elementary charge
 k = 1.3806488e-23  # [m2kg/Ks2] boltzmann constant
 T = 300  # [K] room temperature
 
-#############
-## lfilter ##
-#############
-
-try:
-    from torch_lfilter import lfilter  # C++ compiled version of lfilter below
-except ImportError:
-    from warnings import warn
-
-    def lfilter(b, a, x):
-        """PyTorch lfilter
-
-        Args:
-            b (torch.Tensor): The numerator coefficient vector in a 1-D sequence.
-            a (torch.Tensor): The denominator coefficient vector in a 1-D sequence.
-                if ``a[0]`` is not 1, then both ``a`` and ``b`` are normalized by ``a[0]``.
-            x (torch.Tensor): An N-dimensional input tensor.
-
-        Note:
-            The filtering happens along dimension (axis) 0.
-        """
-
-        warn(
-            "the python package `torch_lfilter` is not installed.\n"
-            "Falling back on a pure python `lfilter` implementation for detection.\n"
-            "This is much slower. Consider installing `torch_lfilter`."
-        )
-
-        if not (b.ndim == a.ndim == 1):
-            raise ValueError("filter vectors b and a should be 1D.")
-        b = torch.tensor(
-            [float(bb) / float(a[0]) for bb in b], dtype=x.dtype, device=x.device
-        )[:, None]
-        a = torch.tensor(
-            [float(aa) / float(a[0]) for aa in reversed(a[1:])],
-            dtype=x.dtype,
-            device=x.device,
-        )[:, None]
-
-        order = b.shape[0]
-        num_timesteps = x.shape[0]
-        original_shape = x.shape
-
-        x = x.reshape(num_timesteps, -1)
-        y = torch.zeros_like(x)
-
-        y[0] = y[0] + b[-1] * x[0]
-        for n in range(1, order, 1):
-            y[n] = y[n] + (b[-1 - n :] * x[: n + 1]).sum(0)
-            y[n] = y[n] - (a[-n:] * y[:n]).sum(0)
-
-        for n in range(order, num_timesteps, 1):
-            y[n] = y[n] + (b * x[n - order + 1 : n + 1]).sum(0)
-            y[n] = y[n] - (a * y[n - order + 1 : n]).sum(0)
-
-        return y.reshape(*original_shape)
-
-
 #####################
 ## LospassDetector ##
 #####################
@@ -110,6 +51,7 @@ class LowpassDetector(Module):
         cutoff_frequency=20e9,
         filter_order=4,
         responsivity=1.0,
+        streaming=False,
     ):
         """
         Args:
@@ -118,6 +60,9 @@ class LowpassDetector(Module):
             cutoff_frequency (float): [1/s] cutoff frequency of the detector
             filter_order (int): filter order of the butter filter
             responsivity (float): [A/W] resonsivity of the detector
+            streaming (bool): keep the filter state between calls. This way,
+                a long signal can be detected chunk by chunk (along the time
+                dimension). Call ``reset`` to start detecting a new signal.
         """
         super(LowpassDetector, self).__init__()
         self.bitrate = float(bitrate)
@@ -125,6 +70,8 @@ class LowpassDetector(Module):
         self.cutoff_frequency = float(cutoff_frequency)
         self.filter_order = int(filter_order + 0.5)
         self.responsivity = float(responsivity)
+        self.streaming = bool(streaming)
+        self._zi = None
 
         normal_cutoff = 2 * self.cutoff_frequency / self.samplerate
         if normal_cutoff > 1.0:
@@ -158,11 +105,6 @@ class LowpassDetector(Module):
             environment, those values will be regarded as keyword arguments and
             hence get precedence over the values given during the detector
             initialization.
-
-        Note:
-            The detector is quite efficient on CPU-tensors, but not on CUDA
-            (GPU) tensors. Consider converting the signal to CPU before
-            detecting.
         """
 
         # handle arguments
@@ -208,7 +150,27 @@ class LowpassDetector(Module):
                 "%.2e < %.2e" % (samplerate, 2 * cutoff_frequency)
             )
 
-        # set filter parameters:
-        b, a = butter(filter_order, normal_cutoff, btype="lowpass", analog=False)
+        # get filter parameters:
+        plan = filter_plan_cache.butter(
+            filter_order, normal_cutoff, dtype=signal.dtype, device=signal.device
+        )
+
+        if not self.streaming:
+            return plan(signal)
+
+        # continue filtering from the state at the end of the previous chunk:
+        zi = self._zi
+        if zi is None or zi.shape != (plan.sos.shape[0], 2) + signal.shape[1:]:
+            zi = torch.zeros(
+                (plan.sos.shape[0], 2) + signal.shape[1:],
+                dtype=signal.dtype,
+                device=signal.device,
+            )
+        signal, zf = plan(signal, zi=zi)
+        self._zi = zf.detach()
+
+        return signal
 
-        return lfilter(b, a, signal)
+    def reset(self):
+        """ reset the filter state of a streaming detector """
+        self._zi = None
@@ -0,0 +1,114 @@
+""" Counter-based noise generation
+
+A counter-based random number generator (Philox4x32-10) evaluated with
+(int64) PyTorch operations. Each random number is a pure function of a key
+(the seed) and a counter (the sample index). Noise can therefore be generated
+directly on the device of the signal, in chunks of any size and in any order,
+while always giving the same result.
+
+"""
+
+#############
+## Imports ##
+#############
+
+# Standard Library
+import math
+
+# Torch
+import torch
+
+
+###############
+## Constants ##
+###############
+
+_MASK = 0xFFFFFFFF
+_M0, _M1 = 0xD2511F53, 0xCD9E8D57  # philox multipliers
+_W0, _W1 = 0x9E3779B9, 0xBB67AE85  # philox key increments (weyl sequence)
+
+
+############
+## Philox ##
+############
+
+
+def _mulhilo(a, b):
+    """ high and low 32 bits of the 64 bit product of a (tensor) and b (constant)
+
+    The 32 bit x 32 bit product overflows int64; hence b is split in two 16 bit
+    halves.
+    """
+    p1 = a * (b & 0xFFFF)
+    p2 = a * (b >> 16)
+    lo = p1 + ((p2 & 0xFFFF) << 16)
+    hi = ((p2 >> 16) + (lo >> 32)) & _MASK
+    return hi, lo & _MASK
+
+
+def philox4x32(counter, key, rounds=10):
+    """Philox4x32 counter-based random number generator
+
+    Args:
+        counter (Tensor): int64 tensor with shape (4, ...) containing four
+            32 bit counter words.
+        key (tuple): two 32 bit key words.
+        rounds (int): number of philox rounds.
+
+    Returns:
+        Tensor: int64 tensor with shape (4, ...) containing four random
+            32 bit words for each counter.
+
+    """
+    c0, c1, c2, c3 = counter
+    k0, k1 = int(key[0]) & _MASK, int(key[1]) & _MASK
+    for _ in range(rounds):
+        hi0, lo0 = _mulhilo(c0, _M0)
+        hi1, lo1 = _mulhilo(c2, _M1)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+        k0, k1 = (k0 + _W0) & _MASK, (k1 + _W1) & _MASK
+    return torch.stack([c0, c1, c2, c3], 0)
+
+
+def randn(shape, seed, offset=0, dtype=None, device=None, chunk_size=2 ** 20):
+    """generate normally distributed noise with a counter-based generator
+
+    Args:
+        shape (tuple): the shape of the noise tensor.
+        seed (int): the seed (key) of the generator.
+        offset (int): the global sample index of the first element of the
+            (flattened) noise tensor.
+        dtype (optional, torch.dtype): the dtype of the noise. None -> "torch.get_default_dtype()"
+        device (optional, torch.device): the device to generate the noise on. None -> "cpu"
+        chunk_size (int): the number of samples generated at once.
+
+    Returns:
+        Tensor: the noise tensor.
+
+    Note:
+        Element ``i`` of the flattened noise tensor only depends on the seed
+        and its global sample index ``offset + i``: it is one of the four
+        normal samples derived from the four words of counter
+        ``(offset + i) // 4``. Generating a long noise sequence in one call or
+        in several calls (with the corresponding offsets) hence gives
+        identical results.
+
+    """
+    dtype = torch.get_default_dtype() if dtype is None else dtype
+    device = torch.device("cpu") if device is None else torch.device(device)
+    key = (int(seed) & _MASK, (int(seed) >> 32) & _MASK)
+    noise = torch.empty(shape, dtype=dtype, device=device)
+    flat = noise.view(-1)
+    for i in range(0, flat.shape[0], chunk_size):
+        start, stop = offset + i, offset + min(i + chunk_size, flat.shape[0])
+        # each counter gives four words, hence two Box-Muller pairs:
+        n = torch.arange(start // 4, (stop + 3) // 4, dtype=torch.int64, device=device)
+        zero = torch.zeros_like(n)
+        w = philox4x32(torch.stack([n & _MASK, n >> 32, zero, zero], 0), key)
+        w = w.to(torch.float64)
+        r = torch.sqrt(-2.0 * torch.log((w[0::2] + 1.0) / 2 ** 32))  # u in (0, 1]
+        angle = 2 * math.pi * w[1::2] / 2 ** 32  # u in [0, 1)
+        z = torch.stack([r * torch.cos(angle), r * torch.sin(angle)], 2)  # (2, c, 2)
+        z = z.transpose(0, 1).reshape(-1)[start % 4 :][: stop - start]
+        flat[i : i + stop - start] = z.to(dtype)
+    return noise
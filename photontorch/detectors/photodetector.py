@@ -14,6 +14,7 @@ into account.
 import torch
 
 # Relative
+from .noise import randn
 from .lowpassdetector import LowpassDetector
 
 ###############
@@ -50,6 +51,7 @@ class Photodetector(LowpassDetector):
         load_resistance=166,
         filter_order=4,
         seed=None,
+        streaming=False,
     ):
         """
         Args:
@@ -61,6 +63,10 @@ class Photodetector(LowpassDetector):
             load_resistance (float): [Ohm] load resistance of the detector
             filter_order (int): filter order of the butter filter
             seed (int): random seed for the detector noise
+            streaming (bool): keep the filter state and the position of the
+                noise generator between calls. This way, a long signal can be
+                detected chunk by chunk (along the time dimension). Call
+                ``reset`` to start detecting a new signal.
         """
         super(Photodetector, self).__init__(
             bitrate=bitrate,
@@ -68,15 +74,15 @@ class Photodetector(LowpassDetector):
             cutoff_frequency=cutoff_frequency,
             responsivity=responsivity,
             filter_order=filter_order,
+            streaming=streaming,
         )
         self.dark_current = float(dark_current)
         self.load_resistance = float(load_resistance)
         self.seed = None if seed is None else int(seed)
-        self._rng = (
-            torch.default_generator
-            if self.seed is None
-            else torch.Generator(device="cpu").manual_seed(seed)
-        )
+        # key of the counter-based noise generator (see _noise_key):
+        self._key = self.seed
+        # global sample index of the next noise sample:
+        self._offset = 0
 
     def forward(
         self,
@@ -106,11 +112,6 @@ class Photodetector(LowpassDetector):
             environment, those values will be regarded as keyword arguments and
             hence get precedence over the values given during the detector
             initialization.
-
-        Note:
-            The detector is quite efficient on CPU-tensors, but not on CUDA
-            (GPU) tensors. Consider converting the signal to CPU before
-            detecting.
         """
         cutoff_frequency = (
             self.cutoff_frequency
@@ -148,9 +149,14 @@ class Photodetector(LowpassDetector):
             sigma_noise = torch.sqrt(var_thermal_noise + var_shot_noise)
 
             # noise
-            noise = sigma_noise * torch.randn(
-                *signal.shape, device=self._rng.device, generator=self._rng
-            ).to(dtype=signal.dtype, device=signal.device)
+            noise = sigma_noise * randn(
+                signal.shape,
+                seed=self._noise_key(),
+                offset=self._offset,
+                dtype=signal.dtype,
+                device=signal.device,
+            )
+            self._offset += signal.numel()
 
         # low pass filter:
         # note that the lowpass detector takes responsivity into account.
@@ -164,3 +170,19 @@ class Photodetector(LowpassDetector):
         )
 
         return signal
+
+    def _noise_key(self):
+        """the key of the counter-based noise generator
+
+        An unseeded detector draws its key from the global torch generator at
+        its first detection, such that ``torch.manual_seed`` calls made after
+        creating the detector still determine its noise.
+        """
+        if self._key is None:
+            self._key = int(torch.randint(2 ** 62, (1,)))
+        return self._key
+
+    def reset(self):
+        """ reset the filter state and the noise generator of a streaming detector """
+        super(Photodetector, self).reset()
+        self._offset = 0
@@ -400,6 +400,7 @@ class Environment(object):
         self.freqdomain = self.frequency_domain = bool(freqdomain)
         self.grad = self.enable_grad = bool(grad)
         self.__dict__.update(kwargs)
+        self._tensor_cache = {}  # (name, dtype, device) -> tensor
         self._grad_manager = torch.enable_grad() if self.grad else torch.no_grad()
         # synonyms for backward compatibility:
         self._synonyms = (
@@ -466,6 +467,31 @@ class Environment(object):
         new.update(kwargs)
         return self.__class__(**new)
 
+    def tensor(self, name, dtype=torch.float64, device=None):
+        """ Get an array of the environment as a (cached) tensor
+
+        Args:
+            name (str): the name of the array: "wl", "f" or "t".
+            dtype (torch.dtype): the dtype of the tensor.
+            device (optional, torch.device): the device of the tensor (default: cpu).
+
+        Returns:
+            Tensor: the array as a tensor. The tensor is only created once for each
+                (dtype, device) combination and should not be changed in-place.
+        """
+        if name not in ("wl", "f", "t"):
+            raise ValueError(
+                "only the 'wl', 'f' and 't' arrays of an environment are available "
+                "as tensor. Got '%s'." % name
+            )
+        device = torch.device("cpu") if device is None else torch.device(device)
+        key = (name, dtype, device)
+        if key not in self._tensor_cache:
+            self._tensor_cache[key] = torch.tensor(
+                getattr(self, name), dtype=dtype, device=device
+            )
+        return self._tensor_cache[key]
+
     def __enter__(self):
         _current_environments.appendleft(self)
         self._grad_manager.__enter__()
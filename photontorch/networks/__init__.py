@@ -12,12 +12,17 @@ from . import network
 from .network import Network
 from .network import current_network
 from .network import link
+from .network import TemplateCache
+from .network import template_cache
 
 # Ring Networks
 from .rings import RingNetwork
 
 # Reck Network
 from .reck import ReckNxN
+from .reck import reck_decomposition
 
 # Clements Network
 from .clements import ClementsNxN
+from .clements import FlatClementsNxN
+from .clements import clements_decomposition
@@ -9,11 +9,21 @@ Reference:
 ## Imports ##
 #############
 
+# standard library
+from collections import OrderedDict
+
+# torch
+import torch
+
 # other
 import numpy as np
 
 # relative
 from .network import Network
+from .network import _has_batched_set_S, _terminate
+from ..nn.nn import Parameter, Buffer
+from ..environment import current_environment
+from ..components.component import Component
 from ..components.mzis import Mzi
 from ..components.waveguides import Waveguide
 from ..components.terms import Source, Detector
@@ -39,6 +49,8 @@ def _mzi_factory():
 class _PhaseArray(Network):
     """ helper network for ClementsNxN """
 
+    _cache_template = True
+
     def __init__(
         self, N, wg_factory=_wg_factory, name=None,
     ):
@@ -66,6 +78,8 @@ class _PhaseArray(Network):
 class _MixingPhaseArrayClements(Network):
     """ helper network for ClementsNxN """
 
+    _cache_template = True
+
     def __init__(
         self, N, wg_factory=_wg_factory, mzi_factory=_mzi_factory, name=None,
     ):
@@ -126,6 +140,8 @@ class _Capacity2ClementsNxN(Network):
 
     """
 
+    _cache_template = True
+
     def __init__(
         self, N=2, wg_factory=_wg_factory, mzi_factory=_mzi_factory, name=None,
     ):
@@ -206,6 +222,8 @@ class ClementsNxN(Network):
 
     """
 
+    _cache_template = True
+
     def __init__(
         self,
         N=2,
@@ -270,3 +288,729 @@ class ClementsNxN(Network):
         ret = super(ClementsNxN, self).terminate(term)
         ret.to(self.device)
         return ret
+
+    def transfer_matrix(self, inputs=None, outputs=None):
+        """the frequency domain transfer matrix of the mesh
+
+        The S-matrices of all MZIs (and of all waveguides) of the mesh are set
+        at once with ``batched_set_S`` (grouped by class). Their 2x2 transfer
+        matrices are then applied column by column, without any port-level
+        reduction of the network.
+
+        Args:
+            inputs (optional, list): the indices of the free ports to use as
+                inputs. Default: the N input ports.
+            outputs (optional, list): the indices of the free ports to use as
+                outputs. Default: the N output ports.
+
+        Returns:
+            Tensor: the real and imaginary part of the transfer matrix with
+                shape (2, # wavelengths, # outputs, # inputs).
+        """
+        topology = _flat_clements_topology(self.N, self.capacity)
+        mzis = zip(topology["mzi_columns"], topology["mzi_lanes"])
+        mzis = [self._element(c, l) for c, l in mzis]
+        edges = zip(topology["edge_columns"], topology["edge_lanes"])
+        edges = [self._element(c, l, mzi=False) for c, l in edges]
+        layer = self.components["layer%i" % (self.capacity // 2)]
+        phases = [layer.components["wg%i" % l] for l in range(self.N)]
+
+        # 2x2 transfer matrices [[S10, S13], [S20, S23]] of the MZIs:
+        blocks = _batched_S(mzis, self.device)[:, :, :, [1, 2]][:, :, :, :, [0, 3]]
+        waveguides = _batched_S(edges + phases, self.device)[:, :, :, 1, 0]
+        columns = _split_columns(
+            self.capacity,
+            torch.tensor(topology["mzi_columns"], dtype=torch.int64),
+            torch.tensor(topology["mzi_lanes"], dtype=torch.int64),
+            blocks,
+            torch.tensor(topology["edge_columns"], dtype=torch.int64),
+            torch.tensor(topology["edge_lanes"], dtype=torch.int64),
+            waveguides[:, :, : len(edges)],
+        )
+        T = _cascade_columns(self.N, columns, waveguides[:, :, len(edges) :])
+        return _select_ports(T, inputs, outputs)
+
+    def _element(self, c, l, mzi=True):
+        """ the MZI (or edge waveguide) at column c and (upper) lane l of the mesh """
+        layer = self.components["layer%i" % (c // 2)]
+        full = c // 2 < self.capacity // 2  # part of a _Capacity2ClementsNxN
+        if mzi:
+            name = "mzi%i" % (l if full else l // 2)
+        else:
+            name = ("wg0" if l == 0 else "wg1") if full else "wg_"
+        return layer.components[name]
+
+    def load_unitary(self, U, wl=None):
+        """program the mesh to implement a unitary matrix
+
+        The phases of the MZIs and the waveguides are found analytically with
+        ``clements_decomposition``.
+
+        Args:
+            U (Tensor): the real and imaginary part of the unitary matrix with
+                shape (2, N, N).
+            wl (optional, float): the wavelength at which the mesh should
+                implement U. Default: the center wavelength of the MZIs.
+
+        Returns:
+            ClementsNxN: the mesh itself.
+
+        Note:
+            All MZIs and waveguides of the mesh are assumed to have the same
+            propagation phase, as is the case for the default factories.
+        """
+        reference = self._element(0, 0)
+        wl = reference.wl0 if wl is None else wl
+        phi, theta, phase = clements_decomposition(
+            U, self.capacity, _propagation_phase(reference, wl)
+        )
+
+        topology = _flat_clements_topology(self.N, self.capacity)
+        params, values = [], []
+        mzis = zip(topology["mzi_columns"], topology["mzi_lanes"])
+        for m, (c, l) in enumerate(mzis):
+            params += [self._element(c, l).phi, self._element(c, l).theta]
+            values += [phi[..., m], theta[..., m]]
+        # the decomposition needs no edge phases. This also holds for the edge
+        # waveguides shared by the top and bottom lanes of a _Capacity2ClementsNxN.
+        for c, l in zip(topology["edge_columns"], topology["edge_lanes"]):
+            params.append(self._element(c, l, mzi=False).phase)
+            values.append(torch.zeros_like(params[-1]))
+        layer = self.components["layer%i" % (self.capacity // 2)]
+        for l in range(self.N):
+            params.append(layer.components["wg%i" % l].phase)
+            values.append(phase[..., l])
+        _load_phases(params, values)
+        return self
+
+
+class FlatClementsNxN(Component):
+    r""" An array-backed unitary matrix mesh based on the Clements architecture.
+
+    The flat Clements mesh has the same topology and port semantics as
+    ``ClementsNxN``, but it is a single component: the phases of all MZIs and
+    waveguides are stored in a few tensors and the S-matrix of the whole mesh
+    is set with a single vectorized expression.
+
+    Network::
+
+         <--- capacity --->
+        0__  ______  ______[]__0
+           \/      \/
+        1__/\__  __/\__  __[]__1
+               \/      \/
+        2__  __/\__  __/\__[]__2
+           \/      \/
+        3__/\______/\______[]__3
+
+        with:
+
+           0__[]__1 = phase shift
+
+           3__  __2
+              \/    =  MZI
+           0__/\__1
+
+    Attributes:
+        phi (Tensor): the input phases of the MZIs.
+        theta (Tensor): the phase differences between the arms of the MZIs.
+        edge_phase (Tensor): the phases of the waveguides at the edges of the
+            MZI columns (the lanes that are not coupled by an MZI).
+        phase (Tensor): the phases of the output phase shifters.
+        mzi_columns (Tensor): the column index of each MZI.
+        mzi_lanes (Tensor): the (upper) lane index of each MZI.
+        edge_columns (Tensor): the column index of each edge waveguide.
+        edge_lanes (Tensor): the lane index of each edge waveguide.
+
+    Note:
+        The ``length``, ``loss``, ``neff`` and ``ng`` apply to every MZI and
+        every waveguide of the mesh: the flat mesh is equivalent to a
+        ``ClementsNxN`` whose factories create MZIs and waveguides with these
+        same properties. Note that the loss of a lossy mesh hence scales with
+        its capacity, as every lane crosses capacity + 1 elements.
+
+        Unlike in ``ClementsNxN``, where the top and bottom edge waveguides of
+        a pair of MZI columns are a single (shared) waveguide, the edge
+        waveguides of the flat mesh have independent phases. A ``ClementsNxN``
+        can hence be copied into a flat mesh, but not always the other way
+        around.
+
+    """
+
+    def __init__(
+        self,
+        N=2,
+        capacity=None,
+        length=1e-5,
+        loss=0,
+        neff=2.34,
+        ng=3.40,
+        wl0=1.55e-6,
+        trainable=True,
+        name=None,
+    ):
+        """
+        Args:
+            N (int): number of input / output ports (the mesh represents an NxN matrix)
+            capacity (int): number of consecutive MZI layers (to span the full unitary space one needs capacity >=N).
+            length (float): length of the MZIs and the waveguides in meter.
+            loss (float): loss in the MZIs and the waveguides [dB/m]
+            neff (float): effective index of the waveguides
+            ng (float): group index of the waveguides
+            wl0 (float): the center wavelength for which neff is defined.
+            trainable (bool): whether the phases of the mesh are trainable.
+            name (optional, str): the name of the mesh
+        """
+        if capacity is None:
+            capacity = N
+
+        self.N = int(N)
+        self.capacity = int(capacity)
+        topology = _flat_clements_topology(self.N, self.capacity)
+        self._connections = topology["connections"]
+        self._port_order = topology["port_order"]
+
+        super(FlatClementsNxN, self).__init__(name=name)
+
+        self.ng = float(ng)
+        self.neff = float(neff)
+        self.length = float(length)
+        self.loss = float(loss)
+        self.wl0 = float(wl0)
+        self.trainable = trainable
+
+        for key in ("mzi_columns", "mzi_lanes", "edge_columns", "edge_lanes"):
+            setattr(
+                self,
+                key,
+                Buffer(torch.tensor(topology[key], dtype=torch.int64).reshape(-1)),
+            )
+
+        parameter = Parameter if trainable else Buffer
+        num_mzis, num_edges = len(topology["mzi_lanes"]), len(topology["edge_lanes"])
+        self.phi = parameter(torch.tensor(2 * np.pi * np.random.rand(num_mzis)))
+        self.theta = parameter(torch.tensor(2 * np.pi * np.random.rand(num_mzis)))
+        self.edge_phase = parameter(
+            torch.tensor(2 * np.pi * np.random.rand(num_edges))
+        )
+        self.phase = parameter(torch.tensor(2 * np.pi * np.random.rand(self.N)))
+
+    @property
+    def num_ports(self):
+        """ the number of ports of all MZIs and waveguides of the mesh """
+        return len(self._port_order)
+
+    def set_delays(self, delays):
+        delays[:] = self.ng * self.length / self.env.c
+
+    def set_S(self, S):
+        mzis, waveguides = self._element_values()
+
+        # MZIs: the (0, 1), (0, 2), (1, 3) and (2, 3) elements of each MZI
+        base = 4 * torch.arange(mzis.shape[2], device=self.device)[:, None]
+        rows = base + torch.tensor([0, 0, 1, 2], device=self.device)
+        cols = base + torch.tensor([1, 2, 3, 3], device=self.device)
+        S[:, :, rows, cols] = S[:, :, cols, rows] = mzis
+
+        # waveguides: the (0, 1) element of each waveguide
+        rows = 4 * mzis.shape[2] + 2 * torch.arange(
+            waveguides.shape[2], device=self.device
+        )
+        S[:, :, rows, rows + 1] = S[:, :, rows + 1, rows] = waveguides
+
+    def transfer_matrix(self, inputs=None, outputs=None):
+        """the frequency domain transfer matrix of the mesh
+
+        The transfer matrix is found by applying the 2x2 transfer matrices of
+        the MZIs (and the phases of the waveguides) column by column.
+
+        Args:
+            inputs (optional, list): the indices of the free ports to use as
+                inputs. Default: the N input ports.
+            outputs (optional, list): the indices of the free ports to use as
+                outputs. Default: the N output ports.
+
+        Returns:
+            Tensor: the real and imaginary part of the transfer matrix with
+                shape (2, # wavelengths, # outputs, # inputs).
+        """
+        self.initialize()
+        mzis, waveguides = self._element_values()
+        num_edges = self.edge_lanes.shape[0]
+
+        # 2x2 transfer matrices [[S10, S13], [S20, S23]] of the MZIs:
+        blocks = mzis[:, :, :, [0, 2, 1, 3]].reshape(mzis.shape[:3] + (2, 2))
+        edges = waveguides[:, :, :num_edges]
+        phase = waveguides[:, :, num_edges:]
+
+        columns = _split_columns(
+            self.capacity,
+            self.mzi_columns,
+            self.mzi_lanes,
+            blocks,
+            self.edge_columns,
+            self.edge_lanes,
+            edges,
+        )
+        T = _cascade_columns(self.N, columns, phase)
+        return _select_ports(T, inputs, outputs)
+
+    def load_unitary(self, U, wl=None):
+        """program the mesh to implement a unitary matrix
+
+        The phases of the MZIs and the waveguides are found analytically with
+        ``clements_decomposition``.
+
+        Args:
+            U (Tensor): the real and imaginary part of the unitary matrix with
+                shape (2, N, N).
+            wl (optional, float): the wavelength at which the mesh should
+                implement U. Default: the center wavelength wl0.
+
+        Returns:
+            FlatClementsNxN: the mesh itself.
+        """
+        wl = self.wl0 if wl is None else wl
+        phi, theta, phase = clements_decomposition(
+            U, self.capacity, _propagation_phase(self, wl)
+        )
+        _load_phases(
+            [self.phi, self.theta, self.edge_phase, self.phase],
+            [phi, theta, torch.zeros_like(self.edge_phase), phase],
+        )
+        return self
+
+    def _element_values(self):
+        """the nonzero S-matrix elements of the MZIs and the waveguides
+
+        Returns:
+            mzis (Tensor): the (0, 1), (0, 2), (1, 3) and (2, 3) elements of
+                each MZI with shape (2, # wavelengths, # mzis, 4).
+            waveguides (Tensor): the (0, 1) element of each edge waveguide and
+                each output phase shifter with shape (2, # wavelengths, # edges + N).
+        """
+        wls = self.env.tensor("wl", dtype=torch.float64, device=self.device)
+
+        # neff depends on the wavelength:
+        neff = self.neff - (wls - self.wl0) * (self.ng - self.neff) / self.wl0
+        phi0 = ((2 * np.pi * neff * self.length / wls) % (2 * np.pi))[:, None]
+        loss = 10 ** (-self.loss * self.length / 20)  # 20 because loss works on power
+
+        # MZIs
+        phi1 = phi0 + self.phi  # (# wavelengths, # mzis)
+        phase = torch.stack(
+            [phi1, phi1, phi0.expand_as(phi1), phi0.expand_as(phi1)], -1
+        )
+        cos_theta, sin_theta = torch.cos(self.theta), torch.sin(self.theta)
+        amplitude = torch.stack([cos_theta, sin_theta, -sin_theta, cos_theta], -1)
+        amplitude = loss * amplitude
+        mzis = torch.stack([amplitude * torch.cos(phase), amplitude * torch.sin(phase)])
+
+        # waveguides
+        phase = phi0 + torch.cat([self.edge_phase, self.phase])
+        waveguides = torch.stack([loss * torch.cos(phase), loss * torch.sin(phase)])
+
+        dtype = torch.get_default_dtype()
+        return mzis.to(dtype), waveguides.to(dtype)
+
+    def set_C(self, C):
+        if self._connections:
+            i, j = torch.tensor(self._connections, device=C.device).t()
+            C[i, j] = C[j, i] = 1.0
+
+    def set_port_order(self, port_order):
+        port_order[:] = torch.tensor(
+            self._port_order, dtype=torch.int64, device=port_order.device
+        )
+
+    def terminate(self, term=None):
+        """ Terminate open conections with the term of your choice
+
+        Args:
+            term: (Term|list|dict): Which term to use. Defaults to Term. If a
+                dictionary or list is specified, then one needs to specify as
+                many terms as there are open connections.
+
+        Returns:
+            terminated network with sources on the left and detectors on the right.
+        """
+        if term is None:
+            term = [Source(name="s%i" % i) for i in range(self.N)]
+            term += [Detector(name="d%i" % i) for i in range(self.N)]
+        ret = _terminate(self, term)
+        ret.to(self.device)
+        return ret
+
+
+###################
+## Decomposition ##
+###################
+
+
+def clements_decomposition(U, capacity=None, phase0=0.0):
+    """decompose unitary matrices into the phases of a Clements mesh
+
+    The elements of U are nulled diagonal by diagonal, alternating between
+    MZIs acting on the columns (the input side) and MZIs acting on the rows
+    (the output side) of U. The MZIs on the output side are then moved
+    through the remaining diagonal matrix to the input side, after which the
+    diagonal gives the phases of the output phase shifters.
+
+    Args:
+        U (Tensor): the real and imaginary part of the unitary matrices with
+            shape (2, ..., N, N).
+        capacity (optional, int): the number of MZI columns of the mesh
+            (should be at least N). Default: N.
+        phase0 (float|Tensor): the propagation phase of the MZIs and the
+            waveguides of the mesh. Should be broadcastable to the batch shape
+            (...) of U, e.g. one propagation phase per wavelength.
+
+    Returns:
+        phi (Tensor): the input phases of the MZIs with shape (..., # mzis).
+        theta (Tensor): the phase differences between the arms of the MZIs
+            with shape (..., # mzis).
+        phase (Tensor): the phases of the output phase shifters with shape
+            (..., N).
+
+    Note:
+        The MZIs are ordered as in ``FlatClementsNxN(N, capacity)``. The
+        waveguides at the edges of the MZI columns should have zero phase.
+
+    Reference:
+        https://www.osapublishing.org/optica/abstract.cfm?uri=optica-3-12-1460
+
+    """
+    N = U.shape[-1]
+    capacity = N if capacity is None else int(capacity)
+    if capacity < N:
+        raise ValueError(
+            "a capacity of at least N is needed to implement an arbitrary unitary. "
+            "Got capacity %i for N=%i" % (capacity, N)
+        )
+    U, phase0 = _complex_batch(U, phase0)
+
+    # null the lower triangle of U:
+    inputs, outputs = [], []  # (lane, theta, phi) of each MZI
+    for i in range(N - 1):
+        if i % 2 == 0:
+            for j in range(i + 1):
+                r, l = N - 1 - j, i - j  # null U[r, l] from the input side
+                x, y = U[..., r, l], U[..., r, l + 1]
+                theta = torch.atan2(x.abs(), y.abs())
+                phi = torch.angle(x) - torch.angle(y)
+                _times_mzi_inverse(U, l, theta, phi)
+                inputs.append((l, theta, phi))
+        else:
+            for j in range(1, i + 2):
+                l, c = N + j - i - 3, j - 1  # null U[l + 1, c] from the output side
+                x, y = U[..., l, c], U[..., l + 1, c]
+                theta = torch.atan2(y.abs(), x.abs())
+                phi = torch.angle(y) - torch.angle(x) + np.pi
+                _mzi_times(U, l, theta, phi)
+                outputs.append((l, theta, phi))
+
+    # move the output side MZIs through the diagonal:
+    diagonal = torch.angle(torch.diagonal(U, dim1=-2, dim2=-1))
+    mzis = list(inputs)
+    for l, theta, phi in reversed(outputs):
+        alpha, beta = diagonal[..., l].clone(), diagonal[..., l + 1].clone()
+        mzis.append((l, theta, alpha - beta - np.pi))
+        diagonal[..., l] = beta - phi + np.pi
+
+    # place each MZI in the first free column of its lanes:
+    topology = _flat_clements_topology(N, capacity)
+    index = {
+        (c, l): m
+        for m, (c, l) in enumerate(zip(topology["mzi_columns"], topology["mzi_lanes"]))
+    }
+    phi = diagonal.new_zeros(diagonal.shape[:-1] + (len(index),))
+    theta = torch.zeros_like(phi)
+    column = [0] * N  # the first free column of each lane
+    for l, mzi_theta, mzi_phi in mzis:
+        c = max(column[l], column[l + 1])
+        c += (c - l) % 2  # the column should couple lanes (l, l+1)
+        column[l] = column[l + 1] = c + 1
+        theta[..., index[c, l]] = mzi_theta
+        phi[..., index[c, l]] = mzi_phi
+
+    # each column of the mesh adds the propagation phase to all lanes:
+    phase = diagonal - (capacity + 1) * phase0[..., None]
+    return phi % (2 * np.pi), theta, phase % (2 * np.pi)
+
+
+def _complex_batch(U, phase0):
+    """bring a batch of real/imag stacked matrices in complex form
+
+    Args:
+        U (Tensor): the real and imaginary part of the matrices with shape
+            (2, ..., N, N).
+        phase0 (float|Tensor): a phase broadcastable to the batch shape (...).
+
+    Returns:
+        U (Tensor): a complex copy of the matrices with shape (batch, N, N).
+        phase0 (Tensor): the phase expanded to the batch shape.
+    """
+    U = torch.as_tensor(U)
+    phase0 = torch.as_tensor(phase0, dtype=torch.float64, device=U.device)
+    batch = torch.broadcast_shapes(U.shape[1:-2], phase0.shape)
+    U = torch.complex(U[0].to(torch.float64), U[1].to(torch.float64))
+    return U.expand(batch + U.shape[-2:]).clone(), phase0.expand(batch)
+
+
+def _expi(phase):
+    """ the complex exponential exp(i*phase) of a real tensor """
+    return torch.complex(torch.cos(phase), torch.sin(phase))
+
+
+def _mzi_times(U, l, theta, phi):
+    """left-multiply (in-place) the lanes l and l+1 of U with ideal MZIs
+
+    The 2x2 transfer matrix of an ideal MZI (without propagation phase) is
+    [[exp(i*phi)*cos(theta), -sin(theta)], [exp(i*phi)*sin(theta), cos(theta)]].
+    """
+    e, cos, sin = _expi(phi)[..., None], torch.cos(theta), torch.sin(theta)
+    cos, sin = cos[..., None], sin[..., None]
+    x, y = U[..., l, :].clone(), U[..., l + 1, :].clone()
+    U[..., l, :] = e * cos * x - sin * y
+    U[..., l + 1, :] = e * sin * x + cos * y
+
+
+def _times_mzi_inverse(U, l, theta, phi):
+    """ right-multiply (in-place) the lanes l and l+1 of U with inverse MZIs """
+    e = _expi(-phi)[..., None]
+    cos, sin = torch.cos(theta)[..., None], torch.sin(theta)[..., None]
+    x, y = U[..., :, l].clone(), U[..., :, l + 1].clone()
+    U[..., :, l] = e * cos * x - sin * y
+    U[..., :, l + 1] = e * sin * x + cos * y
+
+
+def _propagation_phase(comp, wl):
+    """the propagation phase of an MZI or waveguide at the given wavelength(s)
+
+    Args:
+        comp (Component): a component with a ``neff``, ``ng``, ``wl0`` and ``length``.
+        wl (float|Tensor): the wavelength(s).
+
+    Returns:
+        Tensor: the propagation phase.
+    """
+    wl = torch.as_tensor(wl, dtype=torch.float64, device=comp.device)
+    neff = comp.neff - (wl - comp.wl0) * (comp.ng - comp.neff) / comp.wl0
+    return (2 * np.pi * neff * comp.length / wl) % (2 * np.pi)
+
+
+def _load_phases(params, values):
+    """copy (without gradient tracking) the values into the given parameters """
+    with torch.no_grad():
+        for param, value in zip(params, values):
+            if value.shape != param.shape:
+                raise ValueError(
+                    "cannot load phases with shape %s into a parameter with shape %s. "
+                    "Only a single unitary can be loaded into a mesh."
+                    % (tuple(value.shape), tuple(param.shape))
+                )
+            param.copy_(value)
+
+
+def _flat_clements_topology(N, capacity):
+    """the layout of a flat Clements mesh
+
+    The MZIs and edge waveguides are placed column by column, followed by a
+    column of output phase shifters. The nodes of MZI m are 4m..4m+3, the
+    nodes of the edge waveguides and the phase shifters follow after those
+    of the MZIs (two nodes per waveguide).
+
+    Args:
+        N (int): number of input / output ports
+        capacity (int): number of MZI columns
+
+    Returns:
+        dict: the number of ports, the lane and column of each MZI and edge
+            waveguide, the internal connections (node pairs) and the port order.
+    """
+    mzi_columns, mzi_lanes, edge_columns, edge_lanes = [], [], [], []
+    for c in range(capacity):
+        lanes = list(range(c % 2, N - 1, 2))
+        coupled = set(lanes) | set(l + 1 for l in lanes)
+        edges = [l for l in range(N) if l not in coupled]
+        mzi_columns += [c] * len(lanes)
+        mzi_lanes += lanes
+        edge_columns += [c] * len(edges)
+        edge_lanes += edges
+    num_mzis, num_edges = len(mzi_lanes), len(edge_lanes)
+
+    # chain the elements along each lane:
+    inputs, outputs, connections = {}, {}, []
+
+    def chain(lane, node_in, node_out):
+        if lane in outputs:
+            connections.append((outputs[lane], node_in))
+        else:
+            inputs[lane] = node_in
+        outputs[lane] = node_out
+
+    m = e = 0
+    for c in range(capacity):
+        while m < num_mzis and mzi_columns[m] == c:
+            chain(mzi_lanes[m], 4 * m, 4 * m + 1)
+            chain(mzi_lanes[m] + 1, 4 * m + 3, 4 * m + 2)
+            m += 1
+        while e < num_edges and edge_columns[e] == c:
+            node = 4 * num_mzis + 2 * e
+            chain(edge_lanes[e], node, node + 1)
+            e += 1
+    for l in range(N):
+        node = 4 * num_mzis + 2 * num_edges + 2 * l
+        chain(l, node, node + 1)
+
+    num_ports = 4 * num_mzis + 2 * num_edges + 2 * N
+    free = [inputs[l] for l in range(N)] + [outputs[l] for l in range(N)]
+    free_set = set(free)
+    port_order = free + [i for i in range(num_ports) if i not in free_set]
+
+    return {
+        "num_ports": num_ports,
+        "mzi_columns": mzi_columns,
+        "mzi_lanes": mzi_lanes,
+        "edge_columns": edge_columns,
+        "edge_lanes": edge_lanes,
+        "connections": connections,
+        "port_order": port_order,
+    }
+
+
+def _cmul(a, b):
+    """ multiply two complex tensors (real and imaginary part stacked in dim 0) """
+    return torch.stack([a[0] * b[0] - a[1] * b[1], a[0] * b[1] + a[1] * b[0]])
+
+
+def _batched_S(components, device):
+    """the S-matrices of components with the same number of ports
+
+    The S-matrices are set with ``batched_set_S`` for each class of components
+    with a vectorized ``batched_set_S``, otherwise with ``set_S``.
+
+    Args:
+        components (list): the components to get the S-matrices for.
+        device (torch.device): the device to create the S-matrices on.
+
+    Returns:
+        Tensor: the S-matrices with shape (2, # wavelengths, # components,
+            # ports, # ports).
+    """
+    env = current_environment()
+    num_ports = components[0].num_ports
+    S = torch.zeros(
+        (2, env.num_wl, len(components), num_ports, num_ports), device=device
+    )
+    groups = OrderedDict()  # class -> indices of the components
+    for i, comp in enumerate(components):
+        comp.initialize()
+        groups.setdefault(type(comp), []).append(i)
+    for cls, idxs in groups.items():
+        if _has_batched_set_S(cls):
+            blocks = torch.zeros_like(S[:, :, idxs])
+            cls.batched_set_S([components[i] for i in idxs], blocks)
+            S[:, :, idxs] = blocks
+        else:
+            for i in idxs:
+                components[i].set_S(S[:, :, i])
+    return S
+
+
+def _split_columns(
+    capacity, mzi_columns, mzi_lanes, blocks, edge_columns, edge_lanes, edges
+):
+    """split the MZIs and edge waveguides of a (flat) Clements mesh into columns
+
+    Args:
+        capacity (int): the number of MZI columns.
+        mzi_columns (Tensor): the column index of each MZI.
+        mzi_lanes (Tensor): the (upper) lane index of each MZI.
+        blocks (Tensor): the 2x2 transfer matrices of the MZIs with shape
+            (2, # wavelengths, # mzis, 2, 2).
+        edge_columns (Tensor): the column index of each edge waveguide.
+        edge_lanes (Tensor): the lane index of each edge waveguide.
+        edges (Tensor): the transmissions of the edge waveguides with shape
+            (2, # wavelengths, # edges).
+
+    Returns:
+        iterable: for each column a tuple (lanes, blocks, edge_lanes, edges),
+            as expected by ``_cascade_columns``.
+    """
+    mzi_counts = torch.bincount(mzi_columns, minlength=capacity).tolist()
+    edge_counts = torch.bincount(edge_columns, minlength=capacity).tolist()
+    return zip(
+        torch.split(mzi_lanes, mzi_counts),
+        torch.split(blocks, mzi_counts, 2),
+        torch.split(edge_lanes, edge_counts),
+        torch.split(edges, edge_counts, 2),
+    )
+
+
+def _cascade_columns(N, columns, phase):
+    """the transfer matrix of a sequence of MZI columns followed by phase shifters
+
+    Args:
+        N (int): the number of lanes.
+        columns (iterable): for each column a tuple (lanes, blocks, edge_lanes,
+            edges) containing the (upper) lanes of the MZIs, the 2x2 transfer
+            matrices of the MZIs (2, # wavelengths, # mzis, 2, 2), the lanes
+            of the edge waveguides and their transmissions (2, # wavelengths,
+            # edges). Lists of 2x2 matrices or transmissions are stacked.
+        phase (Tensor): the transmission of the output phase shifters with
+            shape (2, # wavelengths, N).
+
+    Returns:
+        Tensor: the transfer matrix with shape (2, # wavelengths, N, N).
+    """
+    T = torch.zeros(phase.shape + (N,), dtype=phase.dtype, device=phase.device)
+    T[0] = torch.eye(N, dtype=phase.dtype, device=phase.device)
+    for lanes, blocks, edge_lanes, edges in columns:
+        new = torch.zeros_like(T)
+        if len(lanes) > 0:
+            lanes = torch.as_tensor(lanes, device=T.device)
+            if isinstance(blocks, (list, tuple)):
+                blocks = torch.stack(blocks, 2)
+            blocks = blocks[..., None]  # broadcast over the input dimension
+            upper, lower = T[:, :, lanes], T[:, :, lanes + 1]
+            new[:, :, lanes] = _cmul(blocks[:, :, :, 0, 0], upper) + _cmul(
+                blocks[:, :, :, 0, 1], lower
+            )
+            new[:, :, lanes + 1] = _cmul(blocks[:, :, :, 1, 0], upper) + _cmul(
+                blocks[:, :, :, 1, 1], lower
+            )
+        if len(edge_lanes) > 0:
+            edge_lanes = torch.as_tensor(edge_lanes, device=T.device)
+            if isinstance(edges, (list, tuple)):
+                edges = torch.stack(edges, 2)
+            new[:, :, edge_lanes] = _cmul(edges[..., None], T[:, :, edge_lanes])
+        T = new
+    return _cmul(phase[..., None], T)
+
+
+def _select_ports(T, inputs=None, outputs=None):
+    """select the transfer matrix between free ports of a mesh
+
+    Args:
+        T (Tensor): the transfer matrix from the N input ports (0, ..., N-1) to
+            the N output ports (N, ..., 2N-1) of the mesh with shape
+            (2, # wavelengths, N, N).
+        inputs (optional, list): the indices of the free ports to use as
+            inputs. Default: the N input ports.
+        outputs (optional, list): the indices of the free ports to use as
+            outputs. Default: the N output ports.
+
+    Returns:
+        Tensor: the selected transfer matrix with shape (2, # wavelengths,
+            # outputs, # inputs).
+    """
+    N = T.shape[-1]
+    if inputs is None and outputs is None:
+        return T
+    inputs = list(range(N) if inputs is None else inputs)
+    outputs = list(range(N, 2 * N) if outputs is None else outputs)
+    full = torch.zeros(T.shape[:2] + (2 * N, 2 * N), dtype=T.dtype, device=T.device)
+    full[:, :, N:, :N] = T
+    full[:, :, :N, N:] = T.transpose(-1, -2)  # the mesh is reciprocal
+    return full[:, :, outputs][:, :, :, inputs]
@@ -35,6 +35,7 @@ import numpy as np
 
 ## Relative
 from .visualize import plot, graph
+from .planner import plan, _forward_memory, _chunk_sizes
 from ..nn.nn import Buffer
 from ..components.component import Component
 from ..components.terms import Term
@@ -69,6 +70,15 @@ class Network(Component):
     connections = None
     """ list containing all the connection of the network """
 
+    # deferred buffer construction
+    _defer_depth = 0
+    _buffers_outdated = False
+
+    # reuse the buffers of structurally identical networks (see TemplateCache).
+    # Subclasses that always build the same topology for the same arguments
+    # (ClementsNxN, ReckNxN, RingNetwork, ...) set this flag to True.
+    _cache_template = False
+
     # network properties
     @property
     def num_ports(self):
@@ -251,34 +261,72 @@ class Network(Component):
         # register connections/components:
         self._set_buffers()
 
+    # defer the construction of the network buffers
+    def deferred_buffers(self):
+        """defer the construction of the network buffers
+
+        Each ``link`` call rebuilds the buffers (connection matrix, port
+        order, source and detector locations, ...) of the whole network.
+        Inside this context, the links are only recorded. The buffers are
+        built once when the (outermost) context is exited, or earlier when the
+        network is used (initialized, terminated, planned or added to another
+        network).
+
+        Returns:
+            the context manager deferring the buffer construction.
+
+        Example:
+            >>> nw = pt.Network()
+            >>> with nw.deferred_buffers():
+            >>>     for i in range(100):
+            >>>         nw.add_component("wg%i" % i, pt.Waveguide())
+            >>>     for i in range(99):
+            >>>         nw.link("wg%i:1" % i, "0:wg%i" % (i + 1))
+
+        """
+        return _DeferredBuffers(self)
+
+    def _update_buffers(self):
+        """ build the network buffers if their construction was deferred """
+        if self._buffers_outdated:
+            depth, self._defer_depth = self._defer_depth, 0
+            try:
+                self._set_buffers()
+            finally:
+                self._defer_depth = depth
+
     # helper function to link components together
     def _get_used_component_names(self):
         """ get names of components that are actually used in the network's connections """
+        return self._compile_connections().names
 
-        def is_int(s):
-            try:
-                int(s)
-                return True
-            except ValueError:
-                return False
-
-        used_components = [conn.split(":") for conn in self.connections]
-        # here we would like to use an ordered set, but this does not exist.
-        # therefore, we use an OrderedDict, for which we don't care about
-        # the values. [all for python 2 compatibility...]
-        used_components = OrderedDict(
-            [
-                (comp, None)
-                for tup in used_components
-                for comp in tup
-                if not is_int(comp)
-            ]
-        )
-        return used_components.keys()
+    def _compile_connections(self):
+        """compile the connection strings of the network into integer tables
+
+        Returns:
+            _Netlist: the compiled connections.
+
+        Note:
+            The compiled connections are cached: as long as the connections
+            of the network do not change, they are not compiled again.
+            Moreover, each individual connection string is parsed only once.
+        """
+        netlist = getattr(self, "_netlist", None)
+        if netlist is not None and netlist.key == tuple(self.connections):
+            return netlist
+        parsed = None if netlist is None else netlist.parsed
+        self._netlist = _Netlist(self.connections, parsed=parsed)
+        return self._netlist
 
     def _set_buffers(self):
         """ create all buffers for the network """
 
+        # if the buffer construction is deferred, only mark them as outdated.
+        if self._defer_depth > 0:
+            self._buffers_outdated = True
+            return
+        self._buffers_outdated = False
+
         # if not connections defined, exit early.
         if not self.connections:
             return
@@ -292,18 +340,35 @@ class Network(Component):
         if not all_components:
             return
 
+        # look for a network with the same connections in the template cache
+        template = None
+        if self._cache_template:
+            template = template_cache.lookup(self)
+            if template is not None:
+                self._netlist = template.netlist
+
         # ensure connection string can be parsed
-        for i, conn in enumerate(self.connections):
-            self.connections[i] = ":".join(part.strip() for part in conn.split(":"))
+        netlist = self._compile_connections()
+        self.connections[:] = netlist.connections
 
         # add components to components dict
         self.components = OrderedDict()
-        for name in self._get_used_component_names():
+        for name in netlist.names:
             self.components[name] = all_components[name]
             self.components[name].name = name
+            if isinstance(self.components[name], Network):
+                self.components[name]._update_buffers()
+        structure = tuple(_structure(comp) for comp in self.components.values())
+        self._signature = (type(self), netlist.key, structure)
+
+        # reuse the buffers of a structurally identical network
+        if template is not None and template_cache.load(self, template):
+            return
 
         # set buffers
         super(Network, self)._set_buffers()
+        if self._cache_template:
+            template_cache.store(self)
 
     # terminate a network
     def terminate(self, term=None, name=None):
@@ -321,32 +386,8 @@ class Network(Component):
             the original (unterminated) network is always available with the
             ``.base`` attribute of the terminated network.
         """
-        if self.num_free_ports == 0:
-            raise IndexError("no free ports for termination")
-        if term is None:
-            term = Term()
-        if isinstance(term, Term):
-            term = [
-                term.__class__(name=term.__class__.__name__.lower() + "_%i" % i)
-                for i in range(self.num_free_ports)
-            ]
-        if isinstance(term, (list, tuple)):
-            term = OrderedDict((t.name, copy(t)) for t in term)
-        if self.is_cuda:
-            term = OrderedDict((name, t.cuda()) for name, t in term.items())
-        copied = copy(self)  # shallow copy so we can change name if necessary
-        if copied.name is None:
-            copied.name = copied.__class__.__name__.lower()
-        components = OrderedDict([(copied.name, copied)])
-        components.update(term)
-        connections = [
-            name + ":0:" + copied.name + ":%i" % i for i, name in enumerate(term)
-        ]
-        if name is None:
-            name = copied.name + "_terminated"
-        nw = Network(components, connections, name=name)
-        nw.base = self
-        return nw
+        self._update_buffers()
+        return _terminate(self, term, name)
 
     # undo a termination of a network:
     def unterminate(self):
@@ -402,6 +443,7 @@ class Network(Component):
             reduced matrices without needing the response of the network to an
             input signal.
         """
+        self._update_buffers()
         self.zero_grad()
 
         ## get current environment
@@ -464,6 +506,7 @@ class Network(Component):
 
         ## New port order
         mc = mc[new_order]
+        self._mc = mc
         self._delays = delays_in_seconds[mc]
         self._sources_at = self.sources_at[mc]
         self._detectors_at = self.detectors_at[mc]
@@ -558,11 +601,13 @@ class Network(Component):
         self._env = env
         return self
 
-    def _simulation_buffer(self, num_batches):
+    def _simulation_buffer(self, num_batches, num_wl=None):
         """Create cyclic buffer to keep the time-delayed states of the network.
 
         Args:
             num_batches (int): number of batches to create the buffer for
+            num_wl (optional, int): number of wavelengths to create the buffer for
+                (defaults to the number of wavelengths in the environment).
 
         Returns:
             torch.Tensor[2, #timesteps, #wavelengths, #mc nodes, num_batches]
@@ -575,7 +620,7 @@ class Network(Component):
             (
                 2,
                 max_delay + 1,
-                self.env.num_wl,
+                self.env.num_wl if num_wl is None else num_wl,
                 self.num_mc,
                 num_batches,
             ),
@@ -594,6 +639,21 @@ class Network(Component):
                 during the forward pass. With 'n' being the number of MC nodes in
                 the network.
 
+        Note:
+            see ``_broadcast_source`` for the accepted source shapes.
+        """
+        return self._pad_source(self._broadcast_source(source))
+
+    def _broadcast_source(self, source):
+        """validate a source tensor and broadcast it to the simulation shape.
+
+        Args:
+            source (Tensor): The source tensor to validate and handle.
+
+        Returns:
+            Tensor: The (possibly expanded) source tensor with shape (2, t, w, s, b).
+                With 's' being the number of sources in the network.
+
         Note:
              The source tensor should have shape (t, w, s, b), with
                * t: the number of timesteps in the simulation environment.
@@ -610,7 +670,7 @@ class Network(Component):
              with the ``.rename`` method of the PyTorch Tensor class.
              accepted dimension names are 'c', 't', 'w', 's', 'b'.
         """
-        _note = self._handle_source.__doc__.split("Note:")[-1]
+        _note = self._broadcast_source.__doc__.split("Note:")[-1]
         _possible_names = ("c", "t", "w", "s", "b")
 
         if isinstance(source, np.ndarray):
@@ -704,6 +764,18 @@ class Network(Component):
 
         source, _ = torch.broadcast_tensors(source, source_template)
 
+        return source
+
+    def _pad_source(self, source):
+        """add zero source values for all the MC nodes that are not a source.
+
+        Args:
+            source (Tensor): broadcasted source tensor with shape (2, t, w, s, b)
+
+        Returns:
+            Tensor: The source tensor with shape (2, t, w, n, b). With 'n'
+                being the number of MC nodes in the network.
+        """
         # we want zero source values for all other MC nodes.
         source = torch.cat(
             [
@@ -719,18 +791,55 @@ class Network(Component):
 
         return source
 
-    def forward(self, source=0.0, power=True, detector=None):
+    def forward(
+        self,
+        source=0.0,
+        power=True,
+        detector=None,
+        max_memory=None,
+        detectors=None,
+        decimation=1,
+        sample_at=None,
+        probes=None,
+        detector_chunk=None,
+    ):
         """calculate the network's response to an applied source.
 
         Args:
             source (Tensor): The source tensor to calculate the response for.
             power (bool): Return detected power, otherwise return complex signal.
             detector (callable): Custom detector function to use to detect the signal.
+            max_memory (optional, int): [bytes] memory budget for the simulation.
+                If given, the batch dimension (and if necessary the wavelength
+                dimension) is split into chunks that fit within this budget.
+                The chunks are simulated one after the other and the results
+                are concatenated.
+            detectors (optional, list): indices of the detectors to record. By
+                default, all detectors are recorded.
+            decimation (int): only record every ``decimation``-th timestep.
+            sample_at (optional, list): strictly increasing list of timestep
+                indices to record. Cannot be combined with decimation.
+            probes (optional, list): internal memory-containing nodes to record
+                at the same timesteps as the detectors. A probe is either the
+                index of a memory-containing node or a node name of the form
+                ``"component:port"`` (e.g. ``"wg:1"`` or ``"sub.wg:1"`` for a
+                component in a subnetwork), see ``node_index``.
+            detector_chunk (optional, int): apply the (streaming) detector
+                inside the simulation loop on chunks of ``detector_chunk``
+                timesteps. Only the detected current is stored, the raw fields
+                are never stored for the full simulation. The detector should
+                be a streaming detector (``LowpassDetector(streaming=True)``).
+                The detector is reset at the start of the simulation. Just like
+                without ``detector_chunk``, the detector receives the detected
+                power, or the complex fields in the case of power=False.
 
         Returns:
             Tensor: The detected tensor with shape (t, w, s, b) or with
                 shape (2, t, w, s, b) in the case of power=False (in that case, dimension
                 0 contains the stacked real and imaginary part of the result)
+                Only the recorded timesteps and detectors are returned.
+            Tensor: [only if probes are given] The probed tensor with shape
+                (t, w, p, b) or (2, t, w, p, b) in the case of power=False.
 
         Note:
              The source tensor should have shape (t, w, s, b), with
@@ -748,6 +857,13 @@ class Network(Component):
              with the ``.rename`` method of the PyTorch Tensor class.
              accepted dimension names are 'c', 't', 'w', 's', 'b'.
 
+        Note:
+            The memory budget only accounts for the tensors allocated during
+            the simulation of a single chunk (source, simulation buffer and
+            the recorded detected and probed fields). The ``detector`` is
+            applied to the concatenated result of all chunks, its memory is
+            not part of the budget.
+
         """
 
         # reinitialize the network if the current environment does not correspond
@@ -755,39 +871,329 @@ class Network(Component):
         if self.env is not current_environment() or torch.is_grad_enabled():
             self.initialize()
 
-        source = self._handle_source(source)
+        record = self._record_indices(decimation, sample_at)
+        if detectors is not None:
+            detectors = torch.as_tensor(detectors, dtype=torch.long, device=self.device)
+            detectors = detectors.reshape(-1)
+            if ((detectors < 0) | (detectors >= self.num_detectors)).any():
+                raise ValueError(
+                    "detectors should contain indices in the range [0, %i). Got %s."
+                    % (self.num_detectors, detectors.tolist())
+                )
+        if probes is not None:
+            probes = self._probe_indices(probes)
+        if detector_chunk is not None:
+            if not getattr(detector, "streaming", False):
+                raise ValueError(
+                    "detector_chunk requires a streaming detector, "
+                    "e.g. LowpassDetector(streaming=True)."
+                )
+            if max_memory is not None:
+                raise ValueError("detector_chunk cannot be combined with max_memory.")
+            if int(detector_chunk) < 1:
+                raise ValueError("detector_chunk should be a positive integer.")
+            detector.reset()
+
+        if max_memory is None:
+            source = self._handle_source(source)
+            detected = self._forward(
+                source,
+                power,
+                detectors,
+                record,
+                probes,
+                detector=detector if detector_chunk is not None else None,
+                detector_chunk=detector_chunk,
+            )
+        else:
+            detected = self._chunked_forward(
+                source, power, max_memory, detectors, record, probes
+            )
 
-        num_batches = source.shape[-1]
+        if probes is not None:
+            detected, probed = detected
+
+        if detector is not None and detector_chunk is None:
+            detected = detector(detected)
+
+        if probes is not None:
+            return detected, probed
+
+        return detected
+
+    def _record_indices(self, decimation=1, sample_at=None):
+        """get the timestep indices to record during a forward pass
+
+        Args:
+            decimation (int): only record every ``decimation``-th timestep.
+            sample_at (optional, list): strictly increasing list of timestep
+                indices to record.
+
+        Returns:
+            list: the timestep indices to record (None if all timesteps
+                should be recorded).
+        """
+        if sample_at is not None:
+            if decimation != 1:
+                raise ValueError("sample_at cannot be combined with decimation.")
+            if torch.is_tensor(sample_at) or isinstance(sample_at, np.ndarray):
+                sample_at = sample_at.tolist()
+            record = [int(i) for i in sample_at]
+            if any(i1 >= i2 for i1, i2 in zip(record[:-1], record[1:])):
+                raise ValueError("sample_at should be strictly increasing.")
+            if record and (record[0] < 0 or record[-1] >= self.env.num_t):
+                raise ValueError(
+                    "sample_at contains timestep indices outside the simulation."
+                )
+            return record
+        if int(decimation) != decimation or decimation < 1:
+            raise ValueError("decimation should be a positive integer.")
+        if decimation == 1:
+            return None
+        return list(range(0, self.env.num_t, int(decimation)))
+
+    def node_index(self, name):
+        """get the index of a node in the (unreduced) S-matrix of the network
+
+        Args:
+            name (str): the node name of the form ``"component:port"``, where
+                ``component`` is the attribute name of the component in the
+                network (use dots to specify components in subnetworks:
+                ``"subnetwork.component"``) and ``port`` the index of the
+                port in the S-matrix of that component.
+
+        Returns:
+            int: the index of the node in the S-matrix of the network.
+        """
+        path, port = name.rsplit(":", 1)
+        network, idx = self, 0
+        for comp_name in path.split("."):
+            if not isinstance(network, Network) or comp_name not in network.components:
+                raise ValueError("Unknown component '%s' in node '%s'" % (path, name))
+            for key, comp in network.components.items():
+                if key == comp_name:
+                    break
+                idx += comp.num_ports
+            network = comp
+        port = int(port)
+        if port < 0 or port >= comp.num_ports:
+            raise ValueError("Component %s only has %i ports." % (path, comp.num_ports))
+        return idx + port
+
+    def _probe_indices(self, probes):
+        """get the memory-containing node indices of probes
+
+        Args:
+            probes (list): memory-containing node indices or node names.
+
+        Returns:
+            Tensor: the indices of the probed memory-containing nodes.
+        """
+        mc = self._mc.tolist()
+        indices = []
+        for probe in probes:
+            if isinstance(probe, str):
+                node = self.node_index(probe)
+                if node not in mc:
+                    raise ValueError(
+                        "Node '%s' is not a memory-containing node and can "
+                        "therefore not be probed." % probe
+                    )
+                probe = mc.index(node)
+            elif int(probe) < 0 or int(probe) >= self.num_mc:
+                raise ValueError(
+                    "The network only has %i memory-containing nodes." % self.num_mc
+                )
+            indices.append(int(probe))
+        return torch.tensor(indices, dtype=torch.long, device=self.device)
+
+    def _forward(
+        self,
+        source,
+        power,
+        detectors=None,
+        record=None,
+        probes=None,
+        detector=None,
+        detector_chunk=None,
+    ):
+        """simulate the network for a handled source tensor
+
+        Args:
+            source (Tensor): The source tensor with shape (2, t, w, n, b).
+            power (bool): Return detected power, otherwise return complex signal.
+            detectors (optional, Tensor): indices of the detectors to record.
+            record (optional, list): the timestep indices to record.
+            probes (optional, Tensor): indices of the memory-containing nodes to
+                record.
+            detector (optional, callable): streaming detector to apply inside
+                the simulation loop.
+            detector_chunk (optional, int): number of timesteps to detect at once.
+
+        Returns:
+            Tensor: The detected tensor with shape (t, w, s, b) or with
+                shape (2, t, w, s, b) in the case of power=False.
+            Tensor: [only if probes are given] The probed tensor with shape
+                (t, w, p, b) or (2, t, w, p, b) in the case of power=False.
+        """
+        _, num_t, num_wl, _, num_batches = source.shape
+        if record is None:
+            record = range(num_t)
+        num_detectors = self.num_detectors if detectors is None else len(detectors)
 
         detected = torch.zeros(
-            (
-                self.env.num_t,
-                self.env.num_wl,
-                self.num_detectors,
-                num_batches,
-            ),
-            device=self.device,
+            (len(record), num_wl, num_detectors, num_batches), device=self.device,
         )
-        if not power:
+        if not power and detector is None:
             detected = torch.stack([detected, detected], 0)
+        if probes is not None:
+            probed = torch.zeros(
+                (len(record), num_wl, len(probes), num_batches), device=self.device
+            )
+            if not power:
+                probed = torch.stack([probed, probed], 0)
+        if len(record) == 0:
+            return detected if probes is None else (detected, probed)
 
         ## Get new simulation buffer
-        buffer = self._simulation_buffer(num_batches)
+        buffer = self._simulation_buffer(num_batches, num_wl)
 
         # solve
-        for i, t in enumerate(self.env.t):
+        k = 0  # index of the next recorded timestep
+        fields, kd = [], 0  # chunk of fields to detect, next detected timestep
+        for i, t in enumerate(self.env.t[: record[-1] + 1]):
             det, buffer = self.step(t, source[:, i], buffer)
+            if detectors is not None:
+                det = det[:, :, detectors]
+
+            if detector is not None:
+                fields.append(det)
+                if len(fields) == detector_chunk or i == record[-1]:
+                    start = i + 1 - len(fields)
+                    chunk = torch.stack(fields, 1)
+                    if not power:
+                        current = detector(chunk)
+                    elif chunk.shape[1] != 2:
+                        current = detector(torch.sum(chunk ** 2, 0))
+                    else:  # two timesteps of power would look like a complex signal
+                        chunk = torch.sum(chunk ** 2, 0)
+                        current = torch.cat([detector(chunk[:1]), detector(chunk[1:])])
+                    fields = []
+                    while kd < len(record) and record[kd] <= i:
+                        detected[kd] = current[record[kd] - start]
+                        kd += 1
+
+            if i != record[k]:
+                continue
 
-            if power:
-                detected[i] = torch.sum(det ** 2, 0)
-            else:
-                detected[:, i] = det
+            if detector is None and power:
+                detected[k] = torch.sum(det ** 2, 0)
+            elif detector is None:
+                detected[:, k] = det
 
-        if detector is not None:
-            detected = detector(detected)
+            if probes is not None:
+                state = buffer[:, 0][:, :, probes]
+                if power:
+                    probed[k] = torch.sum(state ** 2, 0)
+                else:
+                    probed[:, k] = state
+            k += 1
+
+        if probes is not None:
+            return detected, probed
 
         return detected
 
+    def _chunked_forward(
+        self, source, power, max_memory, detectors=None, record=None, probes=None
+    ):
+        """simulate the network in batch and wavelength chunks
+
+        Args:
+            source (Tensor): The source tensor to calculate the response for.
+            power (bool): Return detected power, otherwise return complex signal.
+            max_memory (int): [bytes] memory budget for a single chunk.
+            detectors (optional, Tensor): indices of the detectors to record.
+            record (optional, list): the timestep indices to record.
+            probes (optional, Tensor): indices of the memory-containing nodes to
+                record.
+
+        Returns:
+            Tensor: The detected tensor with shape (t, w, s, b) or with
+                shape (2, t, w, s, b) in the case of power=False.
+            Tensor: [only if probes are given] The probed tensor with shape
+                (t, w, p, b) or (2, t, w, p, b) in the case of power=False.
+        """
+        source = self._broadcast_source(source)
+        num_batches = source.shape[-1]
+        num_wl = self.env.num_wl
+        batch_chunk, wl_chunk = _chunk_sizes(
+            unit_memory=self._forward_memory(1, 1, power, detectors, record, probes),
+            num_batches=num_batches,
+            num_wl=num_wl,
+            max_memory=max_memory,
+            split_wl=(self.num_actions == 0),
+        )
+
+        rS, iS, rC, iC = self._rS, self._iS, self._rC, self._iC
+        detected = []
+        try:
+            for i in range(0, num_wl, wl_chunk):
+                wl = slice(i, i + wl_chunk)
+                self._rS, self._iS = rS[wl], iS[wl]
+                self._rC, self._iC = rC[wl], iC[wl]
+                chunks = []
+                for j in range(0, num_batches, batch_chunk):
+                    chunk = source[..., wl, :, j : j + batch_chunk]
+                    chunk = self._pad_source(chunk)
+                    chunk = self._forward(chunk, power, detectors, record, probes)
+                    chunks.append(chunk if probes is not None else (chunk,))
+                detected.append([torch.cat(c, -1) for c in zip(*chunks)])
+        finally:
+            self._rS, self._iS, self._rC, self._iC = rS, iS, rC, iC
+
+        detected = tuple(torch.cat(d, -3) for d in zip(*detected))
+        if probes is not None:
+            return detected
+
+        return detected[0]
+
+    def _forward_memory(
+        self,
+        num_batches,
+        num_wl=None,
+        power=True,
+        detectors=None,
+        record=None,
+        probes=None,
+    ):
+        """estimate the memory allocated by a forward pass of the initialized network
+
+        Args:
+            num_batches (int): number of batches in the source
+            num_wl (optional, int): number of wavelengths to simulate (defaults
+                to the number of wavelengths in the environment).
+            power (bool): whether the detected power or the complex signal is stored.
+            detectors (optional, Tensor): indices of the detectors to record.
+            record (optional, list): the timestep indices to record.
+            probes (optional, Tensor): indices of the memory-containing nodes to
+                record.
+
+        Returns:
+            int: [bytes] the estimated memory footprint.
+        """
+        return _forward_memory(
+            num_t=self.env.num_t,
+            num_wl=self.env.num_wl if num_wl is None else num_wl,
+            num_mc=self.num_mc,
+            num_detectors=self.num_detectors if detectors is None else len(detectors),
+            max_delay=self.buffermask.shape[1] - 1,
+            num_batches=num_batches,
+            power=power,
+            num_recorded=None if record is None else len(record),
+            num_probes=0 if probes is None else len(probes),
+        )
+
     def step(self, t, srcvalue, buffer):
         """Single step forward pass through the network
 
@@ -852,12 +1258,58 @@ class Network(Component):
             idx += comp.num_ports
 
     def set_S(self, S):
-        """ get the combined S-matrix of all the components in the network """
+        """get the combined S-matrix of all the components in the network
+
+        Note:
+            Components of a class with a vectorized ``batched_set_S`` are
+            grouped by class. The S-matrices of each group are set at once and
+            scattered into the combined S-matrix with a single index operation.
+            Other components set their own S-matrix with ``set_S``.
+
+        Note:
+            Components of a class with the ``_share_S`` flag set and with
+            equal (public) attributes, parameters and buffers have the same
+            S-matrix. If no gradients are needed for their parameters, the
+            S-matrix of such components is only set once and copied to the
+            other positions.
+        """
+        unique = {}  # key -> start index of the first component with this key
+        groups = OrderedDict()  # (class, # ports) -> [(component, start index)]
+        copies = []  # (start index, start index of the original, # ports)
         idx = 0
         for comp in self.components.values():
-            comp.set_S(S[:, :, idx : idx + comp.num_ports, idx : idx + comp.num_ports])
+            key = _S_key(comp)
+            if key is not None and key in unique:
+                copies.append((idx, unique[key], comp.num_ports))
+            else:
+                if key is not None:
+                    unique[key] = idx
+                if _has_batched_set_S(type(comp)):
+                    group = groups.setdefault((type(comp), comp.num_ports), [])
+                    group.append((comp, idx))
+                else:
+                    comp.set_S(
+                        S[:, :, idx : idx + comp.num_ports, idx : idx + comp.num_ports]
+                    )
             idx += comp.num_ports
 
+        for (cls, num_ports), group in groups.items():
+            comps, starts = zip(*group)
+            blocks = torch.zeros(
+                S.shape[:2] + (len(comps), num_ports, num_ports),
+                dtype=S.dtype,
+                device=S.device,
+            )
+            cls.batched_set_S(list(comps), blocks)
+            ports = torch.tensor(starts, device=S.device)[:, None] + torch.arange(
+                num_ports, device=S.device
+            )
+            S[:, :, ports[:, :, None], ports[:, None, :]] = blocks
+
+        for idx, src, n in copies:
+            block = S[:, :, src : src + n, src : src + n]
+            S[:, :, idx : idx + n, idx : idx + n] = block
+
     def set_delays(self, delays):
         """ set all the delays in the network """
         idx = 0
@@ -893,55 +1345,28 @@ class Network(Component):
             binary tensor with only 1's and 0's.
 
         Note:
-            To create the connection matrix, the connection strings are parsed.
+            To create the connection matrix, the compiled connections are
+            scattered into the matrix.
         """
         idx = 0
         for comp in self.components.values():
             comp.set_C(C[idx : idx + comp.num_ports, idx : idx + comp.num_ports])
             idx += comp.num_ports
 
-        start_idxs = list(
-            np.cumsum([0] + [comp.num_ports for comp in self.components.values()])[:-1]
-        )
-        start_idxs = OrderedDict(zip(self.components.keys(), start_idxs))
-        free_idxs = [
-            [
-                idx
-                for idx in comp.port_order
-                if idx in torch.where(comp.free_ports_at)[0]
-            ]
-            for comp in self.components.values()
-        ]
-        free_idxs = OrderedDict(zip(self.components.keys(), free_idxs))
-
-        def parse_connection(conn):
-            conn_list = conn.split(":")
-            if len(conn_list) < 4:
-                return None, None
-            comp1, i1, comp2, i2 = conn_list
-            i1, i2 = int(i1), int(i2)
-            if comp1 == comp2 and i1 == i2:
-                raise IndexError("Cannot connect two equal ports")
-            for i, comp in [(i1, comp1), (i2, comp2)]:
-                if i >= len(free_idxs[comp]):
-                    raise ValueError(
-                        "Component %s only has %i ports. Port index "
-                        "%i too high" % (comp, len(free_idxs[comp]), i)
-                    )
-            j1 = start_idxs[comp1] + free_idxs[comp1][i1]
-            j2 = start_idxs[comp2] + free_idxs[comp2][i2]
-            return int(j1), int(j2)
+        edges = self._compile_connections().edges.to(C.device)
+        if edges.shape[0] == 0:
+            return
 
-        for conn in self.connections:
-            i, j = parse_connection(conn)
-            if i is not None:
-                C[i, j] = C[j, i] = 1.0
+        comp1, i1, comp2, i2 = edges.t()
+        if ((comp1 == comp2) & (i1 == i2)).any():
+            raise IndexError("Cannot connect two equal ports")
+        j = self._free_port_indices(torch.cat([comp1, comp2]), torch.cat([i1, i2]))
+        j1, j2 = j[: edges.shape[0]], j[edges.shape[0] :]
+        C[j1, j2] = 1.0
+        C[j2, j1] = 1.0
 
     def set_port_order(self, port_order):
         """ set the reordering indices for the ports of the network """
-
-        # TODO: this method needs refactoring
-
         idx = 0
         for comp in self.components.values():
             p = comp.num_ports
@@ -949,48 +1374,138 @@ class Network(Component):
             port_order[idx : idx + p] += idx
             idx += p
 
-        start_idxs = list(
-            np.cumsum([0] + [comp.num_ports for comp in self.components.values()])[:-1]
-        )
-        start_idxs = OrderedDict(zip(self.components.keys(), start_idxs))
-        free_idxs = [
+        # the output connections map an output port index j to a port index i:
+        order_dict = {}
+        outputs = self._compile_connections().outputs.to(port_order.device)
+        if outputs.shape[0] > 0:
+            comp, i, j = outputs.t()
+            i = self._free_port_indices(comp, i)
+            order_dict = dict(zip(j.tolist(), i.tolist()))
+
+        order = [order_dict[j] for j in range(len(order_dict)) if j in order_dict]
+        device = port_order.device
+        remaining = torch.ones(self.num_ports, dtype=torch.bool, device=device)
+        remaining[list(order_dict.values())] = False
+        order = torch.cat(
             [
-                idx
-                for idx in comp.port_order
-                if idx in torch.where(comp.free_ports_at)[0]
+                torch.tensor(order, dtype=torch.int64, device=device),
+                torch.where(remaining)[0],
             ]
-            for comp in self.components.values()
-        ]
-        free_idxs = OrderedDict(zip(self.components.keys(), free_idxs))
+        )
+        port_order[: order.shape[0]] = port_order.clone()[order]
 
-        def parse_output_connection(conn):
-            conn_list = conn.split(":")
-            if len(conn_list) == 4:
-                return None, None
-            comp, i, j = conn_list
-            i, j = int(i), int(j)
-            i = int(start_idxs[comp] + free_idxs[comp][i])
-            return i, j
+    def _free_port_indices(self, comp_idxs, port_idxs):
+        """get the network indices of free ports of the components
 
-        order_dict = {}
-        for conn in self.connections:
-            i, j = parse_output_connection(conn)
-            if i is not None:
-                order_dict[j] = i
+        Args:
+            comp_idxs (Tensor[int64]): the indices of the components in the network.
+            port_idxs (Tensor[int64]): the indices of the ports within the
+                free ports (in port order) of each component.
 
-        order = []
-        for j in range(len(order_dict)):
-            i = order_dict.get(j, None)
-            if i is not None:
-                order.append(i)
+        Returns:
+            Tensor[int64]: the indices of the ports in the network.
+        """
+        device = comp_idxs.device
+        free_map, num_free = [], []
+        start = 0
+        for comp in self.components.values():
+            order = comp.port_order.to(device)
+            free = order[comp.free_ports_at.to(device)[order]]
+            free_map.append(free + start)
+            num_free.append(free.shape[0])
+            start += comp.num_ports
+        free_map = torch.cat(free_map)
+        num_free = torch.tensor(num_free, dtype=torch.int64, device=device)
+        free_start = torch.cumsum(num_free, 0) - num_free
+
+        invalid = (port_idxs < 0) | (port_idxs >= num_free[comp_idxs])
+        if invalid.any():
+            k = int(torch.where(invalid)[0][0])
+            c = int(comp_idxs[k])
+            raise ValueError(
+                "Component %s only has %i ports. Port index "
+                "%i too high"
+                % (list(self.components)[c], int(num_free[c]), int(port_idxs[k]))
+            )
 
-        for i in range(self.num_ports):
-            if i not in order_dict.values():
-                order.append(i)
+        return free_map[free_start[comp_idxs] + port_idxs]
 
-        port_order_clone = port_order.clone()
-        for i, idx in enumerate(order):
-            port_order[i] = port_order_clone[idx]
+    def transfer_matrix(self, inputs=None, outputs=None):
+        """the frequency domain transfer matrix between free ports of the network
+
+        Args:
+            inputs (optional, list): the indices of the free ports to use as
+                inputs. Default: all free ports.
+            outputs (optional, list): the indices of the free ports to use as
+                outputs. Default: all free ports.
+
+        Returns:
+            Tensor: the real and imaginary part of the transfer matrix with
+                shape (2, # wavelengths, # outputs, # inputs).
+
+        Note:
+            The transfer matrix is evaluated for the wavelengths of the current
+            environment, ignoring all delays. The network does not need to be
+            terminated or initialized: each subnetwork is reduced to the
+            transfer matrix between its own free ports first, after which only
+            the connections between the free ports of the subcomponents are
+            resolved.
+        """
+        self._update_buffers()
+        env = current_environment()
+
+        # scattering matrix of the subcomponents (reduced to their free ports):
+        blocks, units = [], []
+        start = 0
+        for comp in self.components.values():
+            if hasattr(comp, "transfer_matrix"):
+                ports = range(comp.num_free_ports)
+                blocks.append(comp.transfer_matrix(inputs=ports, outputs=ports))
+                order = comp.port_order
+                units.append(order[comp.free_ports_at[order]] + start)
+            else:
+                comp.initialize()
+                S = torch.zeros(
+                    (2, env.num_wl, comp.num_ports, comp.num_ports), device=self.device
+                )
+                comp.set_S(S)
+                blocks.append(S)
+                units.append(torch.arange(comp.num_ports, device=self.device) + start)
+            start += comp.num_ports
+        units = torch.cat(units)
+        n = units.shape[0]
+        S = torch.zeros((2, env.num_wl, n, n), device=self.device)
+        idx = 0
+        for block in blocks:
+            k = block.shape[-1]
+            S[:, :, idx : idx + k, idx : idx + k] = block
+            idx += k
+        C = self.C[units][:, units]
+
+        # free ports of the network (in port order) as indices in the units:
+        position = torch.zeros(self.num_ports, dtype=torch.int64, device=self.device)
+        position[units] = torch.arange(n, device=self.device)
+        free = position[self.port_order[self.free_ports_at[self.port_order]]]
+        inputs = free if inputs is None else free[torch.as_tensor(list(inputs))]
+        outputs = free if outputs is None else free[torch.as_tensor(list(outputs))]
+
+        if not C.any():
+            return S[:, :, outputs][:, :, :, inputs]
+
+        # incoming waves: x = C@S@x + e  =>  (I - C@S) x = e  (for each input e)
+        # [ +rP   -iP ] [ rx ] _ [ e ]
+        # [ +iP   +rP ] [ ix ] - [ 0 ]
+        rP = torch.eye(n, dtype=S.dtype, device=self.device)[None] - C @ S[0]
+        iP = -C @ S[1]
+        P = torch.cat([torch.cat([rP, -iP], 2), torch.cat([iP, rP], 2)], 1)
+        e = torch.zeros((2 * n, inputs.shape[0]), dtype=S.dtype, device=self.device)
+        e[inputs, torch.arange(inputs.shape[0], device=self.device)] = 1.0
+        x = torch.linalg.solve(P, e[None].expand(env.num_wl, 2 * n, inputs.shape[0]))
+        rx, ix = torch.split(x, n, 1)
+
+        # outgoing waves at the output ports: y = S@x
+        rS, iS = S[0][:, outputs], S[1][:, outputs]
+        return torch.stack([rS @ rx - iS @ ix, rS @ ix + iS @ rx], 0)
 
     def plot(self, detected, **kwargs):
         """Plot detected power versus time or wavelength
@@ -1025,6 +1540,22 @@ class Network(Component):
         """
         return graph(self, draw=True)
 
+    def plan(self, num_batches=1, power=True, max_memory=None):
+        """Predict the cost of initializing and simulating the network
+
+        Args:
+            num_batches (int): the number of batches in the source.
+            power (bool): whether the detected power or the complex signal is stored.
+            max_memory (optional, int): [bytes] memory budget for the forward pass.
+
+        Returns:
+            SimulationPlan: the predicted sizes, peak memory, FLOPs and
+                recommended execution strategy of the simulation.
+
+        """
+        self._update_buffers()
+        return plan(self, num_batches=num_batches, power=power, max_memory=max_memory)
+
     def __setattr__(self, name, attr):
         """ set attributes of the network """
         if isinstance(attr, Component):
@@ -1047,6 +1578,357 @@ class Network(Component):
         return self
 
 
+######################
+## Deferred Buffers ##
+######################
+
+
+class _DeferredBuffers(object):
+    """ Context manager deferring the buffer construction of a network """
+
+    def __init__(self, network):
+        """
+        Args:
+            network (Network): the network to defer the buffer construction for.
+        """
+        self.network = network
+
+    def __enter__(self):
+        self.network._defer_depth += 1
+        return self.network
+
+    def __exit__(self, error, value, traceback):
+        self.network._defer_depth -= 1
+        if error is None and self.network._defer_depth == 0:
+            self.network._update_buffers()
+
+
+###############
+## Templates ##
+###############
+
+
+class _Template(object):
+    """ The buffers of a network, to be reused by structurally identical networks """
+
+    # the buffers and values created by Component._set_buffers
+    buffer_names = (
+        "C",
+        "sources_at",
+        "detectors_at",
+        "actions_at",
+        "port_order",
+        "free_ports_at",
+    )
+    value_names = (
+        "terminated",
+        "num_sources",
+        "num_detectors",
+        "num_actions",
+        "num_free_ports",
+    )
+
+    def __init__(self, network):
+        """
+        Args:
+            network (Network): the network to create the template from.
+        """
+        self.netlist = network._netlist
+        self.structure = network._signature[2]
+        self.buffers = {
+            k: getattr(network, k).detach().clone() for k in self.buffer_names
+        }
+        self.values = {k: getattr(network, k) for k in self.value_names}
+
+
+class TemplateCache(object):
+    """ Least-recently-used cache of network templates
+
+    Networks like ``ClementsNxN``, ``ReckNxN`` and ``RingNetwork`` rebuild the
+    same topology (compiled connections, connection matrix, port order, ...)
+    each time they are created. The template cache stores these buffers for
+    each (network class, connections) combination, such that new instances
+    of a structurally identical network only need to copy them.
+
+    Note:
+        Only networks with the ``_cache_template`` flag set use the template
+        cache. A template is only reused if the structure of the components
+        (their types and their number of ports, sources, detectors, ...)
+        matches as well.
+
+    """
+
+    def __init__(self, maxsize=128):
+        """
+        Args:
+            maxsize (int): the maximum number of templates kept in the cache.
+        """
+        self.maxsize = int(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._templates = OrderedDict()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def lookup(self, network):
+        """ find the template for the connections of a network
+
+        Args:
+            network (Network): the network to find the template for.
+
+        Returns:
+            _Template: the template (or None if no template was found).
+        """
+        connections = (_normalize_connection(conn) for conn in network.connections)
+        key = (type(network), tuple(connections))
+        template = self._templates.pop(key, None)
+        if template is not None:
+            self._templates[key] = template  # reinsert as most recently used
+        return template
+
+    def load(self, network, template):
+        """ copy the buffers of a template into a network
+
+        Args:
+            network (Network): the network to copy the template buffers into.
+            template (_Template): the template to copy the buffers from.
+
+        Returns:
+            bool: whether the template was compatible with the network.
+        """
+        if template.structure != network._signature[2]:
+            self.misses += 1
+            return False
+        self.hits += 1
+        for name, buffer in template.buffers.items():
+            setattr(network, name, Buffer(buffer.to(network.device, copy=True)))
+        for name, value in template.values.items():
+            setattr(network, name, value)
+        return True
+
+    def store(self, network):
+        """ store the buffers of a network as a template
+
+        Args:
+            network (Network): the network to store as a template.
+        """
+        key = (type(network), network._netlist.key)
+        self._templates.pop(key, None)
+        self._templates[key] = _Template(network)
+        while len(self._templates) > self.maxsize:
+            self._templates.popitem(last=False)
+
+    def clear(self):
+        """ remove all templates from the cache and reset the hit/miss counters """
+        self._templates.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+template_cache = TemplateCache()
+""" the template cache used by the networks """
+
+
+def _structure(comp):
+    """ structural signature of a component: everything its buffers depend on """
+    if isinstance(comp, Network):
+        return getattr(comp, "_signature", None)
+    return (
+        type(comp),
+        comp.num_ports,
+        comp.num_sources,
+        comp.num_detectors,
+        comp.num_actions,
+        comp.num_free_ports,
+    )
+
+
+def _shares_S(cls):
+    """ check if a class opted in to S-matrix sharing for the set_S it uses """
+    for base in cls.__mro__:
+        if "_share_S" in base.__dict__:
+            return bool(base._share_S) and cls.set_S is base.set_S
+    return False
+
+
+def _has_batched_set_S(cls):
+    """ check if a class has a vectorized batched_set_S matching its set_S """
+    for base in cls.__mro__:
+        if "batched_set_S" in base.__dict__:
+            return base is not Component and cls.set_S is base.set_S
+    return False
+
+
+_SIMPLE_TYPES = (bool, int, float, str, type(None), torch.device)
+
+
+def _S_key(comp):
+    """a hashable key identifying the S-matrix of a component
+
+    Args:
+        comp (Component): the (leaf) component.
+
+    Returns:
+        tuple: the type, the public attributes and the values of the
+            parameters and buffers of the component. None if the S-matrix
+            of the component can not be shared with other components.
+
+    Note:
+        Only components of a class with the ``_share_S`` flag set (and which
+        does not override the ``set_S`` of the class that set the flag) can
+        share their S-matrix.
+    """
+    if not _shares_S(type(comp)):
+        return None
+    tensors = list(comp.named_parameters()) + list(comp.named_buffers())
+    if torch.is_grad_enabled() and any(t.requires_grad for _, t in tensors):
+        return None
+
+    attributes = []
+    for name, value in sorted(comp.__dict__.items()):
+        if name.startswith("_") or name == "name":
+            continue
+        if not isinstance(value, _SIMPLE_TYPES):
+            return None
+        attributes.append((name, value))
+
+    # the values of the tensors are only gathered again after they changed:
+    state = tuple((t.data_ptr(), t._version) for _, t in tensors)
+    cached = comp.__dict__.get("_S_values")
+    if cached is None or cached[0] != state:
+        values = tuple(
+            (name, t.dtype, tuple(t.shape), tuple(t.detach().flatten().tolist()))
+            for name, t in tensors
+        )
+        cached = comp._S_values = (state, values)
+    return (type(comp), comp.num_ports, tuple(attributes), cached[1])
+
+
+#############
+## Netlist ##
+#############
+
+
+class _Netlist(object):
+    """ The connections of a network compiled into integer tables
+
+    Attributes:
+        key (tuple): the (normalized) connection strings the netlist was
+            compiled from.
+        connections (list): the normalized connection strings.
+        names (list): the names of the components used in the connections.
+        edges (Tensor[int64]): table with shape (# connections, 4) containing
+            the (component index, port index) pairs of both ports of each
+            connection between two components.
+        outputs (Tensor[int64]): table with shape (# output connections, 3)
+            containing the component index, the port index and the output port
+            index of each connection to an output port of the network.
+        parsed (dict): the parsed version of each connection string.
+
+    """
+
+    def __init__(self, connections, parsed=None):
+        """
+        Args:
+            connections (list): the connection strings to compile.
+            parsed (optional, dict): connection strings that were already
+                parsed.
+        """
+        self.parsed = {} if parsed is None else parsed
+        self.connections = []
+        names = OrderedDict()
+        edges, outputs = [], []
+        for conn in connections:
+            if conn not in self.parsed:
+                self.parsed[conn] = _parse_connection(conn)
+            normalized, parts = self.parsed[conn]
+            self.connections.append(normalized)
+            if len(parts) == 4:
+                comp1, i1, comp2, i2 = parts
+                c1 = names.setdefault(comp1, len(names))
+                c2 = names.setdefault(comp2, len(names))
+                edges.append((c1, i1, c2, i2))
+            else:
+                comp, i, j = parts
+                outputs.append((names.setdefault(comp, len(names)), i, j))
+        self.key = tuple(self.connections)
+        self.names = list(names)
+        self.edges = torch.tensor(edges, dtype=torch.int64).reshape(-1, 4)
+        self.outputs = torch.tensor(outputs, dtype=torch.int64).reshape(-1, 3)
+
+
+def _parse_connection(conn):
+    """parse a connection string
+
+    Args:
+        conn (str): the connection string: "comp1:port1:comp2:port2" or
+            "comp:port:output_port".
+
+    Returns:
+        normalized (str): the connection string without whitespace.
+        parts (tuple): the parts of the connection with integer port indices.
+    """
+    normalized = _normalize_connection(conn)
+    parts = normalized.split(":")
+    if len(parts) == 4:
+        parts[1], parts[3] = int(parts[1]), int(parts[3])
+    elif len(parts) == 3:
+        parts[1], parts[2] = int(parts[1]), int(parts[2])
+    else:
+        raise ValueError("Invalid connection string '%s'" % normalized)
+    return normalized, tuple(parts)
+
+
+def _normalize_connection(conn):
+    """ remove the whitespace around the parts of a connection string """
+    return ":".join(part.strip() for part in conn.split(":"))
+
+
+#################
+## Termination ##
+#################
+
+
+def _terminate(comp, term=None, name=None):
+    """terminate the free ports of a network or component (see Network.terminate)
+
+    Args:
+        comp (Component): the network or component to terminate.
+        term: (Term|list|dict): Which term to use. Defaults to Term.
+        name (optional, str): the name of the terminated network.
+
+    Returns:
+        Network: the terminated network with ``comp`` as its ``.base``.
+    """
+    if comp.num_free_ports == 0:
+        raise IndexError("no free ports for termination")
+    if term is None:
+        term = Term()
+    if isinstance(term, Term):
+        term = [
+            term.__class__(name=term.__class__.__name__.lower() + "_%i" % i)
+            for i in range(comp.num_free_ports)
+        ]
+    if isinstance(term, (list, tuple)):
+        term = OrderedDict((t.name, copy(t)) for t in term)
+    if comp.is_cuda:
+        term = OrderedDict((name, t.cuda()) for name, t in term.items())
+    copied = copy(comp)  # shallow copy so we can change name if necessary
+    if copied.name is None:
+        copied.name = copied.__class__.__name__.lower()
+    components = OrderedDict([(copied.name, copied)])
+    components.update(term)
+    connections = [
+        name + ":0:" + copied.name + ":%i" % i for i, name in enumerate(term)
+    ]
+    if name is None:
+        name = copied.name + "_terminated"
+    nw = Network(components, connections, name=name)
+    nw.base = comp
+    return nw
+
+
 #####################
 ## Current Network ##
 #####################
@@ -0,0 +1,289 @@
+""" Simulation Planner
+
+Estimate the cost of initializing and simulating a network before actually
+running the simulation.
+
+"""
+
+#############
+## Imports ##
+#############
+
+# Standard Library
+from collections import OrderedDict
+
+# Torch
+import torch
+
+# Relative
+from ..components.component import Component
+from ..environment import current_environment
+
+
+##########
+## Plan ##
+##########
+
+
+class SimulationPlan(object):
+    """ The predicted cost of a network simulation
+
+    A simulation plan contains the sizes of the matrices and buffers used
+    during the simulation together with the predicted peak memory and the
+    predicted number of floating point operations for each phase of the
+    simulation (``"initialize"`` and ``"forward"``). The strategy of the
+    plan recommends how to split the forward pass into batch and wavelength
+    chunks to stay within a memory budget.
+
+    Note:
+        A simulation plan is usually created with ``Network.plan``.
+
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Args:
+            **kwargs: the attributes of the simulation plan.
+        """
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        s = "SimulationPlan(\n"
+        for k, v in self.__dict__.items():
+            s = s + "    %s=%s,\n" % (k, repr(v))
+        return s + ")"
+
+
+def plan(network, num_batches=1, power=True, max_memory=None):
+    """ Predict the cost of initializing and simulating a network
+
+    Args:
+        network (Network): the (terminated) network to make the plan for.
+        num_batches (int): the number of batches in the source.
+        power (bool): whether the detected power or the complex signal is stored.
+        max_memory (optional, int): [bytes] memory budget for the forward pass.
+
+    Returns:
+        SimulationPlan: the predicted cost of the simulation.
+
+    Note:
+        The prediction does not initialize the network: only the delays of
+        the components are evaluated in the current environment, after which
+        the state of the components is restored. The number
+        of memory-containing nodes (and hence all derived quantities) is
+        therefore known exactly, but the predicted memory and FLOPs are
+        estimates.
+
+    """
+    env = current_environment()
+    itemsize = torch.empty(0, dtype=torch.get_default_dtype()).element_size()
+
+    # temporarily initialize the leaf components to evaluate the delays:
+    leaves = list(_leaves(network))
+    states = [_state(comp) for comp in leaves]
+    try:
+        for comp in leaves:
+            comp.initialize()
+        delays = torch.zeros(network.num_ports, device=network.device)
+        network.set_delays(delays)
+    finally:
+        for comp, state in zip(leaves, states):
+            _restore(comp, state)
+
+    # locations of memory-containing and memory-less nodes:
+    delays = delays * float(not env.freqdomain)
+    if env.dt is not None:
+        delays_in_timesteps = (delays / env.dt + 0.5).long()
+    else:
+        delays_in_timesteps = torch.zeros_like(delays).long()
+    mc = (
+        network.sources_at
+        | network.detectors_at
+        | network.actions_at
+        | (delays_in_timesteps > 0)
+    )
+    num_ports = network.num_ports
+    num_mc = int(mc.sum())
+    num_ml = num_ports - num_mc
+    max_delay = int(delays_in_timesteps.max()) if num_ports > 0 else 0
+    num_t, num_wl = env.num_t, env.num_wl
+    num_detectors = network.num_detectors
+
+    # memory [bytes] for each phase:
+    memory = OrderedDict()
+    memory["initialize"] = itemsize * (
+        2 * num_wl * num_ports ** 2  # S-matrix
+        + num_ports ** 2  # C-matrix
+        + num_wl * (2 * num_ml) ** 2  # helper matrix P
+        + 2 * num_wl * 2 * num_ml * num_mc  # right hand side and solution
+        + 4 * num_wl * num_mc ** 2  # reduced matrices
+    )
+    memory["forward"] = _forward_memory(
+        num_t, num_wl, num_mc, num_detectors, max_delay, num_batches, power
+    )
+
+    # floating point operations for each phase:
+    flops = OrderedDict()
+    flops["initialize"] = num_wl * (
+        2 * 2 * num_ml ** 3  # P = I - Cmlml@Smlml
+        + (2.0 / 3.0) * (2 * num_ml) ** 3  # LU decomposition of P
+        + 2 * (2 * num_ml) ** 2 * num_mc  # solve for Cmlmc
+        + 4 * 2 * num_ml ** 2 * num_mc  # Smlml@inv(P)@Cmlmc
+        + 2 * 2 * num_mc * num_ml * num_mc  # Cmcml@Smlml@inv(P)@Cmlmc
+    )
+    flops["forward"] = (
+        num_t
+        * num_wl
+        * num_batches
+        * (
+            2 * (max_delay + 1) * num_mc  # masked sum over the buffer
+            + 2 * 4 * 2 * num_mc ** 2  # two complex matrix multiplications
+        )
+    )
+
+    # execution strategy: split the forward pass if it exceeds the budget
+    strategy = OrderedDict()
+    batch_chunk, wl_chunk = num_batches, num_wl
+    if max_memory is not None and memory["forward"] > max_memory:
+        try:
+            batch_chunk, wl_chunk = _chunk_sizes(
+                unit_memory=_forward_memory(
+                    num_t, 1, num_mc, num_detectors, max_delay, 1, power
+                ),
+                num_batches=num_batches,
+                num_wl=num_wl,
+                max_memory=max_memory,
+                split_wl=(network.num_actions == 0),
+            )
+        except ValueError:
+            batch_chunk, wl_chunk = None, None
+    strategy["fits"] = batch_chunk is not None
+    strategy["batch_chunk"] = batch_chunk
+    strategy["wl_chunk"] = wl_chunk
+    strategy["num_chunks"] = None
+    if batch_chunk is not None:
+        num_chunks = -(-num_batches // batch_chunk) * -(-num_wl // wl_chunk)
+        strategy["num_chunks"] = num_chunks
+
+    return SimulationPlan(
+        num_batches=num_batches,
+        num_ports=num_ports,
+        num_mc=num_mc,
+        num_ml=num_ml,
+        max_delay=max_delay,
+        buffer_shape=(2, max_delay + 1, num_wl, num_mc, num_batches),
+        solve_size=(num_wl, 2 * num_ml, num_mc),
+        memory=memory,
+        peak_memory=max(memory.values()),
+        flops=flops,
+        strategy=strategy,
+    )
+
+
+#############
+## Helpers ##
+#############
+
+
+def _leaves(network):
+    """ get all the leaf components (components without subcomponents) of a network """
+    for module in network.modules():
+        if not isinstance(module, Component):
+            continue
+        if any(isinstance(child, Component) for child in module.children()):
+            continue
+        yield module
+
+
+def _state(comp):
+    """ a (shallow) copy of the attributes of a component """
+    state = dict(comp.__dict__)
+    for name in ("_parameters", "_buffers", "_modules"):
+        state[name] = OrderedDict(state[name])
+    return state
+
+
+def _restore(comp, state):
+    """ restore the attributes of a component from a copy made with _state """
+    comp.__dict__.clear()
+    comp.__dict__.update(state)
+
+
+def _forward_memory(
+    num_t,
+    num_wl,
+    num_mc,
+    num_detectors,
+    max_delay,
+    num_batches,
+    power=True,
+    num_recorded=None,
+    num_probes=0,
+):
+    """estimate the memory allocated by a forward pass
+
+    Args:
+        num_t (int): number of timesteps in the simulation
+        num_wl (int): number of wavelengths in the simulation
+        num_mc (int): number of memory-containing nodes in the network
+        num_detectors (int): number of (recorded) detectors in the network
+        max_delay (int): [timesteps] the maximum delay in the network
+        num_batches (int): number of batches in the source
+        power (bool): whether the detected power or the complex signal is stored.
+        num_recorded (optional, int): number of recorded timesteps (defaults
+            to all timesteps of the simulation).
+        num_probes (int): number of probed memory-containing nodes.
+
+    Returns:
+        int: [bytes] the estimated memory footprint.
+
+    Note:
+        The footprint consists of the source tensor, the detected (and
+        probed) tensor at the recorded timesteps and three copies of the
+        simulation buffer: the buffer itself, its masked version and the
+        newly concatenated buffer created at each step.
+    """
+    itemsize = torch.empty(0, dtype=torch.get_default_dtype()).element_size()
+    num_recorded = num_t if num_recorded is None else num_recorded
+    source = 2 * num_t * num_wl * num_mc * num_batches
+    buffer = 2 * (max_delay + 1) * num_wl * num_mc * num_batches
+    detected = (1 if power else 2) * num_recorded * num_wl * num_batches
+    detected = detected * (num_detectors + num_probes)
+    return itemsize * (source + 3 * buffer + detected)
+
+
+def _chunk_sizes(unit_memory, num_batches, num_wl, max_memory, split_wl=True):
+    """find the biggest batch and wavelength chunks that fit in the memory budget
+
+    Args:
+        unit_memory (int): [bytes] memory needed to simulate a single batch
+            at a single wavelength.
+        num_batches (int): the total number of batches to simulate
+        num_wl (int): the total number of wavelengths to simulate
+        max_memory (int): [bytes] the memory budget for a single chunk.
+        split_wl (bool): allow splitting the wavelength dimension.
+
+    Returns:
+        batch_chunk (int): the number of batches in a chunk.
+        wl_chunk (int): the number of wavelengths in a chunk.
+    """
+    num_units = int(max_memory // unit_memory)
+    if num_units >= num_wl:
+        batch_chunk = min(num_batches, num_units // num_wl)
+        wl_chunk = num_wl
+    elif num_units >= 1 and split_wl:
+        batch_chunk = 1
+        wl_chunk = num_units
+    else:
+        raise ValueError(
+            "max_memory too small: a single chunk needs at least %i bytes."
+            % (unit_memory * (1 if split_wl else num_wl))
+        )
+
+    # balance the chunks (prevent a tiny last chunk):
+    num_chunks = -(-num_batches // batch_chunk)
+    batch_chunk = -(-num_batches // num_chunks)
+    num_chunks = -(-num_wl // wl_chunk)
+    wl_chunk = -(-num_wl // num_chunks)
+
+    return batch_chunk, wl_chunk
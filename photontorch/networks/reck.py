@@ -12,12 +12,17 @@ Reference:
 ## Imports ##
 #############
 
+# torch
+import torch
+
 # other
 import numpy as np
 
 # relative
 from .network import Network
 from .clements import _wg_factory, _mzi_factory
+from .clements import _complex_batch, _expi, _times_mzi_inverse
+from .clements import _propagation_phase, _load_phases
 
 from ..components.mzis import Mzi
 from ..components.terms import Source, Detector, Term
@@ -31,6 +36,8 @@ from ..components.terms import Source, Detector, Term
 class _ReckNxN(Network):
     """ A helper network for ReckNxN """
 
+    _cache_template = True
+
     def __init__(
         self, N=2, wg_factory=_wg_factory, mzi_factory=_mzi_factory, name=None,
     ):
@@ -106,6 +113,8 @@ class ReckNxN(Network):
 
     """
 
+    _cache_template = True
+
     def __init__(
         self, N=2, wg_factory=_wg_factory, mzi_factory=_mzi_factory, name=None,
     ):
@@ -157,3 +166,125 @@ class ReckNxN(Network):
         ret = super(ReckNxN, self).terminate(term)
         ret.to(self.device)
         return ret
+
+    def transfer_matrix(self, inputs=None, outputs=None):
+        """the frequency domain transfer matrix of the mesh
+
+        Args:
+            inputs (optional, list): the indices of the free ports to use as
+                inputs. Default: the N input ports.
+            outputs (optional, list): the indices of the free ports to use as
+                outputs. Default: the N output ports.
+
+        Returns:
+            Tensor: the real and imaginary part of the transfer matrix with
+                shape (2, # wavelengths, # outputs, # inputs).
+        """
+        inputs = range(self.N) if inputs is None else inputs
+        outputs = range(self.N, 2 * self.N) if outputs is None else outputs
+        return super(ReckNxN, self).transfer_matrix(inputs=inputs, outputs=outputs)
+
+    def load_unitary(self, U, wl=None):
+        """program the mesh to implement a unitary matrix
+
+        The phases of the MZIs and the waveguides are found analytically with
+        ``reck_decomposition``.
+
+        Args:
+            U (Tensor): the real and imaginary part of the unitary matrix with
+                shape (2, N, N).
+            wl (optional, float): the wavelength at which the mesh should
+                implement U. Default: the center wavelength of the MZIs.
+
+        Returns:
+            ReckNxN: the mesh itself.
+
+        Note:
+            All MZIs and waveguides of the mesh are assumed to have the same
+            propagation phase, as is the case for the default factories.
+        """
+        layers = [self.components["layer%i" % m] for m in range(self.N - 1)]
+        reference = layers[0].components["mzi0"]
+        wl = reference.wl0 if wl is None else wl
+        phi, theta, phase = reck_decomposition(U, _propagation_phase(reference, wl))
+
+        params, values = [], []
+        k = 0
+        for m, layer in enumerate(layers):
+            for i in range(self.N - m - 1):
+                mzi = layer.components["mzi%i" % i]
+                params += [mzi.phi, mzi.theta]
+                values += [phi[..., k], theta[..., k]]
+                k += 1
+            params.append(layer.components["wg"].phase)
+            values.append(phase[..., m])
+        params.append(self.components["wg"].phase)
+        values.append(phase[..., self.N - 1])
+        _load_phases(params, values)
+        return self
+
+
+###################
+## Decomposition ##
+###################
+
+
+def reck_decomposition(U, phase0=0.0):
+    """decompose unitary matrices into the phases of a Reck mesh
+
+    Each layer of the mesh fixes one row of U: the elements of the row are
+    nulled one by one from the last column to the first with MZIs acting on
+    the columns of U. The phase of the waveguide at the start of the layer is
+    chosen such that the remaining diagonal element becomes exactly one. The
+    last diagonal element gives the phase of the final waveguide.
+
+    Args:
+        U (Tensor): the real and imaginary part of the unitary matrices with
+            shape (2, ..., N, N).
+        phase0 (float|Tensor): the propagation phase of the MZIs and the
+            waveguides of the mesh. Should be broadcastable to the batch shape
+            (...) of U, e.g. one propagation phase per wavelength.
+
+    Returns:
+        phi (Tensor): the input phases of the MZIs with shape (..., # mzis).
+        theta (Tensor): the phase differences between the arms of the MZIs
+            with shape (..., # mzis).
+        phase (Tensor): the phases of the waveguides with shape (..., N).
+
+    Note:
+        The MZIs are ordered layer by layer, as in ``ReckNxN``. The phases of
+        the waveguides are those of the N-1 layers, followed by the phase of
+        the final waveguide.
+
+    Reference:
+        https://journals.aps.org/prl/abstract/10.1103/PhysRevLett.73.58
+
+    """
+    N = U.shape[-1]
+    U, phase0 = _complex_batch(U, phase0)
+
+    phi, theta, phase = [], [], []
+    for m in range(N - 1):
+        # the phase the nulled element in row m will have after the layer
+        # should vanish, which fixes the phase of the waveguide:
+        beta = -(N - 1 - m) * (np.pi - phase0)
+        wg_phase = torch.angle(U[..., m, N - 1]) - phase0 - beta
+        U[..., :, N - 1] = U[..., :, N - 1] * _expi(-phase0 - wg_phase)[..., None]
+        phase.append(wg_phase)
+
+        layer_phi, layer_theta = [], []
+        for l in range(N - 2, m - 1, -1):  # null U[m, l + 1]
+            x, y = U[..., m, l], U[..., m, l + 1]
+            mzi_theta = torch.atan2(y.abs(), x.abs())
+            mzi_phi = torch.angle(x) - beta + np.pi
+            _times_mzi_inverse(U, l, mzi_theta, mzi_phi)
+            U[..., :, l : l + 2] *= _expi(-phase0)[..., None, None]  # propagation
+            beta = beta + np.pi - phase0
+            layer_phi.insert(0, mzi_phi)
+            layer_theta.insert(0, mzi_theta)
+        phi += layer_phi
+        theta += layer_theta
+    phase.append(torch.angle(U[..., N - 1, N - 1]) - phase0)
+
+    phi, theta, phase = [torch.stack(x, -1) for x in (phi, theta, phase)]
+    return phi % (2 * np.pi), theta, phase % (2 * np.pi)
@@ -33,6 +33,8 @@ from ..nn.nn import Buffer, Parameter
 class _MixingPhaseArrayRings(Network):
     """ helper network for RingNetwork """
 
+    _cache_template = True
+
     def __init__(
         self, N, wg_factory=_wg_factory, mzi_factory=_mzi_factory, name=None,
     ):
@@ -87,6 +89,8 @@ class _UnclosedRingArray(Network):
 
     """
 
+    _cache_template = True
+
     def __init__(
         self, N=2, wg_factory=_wg_factory, mzi_factory=_mzi_factory, name=None,
     ):
@@ -162,6 +166,8 @@ class RingNetwork(Network):
 
     """
 
+    _cache_template = True
+
     def __init__(
         self,
         N=2,
@@ -223,3 +229,20 @@ class RingNetwork(Network):
         ret = super(RingNetwork, self).terminate(term)
         ret.to(self.device)
         return ret
+
+    def transfer_matrix(self, inputs=None, outputs=None):
+        """the frequency domain transfer matrix of the mesh
+
+        Args:
+            inputs (optional, list): the indices of the free ports to use as
+                inputs. Default: the N input ports.
+            outputs (optional, list): the indices of the free ports to use as
+                outputs. Default: the N output ports.
+
+        Returns:
+            Tensor: the real and imaginary part of the transfer matrix with
+                shape (2, # wavelengths, # outputs, # inputs).
+        """
+        inputs = range(self.N) if inputs is None else inputs
+        outputs = range(self.N, 2 * self.N) if outputs is None else outputs
+        return super(RingNetwork, self).transfer_matrix(inputs=inputs, outputs=outputs)
@@ -5,5 +5,12 @@ from .nn import Module
 from .nn import Buffer
 from .nn import BERLoss
 from .nn import MSELoss
+from .nn import BERAccumulator
+from .nn import MSEAccumulator
+from .nn import estimate_latency
 from .nn import BoundedParameter
 from .nn import BitStreamGenerator
+from .nn import RidgeReadout
+from .nn import MatrixLayer
+from .nn import prbs
+from .nn import prbs_chunks
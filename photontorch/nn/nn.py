@@ -15,9 +15,11 @@ from torch.nn import Module as _Module_
 
 ## 3rd party
 import numpy as np
-from scipy.signal import butter, lfilter
+from scipy.signal import lfilter
+from scipy.stats import beta
 
 ## Relative
+from ..environment.environment import Environment
 from ..environment.environment import current_environment
 
 
@@ -26,6 +28,13 @@ from ..environment.environment import current_environment
 ############
 
 
+# disable the torch function override of tensor subclasses (torch < 2.0 has no
+# subclass-specific version):
+_DisableTorchFunctionSubclass = getattr(
+    torch._C, "DisableTorchFunctionSubclass", torch._C.DisableTorchFunction
+)
+
+
 class Buffer(torch.Tensor):
     """ A Buffer is a Module Variable which is automatically registered in _buffers
 
@@ -40,6 +49,10 @@ class Buffer(torch.Tensor):
         For the automatic registration of the Buffer to work, you need to use
         the `photontorch.nn.Module`, which is a subclass of `torch.nn.Module`.
 
+    Note:
+        Operations on a Buffer return ordinary tensors. Only tensors that are
+        explicitly wrapped in a Buffer are registered.
+
     """
 
     def __new__(cls, data=None, requires_grad=False):
@@ -50,6 +63,13 @@ class Buffer(torch.Tensor):
     def __repr__(self):
         return "Buffer containing:\n" + super(Buffer, self).__repr__()
 
+    @classmethod
+    def __torch_function__(cls, func, types, args=(), kwargs=None):
+        if kwargs is None:
+            kwargs = {}
+        with _DisableTorchFunctionSubclass():
+            return func(*args, **kwargs)
+
 
 #######################
 ## Bounded Parameter ##
@@ -280,6 +300,59 @@ class BitStreamGenerator(Module):
             should be compensated with an (integer) number of warmup bits
             (rounded up) to make it work.
         """
+        chunks = list(
+            self.stream(
+                bits=bits,
+                chunk_size=None,
+                bitrate=bitrate,
+                samplerate=samplerate,
+                cutoff_frequency=cutoff_frequency,
+                filter_order=filter_order,
+                seed=seed,
+                dtype=dtype,
+                device=device,
+            )
+        )
+        return torch.cat(chunks, 0)
+
+    def stream(
+        self,
+        bits=100,
+        chunk_size=65536,
+        bitrate=None,
+        samplerate=None,
+        cutoff_frequency=None,
+        filter_order=None,
+        seed=None,
+        dtype=None,
+        device=None,
+    ):
+        """generate a bitstream in chunks of a fixed number of samples
+
+        Args:
+            bits (int|sequence|iterable): - if int: generate that number of bits, then create stream.
+                - if sequence: interpret the sequence as bits, then create stream.
+                - if iterable (e.g. ``prbs_chunks``): interpret each element as the next block of bits.
+            chunk_size (optional, int): number of samples in each chunk (the
+                last chunk can be shorter). None: yield a single chunk.
+            bitrate (optional, float): [1/s] override data rate of the bitstream (defaults to bitrate found in environment)
+            samplerate (optional, float): [1/s] override the sample rate of the signal (defaults to samplerate found in environment)
+            cutoff_frequency (optional, float): [1/s] override cutoff frequency of the bitstream. If None: no lowpass filtering.
+            filter_order (optional, int): override filter order to enforce cutoff frequency
+            seed (optional, int): override seed used to generate bits (if needed)
+            dtype (optional, torch.dtype): override dtype to generate the bits for. None -> "torch.get_default_dtype()"
+            device (optional, torch.device): override device to generate the bits on. None -> "cpu"
+
+        Yields:
+            Tensor: the next chunk of the bitstream.
+
+        Note:
+            The bits are upsampled, filtered and decimated block by block,
+            carrying the filter state from one block to the next. The
+            concatenated chunks are therefore identical to the stream
+            generated by ``forward``, while only a single block is kept in
+            memory at any time.
+        """
 
         try:
             env = current_environment()
@@ -311,44 +384,162 @@ class BitStreamGenerator(Module):
         if torch.is_tensor(bits):
             bits = bits.detach().cpu().numpy()
 
+        rc = 1
+        temp_samplerate = samplerate
+        if cutoff_frequency is not None:
+            # handle fractional sampling:
+            temp_samplerate = max(
+                int(8 * cutoff_frequency + 0.5) // int(samplerate + 0.5) * samplerate,
+                samplerate,
+            )
+            rc = int(temp_samplerate + 0.5) // int(samplerate + 0.5)
+        rates_gcd = np.gcd(int(temp_samplerate + 0.5), int(bitrate + 0.5))
+        rs = int(temp_samplerate + 0.5) // rates_gcd  # upsampling factor
+        rb = int(bitrate + 0.5) // rates_gcd
+        step = rb * rc  # decimation factor
+
+        if cutoff_frequency is not None:
+            # avoid circular import (the detectors depend on this module):
+            from ..detectors.filters import filter_plan_cache
+
+            normal_cutoff = cutoff_frequency / (0.5 * temp_samplerate * rb)
+            plan = filter_plan_cache.butter(
+                filter_order, normal_cutoff, dtype=torch.float64
+            )
+            b, a = plan.b.numpy(), plan.a.numpy()
+
+        # number of bits in a block such that a block yields about one chunk:
+        block_size = None if chunk_size is None else max(chunk_size * step // rs, 1)
+
         if isinstance(bits, int):
-            bits = rng.rand(bits) > 0.5
+            blocks = _random_bit_blocks(rng, bits, block_size)
+        elif isinstance(bits, (np.ndarray, list, tuple)):
+            bits = np.asarray(bits)
+            size = bits.shape[0] if block_size is None else block_size
+            blocks = (bits[i : i + size] for i in range(0, bits.shape[0], size))
+        else:
+            blocks = (np.asarray(block) for block in bits)
 
-        with torch.no_grad():
-            rc = 1
-            temp_samplerate = samplerate
+        zi = None
+        phase = 0  # index of the next sample to keep in the upsampled stream
+        pending, num_pending = [], 0
+        for block in blocks:
+            stream = np.repeat(block, rs, axis=0).astype(np.float64)
             if cutoff_frequency is not None:
-                # handle fractional sampling:
-                temp_samplerate = max(
-                    int(8 * cutoff_frequency + 0.5)
-                    // int(samplerate + 0.5)
-                    * samplerate,
-                    samplerate,
-                )
-                rc = int(temp_samplerate + 0.5) // int(samplerate + 0.5)
-            rates_gcd = np.gcd(int(temp_samplerate + 0.5), int(bitrate + 0.5))
-            rs = int(temp_samplerate + 0.5) // rates_gcd
-            rb = int(bitrate + 0.5) // rates_gcd
-            stream = np.stack([bits] * rs, 1).reshape(-1, *bits.shape[1:]).copy()
+                if zi is None:
+                    zi = np.zeros((max(len(a), len(b)) - 1,) + stream.shape[1:])
+                stream, zi = lfilter(b, a, stream, axis=0, zi=zi)
+            pending.append(stream[phase::step])
+            num_pending += pending[-1].shape[0]
+            phase = (phase - stream.shape[0]) % step
+
+            while chunk_size is not None and num_pending >= chunk_size:
+                samples = np.concatenate(pending, 0)
+                pending = [samples[chunk_size:]]
+                num_pending -= chunk_size
+                yield torch.tensor(samples[:chunk_size], dtype=dtype, device=device)
+
+        if num_pending > 0 or chunk_size is None:
+            samples = np.concatenate(pending, 0) if pending else np.zeros(0)
+            yield torch.tensor(samples, dtype=dtype, device=device)
+
+
+def _random_bit_blocks(rng, num_bits, block_size=None):
+    """ generate random bits in blocks """
+    block_size = num_bits if block_size is None else block_size
+    for i in range(0, num_bits, max(block_size, 1)):
+        yield rng.rand(min(block_size, num_bits - i)) > 0.5
 
-            if cutoff_frequency is not None:
-                normal_cutoff = cutoff_frequency / (0.5 * temp_samplerate * rb)
-                b, a = butter(
-                    N=filter_order, Wn=normal_cutoff, btype="lowpass", analog=False
-                )
-                stream = lfilter(b, a, stream, axis=0)
 
-            stream = torch.tensor(stream[:: rb * rc].copy(), dtype=dtype, device=device)
+##########
+## PRBS ##
+##########
 
-        return stream
+_PRBS_TAPS = {
+    7: (7, 6),
+    9: (9, 5),
+    11: (11, 9),
+    15: (15, 14),
+    23: (23, 18),
+    31: (31, 28),
+}
+""" feedback taps (p, q) of the PRBS polynomials x^p + x^q + 1 (ITU-T O.150) """
 
 
-def _broadcast_prediction_target(prediction, target):
+def prbs(order=7, num_bits=None, state=None):
+    """generate a pseudo-random binary sequence (PRBS)
+
+    Args:
+        order (int): the order of the PRBS: 7, 9, 11, 15, 23 or 31.
+        num_bits (optional, int): the number of bits to generate. None: a
+            single period (2^order - 1 bits).
+        state (optional, array): the last ``order`` bits preceding the
+            sequence (e.g. the end of the previous sequence). None: all ones.
+
+    Returns:
+        np.ndarray: the generated bits (bool).
+
+    Note:
+        The bits obey b[n] = b[n - p] ^ b[n - q]. Since (x^p + x^q + 1)^(2^k) =
+        x^(2^k p) + x^(2^k q) + 1 in GF(2), also b[n] = b[n - 2^k p] ^ b[n - 2^k q],
+        which allows generating the sequence in a few vectorized steps with
+        doubling block sizes.
+    """
+    if order not in _PRBS_TAPS:
+        raise ValueError(
+            "PRBS order should be one of %s" % str(sorted(_PRBS_TAPS))[1:-1]
+        )
+    p, q = _PRBS_TAPS[order]
+    num_bits = 2 ** order - 1 if num_bits is None else int(num_bits)
+    state = np.ones(p, dtype=bool) if state is None else np.asarray(state, dtype=bool)
+    if state.shape[0] < p:
+        raise ValueError("the PRBS%i state should contain at least %i bits" % (p, p))
+
+    b = np.empty(p + num_bits, dtype=bool)
+    b[:p] = state[-p:]
+    L = p
+    while L < b.shape[0]:
+        k = 1
+        while 2 * k * p <= L:
+            k *= 2
+        m = min(k * q, b.shape[0] - L)
+        b[L : L + m] = b[L - k * p : L - k * p + m] ^ b[L - k * q : L - k * q + m]
+        L += m
+    return b[p:]
+
+
+def prbs_chunks(order=7, chunk_size=65536, num_bits=None, state=None):
+    """generate a (long) pseudo-random binary sequence in chunks
+
+    Args:
+        order (int): the order of the PRBS: 7, 9, 11, 15, 23 or 31.
+        chunk_size (int): the number of bits in each chunk.
+        num_bits (optional, int): the total number of bits to generate.
+            None: generate bits indefinitely.
+        state (optional, array): the last ``order`` bits preceding the
+            sequence. None: all ones.
+
+    Yields:
+        np.ndarray: the next chunk of bits (bool).
+    """
+    state = np.ones(order, dtype=bool) if state is None else np.asarray(state, bool)
+    i = 0
+    while num_bits is None or i < num_bits:
+        n = chunk_size if num_bits is None else min(chunk_size, num_bits - i)
+        bits = prbs(order, n, state)
+        state = bits if n >= order else np.concatenate([state, bits])
+        i += n
+        yield bits
+
+
+def _broadcast_prediction_target(prediction, target, clone=True):
     """ broadcast prediction and target in identical shapes
 
     Args:
         prediction (Tensor): prediction
         target (Tensor): target
+        clone (bool): return copies of prediction and target. Otherwise,
+            the returned tensors are (expanded) views of the inputs.
 
     Returns:
         prediction and target in the same shape
@@ -364,13 +555,33 @@ def _broadcast_prediction_target(prediction, target):
         prediction = prediction[:, None]
     while len(target.shape) < 4:
         target = target[:, None]
+    if clone:
+        prediction, target = prediction.clone(), target.clone()
     try:
-        prediction, target = torch.broadcast_tensors(prediction.clone(), target.clone())
+        prediction, target = torch.broadcast_tensors(prediction, target)
     except RuntimeError:
         raise RuntimeError("failed to broadcast target in the same shape as prediction")
     return prediction, target
 
 
+def _sample_indices(num_samples, start, step, rb=1, offset=0):
+    """ indices of the samples at every step-th point of a virtually upsampled signal
+
+    Args:
+        num_samples (int): number of samples in the (chunk of the) original signal.
+        start (int): index of the first sample in the upsampled signal.
+        step (int): distance between the samples in the upsampled signal.
+        rb (int): upsampling factor (each sample is virtually repeated rb times).
+        offset (int): index of the first sample of the chunk in the original signal.
+
+    Returns:
+        Tensor: the indices of the samples in the (chunk of the) original signal.
+    """
+    first = start + max(-(-(offset * rb - start) // step), 0) * step
+    idxs = torch.arange(first, (offset + num_samples) * rb, step, dtype=torch.long)
+    return idxs // rb - offset
+
+
 class _Loss(Module):
     """ Base class for loss function extensions. """
 
@@ -604,18 +815,16 @@ class BERLoss(_Loss):
             samplerate = self.samplerate if samplerate is None else float(samplerate)
             latency = self.latency if latency is None else float(latency)
             warmup = self.warmup if warmup is None else int(warmup + 0.5)
-            prediction, target = _broadcast_prediction_target(prediction, target)
-
-            _, nw, nd, nb = prediction.shape
+            prediction, target = _broadcast_prediction_target(
+                prediction, target, clone=False
+            )
 
-            # always normalize target around 0 (this way we don't need to care about how the target bits are defined [0,1] or [-1, 1] or smth else)
-            target = (target - target.mean(0)) / target.std()
+            # always threshold the target at its mean (this way we don't need to care about how the target bits are defined [0,1] or [-1, 1] or smth else)
+            target_threshold = target.mean(0)
 
-            # handle fractional sampling:
+            # handle fractional sampling (virtually upsample by rb):
             rb = int(bitrate + 0.5) // np.gcd(int(samplerate + 0.5), int(bitrate + 0.5))
             samplerate = rb * samplerate
-            prediction = torch.stack([prediction] * rb, 1).view(-1, nw, nd, nb)
-            target = torch.stack([target] * rb, 1).view(-1, nw, nd, nb)
 
             # delay and sample sequences
             s = int(samplerate / bitrate + 0.5)  # samples per bit
@@ -629,18 +838,594 @@ class BERLoss(_Loss):
                 raise ValueError(
                     "please add more warmup bits for negative latency %.2f" % latency
                 )
-            target = target[w + s // 2 :: s]
-            prediction = prediction[w + s // 2 + l :: s]
+            target_idxs = _sample_indices(target.shape[0], w + s // 2, s, rb)
+            prediction_idxs = _sample_indices(
+                prediction.shape[0], w + s // 2 + l, s, rb
+            )
 
             # make sure both sequences have the same length:
-            m = min(target.shape[0], prediction.shape[0])
-            target = target[:m]
-            prediction = prediction[:m]
+            m = min(target_idxs.shape[0], prediction_idxs.shape[0])
+            target = target.index_select(0, target_idxs[:m].to(target.device))
+            prediction = prediction.index_select(
+                0, prediction_idxs[:m].to(prediction.device)
+            )
 
             # find wrong bits
-            wrong_bits = (prediction > threshold) != (target > 0.0)
+            wrong_bits = (prediction > threshold) != (target > target_threshold)
 
             # calculate error
             error = wrong_bits.to(dtype=torch.float64).mean().item()
 
         return error
+
+
+########################
+## Latency Estimation ##
+########################
+
+
+def estimate_latency(
+    prediction, target, bitrate=None, samplerate=None, max_latency=None
+):
+    """ estimate the latency between prediction and target by FFT cross-correlation
+
+    Args:
+        prediction (Tensor): prediction tensor. Should be broadcastable to tensor with shape (# timesteps, # wavelengths, # readouts, # batches)
+        target (Tensor): target tensor. Should be broadcastable to the same shape as prediction.
+        bitrate (optional, float): [1/s] data rate of the bitstream (defaults to bitrate found in environment)
+        samplerate (optional, float): [1/s] sample rate of the bitstream (defaults to samplerate found in environment)
+        max_latency (optional, float): [bits] maximum (absolute) latency to consider.
+
+    Returns:
+        lag (Tensor): [samples] best integer latency for each (wavelength, readout, batch).
+        latency (Tensor): [bits] best fractional latency (with sub-sample
+            precision) for each (wavelength, readout, batch). These values
+            can be passed as ``latency`` to the loss functions.
+
+    Note:
+        A positive latency means that the prediction lags behind the target,
+        which is the convention used by the loss functions.
+    """
+    bitrate_, samplerate_ = None, None
+    try:
+        env = current_environment()
+        bitrate_, samplerate_ = env.bitrate, env.samplerate
+    except RuntimeError:
+        pass
+    bitrate = bitrate_ if bitrate is None else float(bitrate)
+    samplerate = samplerate_ if samplerate is None else float(samplerate)
+    if bitrate is None or samplerate is None:
+        raise ValueError("please specify a bitrate and samplerate.")
+
+    with torch.no_grad():
+        if not torch.is_tensor(prediction):
+            prediction = torch.tensor(prediction, dtype=torch.get_default_dtype())
+        target = torch.as_tensor(
+            target, dtype=prediction.dtype, device=prediction.device
+        )
+        while prediction.ndim < 4:
+            prediction = prediction[:, None]
+        while target.ndim < 4:
+            target = target[:, None]
+        m = min(prediction.shape[0], target.shape[0])
+        prediction, target = torch.broadcast_tensors(prediction[:m], target[:m])
+        prediction = prediction - prediction.mean(0)
+        target = target - target.mean(0)
+
+        # cross-correlation xc[k] = sum_n prediction[n + k] * target[n]:
+        n = 2 ** int(np.ceil(np.log2(2 * m)))
+        xc = torch.fft.irfft(
+            torch.fft.rfft(prediction, n=n, dim=0)
+            * torch.conj(torch.fft.rfft(target, n=n, dim=0)),
+            n=n,
+            dim=0,
+        )
+        max_lag = m - 1
+        if max_latency is not None:
+            max_lag = min(max_lag, int(abs(max_latency) * samplerate / bitrate + 0.5))
+        lags = torch.arange(-max_lag, max_lag + 1, device=xc.device)
+        xc = xc[lags % n]  # reorder: negative lags first
+
+        idx = xc.argmax(0)
+        lag = lags[idx]
+
+        # parabolic interpolation around the maximum:
+        y0 = xc.gather(0, idx[None])[0]
+        ym = xc.gather(0, (idx - 1).clamp(min=0)[None])[0]
+        yp = xc.gather(0, (idx + 1).clamp(max=xc.shape[0] - 1)[None])[0]
+        denom = ym - 2 * y0 + yp
+        peak = denom < 0  # proper maximum
+        delta = 0.5 * (ym - yp) / torch.where(peak, denom, -torch.ones_like(denom))
+        delta = torch.where(peak, delta, torch.zeros_like(delta)).clamp(-0.5, 0.5)
+        latency = (lag.to(delta.dtype) + delta) * bitrate / samplerate
+
+    return lag, latency
+
+
+##################
+## Accumulators ##
+##################
+
+
+class _Accumulator(object):
+    """ Base class for streaming loss accumulators.
+
+    An accumulator accepts successive chunks of a prediction and a target
+    (along the time dimension). The chunks of the prediction and the target
+    are aligned across chunk boundaries with the configured latency and
+    warmup and the running statistics are updated with each aligned sample.
+
+    """
+
+    def __init__(self, latency=0.0, warmup=0, bitrate=40e9, samplerate=160e9):
+        """
+        Args:
+            latency (float): [bits] fractional latency in bit lengths. This value can be a floating point number bigger than 1.
+            warmup (int): [bits] integer number of warmup bits. warmup bits are disregarded during the loss calculation.
+            bitrate (float): [1/s] data rate of the bitstream
+            samplerate (float): [1/s] sample rate of the bitstream
+
+        Note:
+            If a bitrate and/or samplerate can be found in the current
+            environment during the first update, those values get precedence
+            over the values given during the accumulator initialization.
+        """
+        self.bitrate = float(bitrate)
+        self.samplerate = float(samplerate)
+        self.latency = float(latency)
+        self.warmup = int(warmup + 0.5)
+        self.reset()
+
+    def reset(self):
+        """ clear the accumulated statistics """
+        self._sampling = None
+        self._num_predictions = 0  # number of prediction samples received
+        self._num_targets = 0  # number of target samples received
+        self._predictions = []  # pending (not yet aligned) prediction samples
+        self._targets = []  # pending (not yet aligned) target samples
+
+    def _get_sampling(self):
+        """ get the sampling parameters (start, step, rb) of prediction and target """
+        raise NotImplementedError(
+            "Implement the sampling parameters for your accumulator by subclassing."
+        )
+
+    def _rates(self):
+        """ get the bitrate and samplerate to use """
+        bitrate, samplerate = None, None
+        try:
+            env = current_environment()
+            bitrate, samplerate = env.bitrate, env.samplerate
+        except RuntimeError:
+            pass
+        bitrate = self.bitrate if bitrate is None else float(bitrate)
+        samplerate = self.samplerate if samplerate is None else float(samplerate)
+        return bitrate, samplerate
+
+    def _observe(self, prediction, target):
+        """ observe the raw chunks of prediction and target before sampling """
+        pass
+
+    def _transform(self, prediction, target):
+        """ transform the sampled prediction and target before alignment """
+        return prediction, target
+
+    def _accumulate(self, prediction, target):
+        """ update the running statistics with aligned samples """
+        raise NotImplementedError(
+            "Implement the statistics update for your accumulator by subclassing."
+        )
+
+    def update(self, prediction, target):
+        """ update the statistics with the next chunk of the prediction and target
+
+        Args:
+            prediction (Tensor): next chunk of the prediction. Should be broadcastable to tensor with shape (# timesteps, # wavelengths, # readouts, # batches)
+            target (Tensor): next chunk of the target. Should be broadcastable to the same shape as the prediction (except for the number of timesteps).
+
+        Returns:
+            the accumulator itself.
+        """
+        if self._sampling is None:
+            self._sampling = self._get_sampling()
+        (pstart, tstart, step, rb) = self._sampling
+
+        with torch.no_grad():
+            if not torch.is_tensor(prediction):
+                prediction = torch.tensor(prediction)
+            target = torch.as_tensor(
+                target, dtype=prediction.dtype, device=prediction.device
+            )
+            while prediction.ndim < 4:
+                prediction = prediction[:, None]
+            while target.ndim < 4:
+                target = target[:, None]
+            try:  # the chunks can have a different number of timesteps
+                torch.broadcast_shapes(prediction.shape[1:], target.shape[1:])
+            except RuntimeError:
+                raise RuntimeError(
+                    "failed to broadcast target in the same shape as prediction"
+                )
+            self._observe(prediction, target)
+
+            idxs = _sample_indices(
+                prediction.shape[0], pstart, step, rb, self._num_predictions
+            )
+            self._num_predictions += prediction.shape[0]
+            prediction = prediction.index_select(0, idxs.to(prediction.device))
+
+            idxs = _sample_indices(target.shape[0], tstart, step, rb, self._num_targets)
+            self._num_targets += target.shape[0]
+            target = target.index_select(0, idxs.to(target.device))
+
+            prediction, target = self._transform(prediction, target)
+            self._predictions.append(prediction)
+            self._targets.append(target)
+
+            prediction = torch.cat(self._predictions, 0)
+            target = torch.cat(self._targets, 0)
+            m = min(prediction.shape[0], target.shape[0])
+            self._predictions = [prediction[m:]]
+            self._targets = [target[m:]]
+            if m > 0:
+                self._accumulate(prediction[:m], target[:m])
+
+        return self
+
+
+class MSEAccumulator(_Accumulator):
+    """ Streaming Mean Squared Error for bitstreams """
+
+    def reset(self):
+        """ clear the accumulated statistics """
+        super(MSEAccumulator, self).reset()
+        self.sum = 0.0
+        self.count = 0
+
+    def _get_sampling(self):
+        bitrate, samplerate = self._rates()
+        l = int(self.latency * samplerate / bitrate + 0.5)  # latency sample points
+        w = int(self.warmup * samplerate / bitrate + 0.5)  # warmup sample points
+        if w + l < 0:
+            raise ValueError(
+                "please add more warmup bits for negative latency %.2f" % self.latency
+            )
+        return (w + l, w, 1, 1)
+
+    def _accumulate(self, prediction, target):
+        error = (prediction - target) ** 2
+        self.sum += error.to(torch.float64).sum().item()
+        self.count += error.numel()
+
+    @property
+    def mse(self):
+        """ the mean squared error of the samples accumulated so far """
+        return self.sum / max(self.count, 1)
+
+
+class BERAccumulator(_Accumulator):
+    """ Streaming Bit Error Rate with confidence intervals """
+
+    def __init__(
+        self,
+        threshold=0.5,
+        latency=0.0,
+        warmup=0,
+        bitrate=40e9,
+        samplerate=160e9,
+        target_threshold=None,
+    ):
+        """
+        Args:
+            threshold (float): threshold value (where to place the 0/1 threshold)
+            latency (float): fractional latency [in bit lengths]. This value can be a floating point number bigger than 1.
+            warmup (int): integer number of warmup bits. warmup bits are disregarded during the loss calculation.
+            bitrate (float): the bit rate of the signal [in Hz]
+            samplerate (float): the sample rate of the signal [in Hz]
+            target_threshold (optional, float): threshold of the target bits.
+                If None, the mean of the first target chunk (before sampling)
+                is used.
+        """
+        self.threshold = float(threshold)
+        self.target_threshold = (
+            None if target_threshold is None else float(target_threshold)
+        )
+        super(BERAccumulator, self).__init__(
+            latency=latency, warmup=warmup, bitrate=bitrate, samplerate=samplerate
+        )
+
+    def reset(self):
+        """ clear the accumulated statistics """
+        super(BERAccumulator, self).reset()
+        self._target_threshold = self.target_threshold
+        self.errors = 0
+        self.bits = 0
+
+    def _get_sampling(self):
+        bitrate, samplerate = self._rates()
+        # handle fractional sampling (virtually upsample by rb):
+        rb = int(bitrate + 0.5) // np.gcd(int(samplerate + 0.5), int(bitrate + 0.5))
+        samplerate = rb * samplerate
+        s = int(samplerate / bitrate + 0.5)  # samples per bit
+        l = int(self.latency * samplerate / bitrate + 0.5)  # latency sample points
+        w = int(self.warmup * samplerate / bitrate + 0.5)  # warmup samples
+        if w + s // 2 + l < 0:
+            raise ValueError(
+                "please add more warmup bits for negative latency %.2f" % self.latency
+            )
+        return (w + s // 2 + l, w + s // 2, s, rb)
+
+    def _observe(self, prediction, target):
+        # threshold the target at the mean of the first chunk (this way we don't need to care about how the target bits are defined [0,1] or [-1, 1] or smth else)
+        if self._target_threshold is None and target.shape[0] > 0:
+            self._target_threshold = target.mean(0)
+
+    def _transform(self, prediction, target):
+        target_threshold = self._target_threshold
+        target_threshold = 0.0 if target_threshold is None else target_threshold
+        return prediction > self.threshold, target > target_threshold
+
+    def _accumulate(self, prediction, target):
+        wrong_bits = prediction != target
+        self.errors += int(wrong_bits.sum().item())
+        self.bits += wrong_bits.numel()
+
+    @property
+    def ber(self):
+        """ the bit error rate of the bits accumulated so far """
+        return self.errors / max(self.bits, 1)
+
+    def confidence_interval(self, confidence=0.95):
+        """ exact (Clopper-Pearson) confidence interval of the bit error rate
+
+        Args:
+            confidence (float): the confidence level of the interval.
+
+        Returns:
+            lower (float): the lower bound of the bit error rate.
+            upper (float): the upper bound of the bit error rate.
+
+        Note:
+            When no errors were found, the upper bound approximates
+            -ln(1-confidence)/#bits (about 3/#bits for a 95% confidence).
+        """
+        alpha = 1 - confidence
+        e, n = self.errors, self.bits
+        if n == 0:
+            return 0.0, 1.0
+        lower = 0.0 if e == 0 else float(beta.ppf(alpha / 2, e, n - e + 1))
+        upper = 1.0 if e == n else float(beta.ppf(1 - alpha / 2, e + 1, n - e))
+        return lower, upper
+
+
+##############
+## Readouts ##
+##############
+
+
+class RidgeReadout(Module):
+    """ Linear readout trained with closed-form (streaming) ridge regression
+
+    The readout consumes the detected (or probed) states of a network chunk
+    by chunk and accumulates the Gram matrix of the states and their
+    cross-correlation with the target. The readout weights are then found
+    in closed form by solving the regularized normal equations. This way,
+    training the readout only requires a single forward pass over the data
+    and O(#features²) memory.
+
+    Example:
+        >>> readout = pt.RidgeReadout(alpha=1e-3, warmup=100)
+        >>> for source, target in chunks:
+        >>>     readout.accumulate(nw(source), target)
+        >>> readout.solve()
+        >>> prediction = readout(nw(source))
+
+    """
+
+    def __init__(self, alpha=1e-6, bias=True, warmup=0):
+        """
+        Args:
+            alpha (float): ridge regularization strength.
+            bias (bool): also train a bias (which is not regularized).
+            warmup (int): number of initial timesteps of the accumulated
+                stream to disregard (washout of the reservoir).
+        """
+        super(RidgeReadout, self).__init__()
+        self.alpha = float(alpha)
+        self.use_bias = bool(bias)
+        self.warmup = int(warmup + 0.5)
+        self.register_buffer("weight", None)
+        self.register_buffer("bias", None)
+        self.reset()
+
+    def reset(self):
+        """ clear the accumulated statistics (the trained weights are kept). """
+        self._gram = None
+        self._cross = None
+        self._num_timesteps = 0
+        self._num_samples = 0
+
+    @staticmethod
+    def _features(states):
+        """ reshape states (t, w, f, b) into a feature matrix (t, b, w*f) """
+        if not torch.is_tensor(states):
+            states = torch.tensor(states, dtype=torch.get_default_dtype())
+        while states.ndim < 4:
+            states = states[:, None]
+        num_t, num_wl, num_f, num_b = states.shape
+        return states.permute(0, 3, 1, 2).reshape(num_t, num_b, num_wl * num_f)
+
+    @staticmethod
+    def _targets(target, num_t, num_b):
+        """ reshape targets (t,), (t, b) or (t, o, b) into a matrix (t, b, o) """
+        if target.ndim == 1:
+            target = target[:, None]
+        if target.ndim == 2:
+            target = target[:, None, :]
+        target = target.permute(0, 2, 1)
+        return target.expand(num_t, num_b, target.shape[-1])
+
+    def accumulate(self, states, target):
+        """ accumulate the statistics of a chunk of states and targets
+
+        Args:
+            states (Tensor): the states with shape (# timesteps, # wavelengths,
+                # features, # batches), such as the (power) output of a
+                ``Network`` forward pass.
+            target (Tensor): the target with shape (# timesteps,),
+                (# timesteps, # batches) or (# timesteps, # outputs, # batches).
+
+        """
+        with torch.no_grad():
+            x = self._features(states).to(torch.float64)
+            target = torch.as_tensor(target, device=x.device).to(torch.float64)
+            y = self._targets(target, x.shape[0], x.shape[1])
+
+            # skip the warmup timesteps of the stream:
+            skip = min(max(self.warmup - self._num_timesteps, 0), x.shape[0])
+            self._num_timesteps += x.shape[0]
+            x, y = x[skip:].reshape(-1, x.shape[-1]), y[skip:].reshape(-1, y.shape[-1])
+            if self.use_bias:
+                x = torch.cat([x, torch.ones_like(x[:, :1])], 1)
+
+            if self._gram is None:
+                self._gram = x.new_zeros((x.shape[1], x.shape[1]))
+                self._cross = x.new_zeros((x.shape[1], y.shape[1]))
+            self._gram += x.t() @ x
+            self._cross += x.t() @ y
+            self._num_samples += x.shape[0]
+
+        return self
+
+    def solve(self, alpha=None):
+        """ solve the ridge regression for the accumulated statistics
+
+        Args:
+            alpha (optional, float): override the ridge regularization strength.
+
+        Returns:
+            RidgeReadout: the trained readout.
+
+        """
+        if self._gram is None or self._num_samples == 0:
+            raise RuntimeError("no states accumulated to train the readout on.")
+        alpha = self.alpha if alpha is None else float(alpha)
+        with torch.no_grad():
+            reg = alpha * torch.ones_like(self._gram[0])
+            if self.use_bias:
+                reg[-1] = 0.0
+            weight = torch.linalg.solve(self._gram + torch.diag(reg), self._cross)
+            weight = weight.to(torch.get_default_dtype())
+            if self.use_bias:
+                weight, bias = weight[:-1], weight[-1]
+            else:
+                bias = torch.zeros_like(weight[0])
+        self.weight = Buffer(weight)
+        self.bias = Buffer(bias)
+        return self
+
+    def forward(self, states):
+        """ apply the trained readout
+
+        Args:
+            states (Tensor): the states with shape (# timesteps, # wavelengths,
+                # features, # batches).
+
+        Returns:
+            Tensor: the readout with shape (# timesteps, # outputs, # batches).
+
+        """
+        if self.weight is None:
+            raise RuntimeError("the readout is not trained yet. Call 'solve' first.")
+        x = self._features(states)
+        x = x.to(dtype=self.weight.dtype, device=self.weight.device)
+        return (x @ self.weight + self.bias).permute(0, 2, 1)
+
+
+##################
+## Matrix Layer ##
+##################
+
+
+class MatrixLayer(Module):
+    """ A photonic matrix layer for batched inference
+
+    The layer wraps a unitary mesh (such as ``ClementsNxN``), an ``Mmi`` or any
+    other component with a ``transfer_matrix`` method and applies the frequency
+    domain transfer matrix of the component to a batch of input amplitudes.
+    The transfer matrix is cached: it is only recalculated when a parameter or
+    buffer of the wrapped component changes, or when gradients need to flow
+    back to the parameters.
+
+    Example:
+        >>> layer = pt.MatrixLayer(pt.ClementsNxN(N=4))
+        >>> amplitudes = layer(x)  # x: (# batches, 4) or (2, # batches, 4)
+
+    """
+
+    def __init__(self, component, wl=1.55e-6, inputs=None, outputs=None):
+        """
+        Args:
+            component (Component): the mesh or MMI to wrap.
+            wl (float): [m] the wavelength at which the layer operates.
+            inputs (optional, list): the indices of the free ports of the
+                component to use as inputs. Default: the default inputs of
+                the ``transfer_matrix`` of the component.
+            outputs (optional, list): the indices of the free ports of the
+                component to use as outputs. Default: the default outputs of
+                the ``transfer_matrix`` of the component.
+        """
+        super(MatrixLayer, self).__init__()
+        self.component = component
+        self.wl = float(wl)
+        self.inputs = None if inputs is None else list(inputs)
+        self.outputs = None if outputs is None else list(outputs)
+        self._matrix = None
+        self._state = None
+
+    def _get_state(self):
+        """ the storage and version of all parameters and buffers of the component """
+        tensors = list(self.component.parameters()) + list(self.component.buffers())
+        return tuple((t.data_ptr(), t._version) for t in tensors)
+
+    @property
+    def matrix(self):
+        """ the transfer matrix of the component with shape (2, # outputs, # inputs) """
+        grad = torch.is_grad_enabled()
+        track = grad and any(p.requires_grad for p in self.component.parameters())
+        if track or self._matrix is None or self._get_state() != self._state:
+            with Environment(wl=self.wl, num_t=1, freqdomain=True, grad=grad):
+                matrix = self.component.transfer_matrix(
+                    inputs=self.inputs, outputs=self.outputs
+                )[:, 0]
+            if track:  # the graph of the matrix can not be reused
+                return matrix
+            self._matrix, self._state = matrix, self._get_state()
+        return self._matrix
+
+    def forward(self, x, power=False):
+        """ apply the transfer matrix to a batch of input amplitudes
+
+        Args:
+            x (Tensor): the real input amplitudes with shape (# batches,
+                # inputs) or the real and imaginary part of the input
+                amplitudes with shape (2, # batches, # inputs).
+            power (bool): return the output power instead of the output
+                amplitudes.
+
+        Returns:
+            Tensor: the real and imaginary part of the output amplitudes with
+                shape (2, # batches, # outputs) or the output power with shape
+                (# batches, # outputs) if power=True.
+
+        """
+        matrix = self.matrix
+        rT, iT = matrix[0].t(), matrix[1].t()
+        x = torch.as_tensor(x, dtype=matrix.dtype, device=matrix.device)
+        if x.ndim == 2:
+            y = torch.stack([x @ rT, x @ iT], 0)
+        else:
+            y = torch.stack([x[0] @ rT - x[1] @ iT, x[0] @ iT + x[1] @ rT], 0)
+        if power:
+            return (y ** 2).sum(0)
+        return y
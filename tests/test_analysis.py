@@ -0,0 +1,64 @@
+""" analysis tests """
+
+#############
+## Imports ##
+#############
+
+import torch
+import pytest
+import numpy as np
+import photontorch as pt
+
+###########
+## Tests ##
+###########
+
+
+def _bitstream(num_bits=1000, spb=8, noise=0.0, seed=0):
+    rng = np.random.RandomState(seed)
+    bits = rng.rand(num_bits) > 0.5
+    stream = np.repeat(bits.astype(np.float64), spb)
+    stream = stream + noise * rng.randn(stream.shape[0])
+    return torch.tensor(stream)
+
+
+def test_fold():
+    stream = _bitstream(num_bits=10, spb=4)
+    folded = pt.analysis.fold(stream, bitrate=1.0, samplerate=4.0, warmup=2)
+    assert folded.shape == (8, 4, 1, 1, 1)
+    assert torch.allclose(folded[:, 0, 0, 0, 0], stream[8::4])
+
+
+def test_fold_non_integer_samples_per_bit():
+    with pytest.raises(ValueError):
+        pt.analysis.fold(torch.zeros(10), bitrate=1.0, samplerate=2.5)
+
+
+def test_eye_diagram_open_eye():
+    eye = pt.EyeDiagram(bitrate=1.0, samplerate=8.0, threshold=0.5)
+    eye.update(_bitstream(spb=8))
+    assert eye.histogram.shape == (8, 100, 1, 1, 1)
+    assert int(eye.histogram.sum()) == 8000
+    assert float(eye.eye_width) == pytest.approx(1.0)
+    assert float(eye.eye_height) == pytest.approx(1.0)
+
+
+def test_eye_diagram_q_factor():
+    eye = pt.EyeDiagram(bitrate=1.0, samplerate=8.0, threshold=0.5)
+    eye.update(_bitstream(num_bits=10000, spb=8, noise=0.1))
+    assert float(eye.q_factor) == pytest.approx(5.0, rel=0.1)
+
+
+def test_eye_diagram_streaming():
+    stream = _bitstream(spb=8, noise=0.1)
+    eye1 = pt.EyeDiagram(bitrate=1.0, samplerate=8.0, range=(-1, 2), warmup=3)
+    eye1.update(stream)
+    threshold = float(eye1.decision_threshold)
+    eye2 = pt.EyeDiagram(
+        bitrate=1.0, samplerate=8.0, range=(-1, 2), threshold=threshold, warmup=3
+    )
+    for chunk in torch.split(stream, 77):
+        eye2.update(chunk)
+    assert eye1.num_bits == eye2.num_bits
+    assert torch.all(eye1.histogram == eye2.histogram)
+    assert torch.allclose(eye1.q_factor, eye2.q_factor)
@@ -4,14 +4,17 @@
 ## Imports ##
 #############
 
+import os
+import time
+
 import torch
 import pytest
 import numpy as np
-from scipy.signal import lfilter, butter
+from scipy.signal import lfilter, butter, sosfilt
 
 import photontorch as pt
 
-from fixtures import gen, lpdet
+from fixtures import gen, lpdet, nw, tenv
 
 
 #############
@@ -72,6 +75,132 @@ def test_lowpass_detector_forward(gen, lpdet):
         assert np.allclose(detected2, detected_scipy, atol=1e-2)
 
 
+def test_streaming_lowpass_detector(gen):
+    lpdet = pt.LowpassDetector(streaming=True)
+    stream = torch.rand(100, 2, generator=gen)
+    detected = lpdet(stream)
+    lpdet.reset()
+    chunks = [lpdet(chunk) for chunk in torch.split(stream, 30)]
+    assert torch.allclose(torch.cat(chunks), detected, atol=1e-6)
+
+
+def test_streaming_lowpass_detector_network_signal(nw, tenv):
+    lpdet = pt.LowpassDetector(
+        samplerate=tenv.samplerate,
+        cutoff_frequency=0.1 * tenv.samplerate,
+        streaming=True,
+    )
+    with tenv:
+        detected = lpdet(nw(source=1))
+        lpdet.reset()
+        source = nw._handle_source(1)
+        buffer = nw._simulation_buffer(1)
+        chunks = []
+        for i, t in enumerate(tenv.t):
+            fields, buffer = nw.step(t, source[:, i], buffer)
+            chunks.append(lpdet(torch.sum(fields ** 2, 0)[None]))
+    assert torch.allclose(torch.cat(chunks), detected, atol=1e-6)
+
+
+def test_streaming_photodetector(gen):
+    photodet = pt.Photodetector(seed=3, streaming=True)
+    stream = 1e-3 * torch.rand(100, 2, generator=gen)
+    detected = photodet(stream)
+    photodet.reset()
+    chunks = [photodet(chunk) for chunk in torch.split(stream, 30)]
+    assert torch.allclose(torch.cat(chunks), detected)
+
+
+def test_philox4x32():
+    counter = torch.zeros((4, 1), dtype=torch.int64)
+    words = pt.detectors.philox4x32(counter, (0, 0))[:, 0].tolist()
+    assert words == [0x6627E8D5, 0xE169C58D, 0xBC57AC4C, 0x9B00DBD8]
+
+
+def test_counter_based_noise():
+    noise = pt.detectors.noise.randn((1000,), seed=1, chunk_size=64)
+    assert torch.allclose(noise[301:], pt.detectors.noise.randn((699,), 1, 301))
+    assert abs(noise.mean()) < 0.1 and abs(noise.std() - 1) < 0.1
+
+
+def test_unseeded_photodetector_key_follows_manual_seed():
+    stream = 1e-3 * torch.ones(100, 2)
+    photodets = [pt.Photodetector(), pt.Photodetector()]
+    detected = []
+    for photodet in photodets:
+        torch.manual_seed(42)
+        detected.append(photodet(stream))
+    assert torch.allclose(detected[0], detected[1])
+
+
+def test_filter_plan_cache():
+    cache = pt.detectors.FilterPlanCache(maxsize=2)
+    plan = cache.butter(4, 0.25)
+    assert cache.butter(4, 0.25) is plan
+    cache.butter(4, 0.5)
+    cache.butter(2, 0.5)
+    assert len(cache) == 2
+    assert cache.butter(4, 0.25) is not plan
+    assert (cache.hits, cache.misses) == (1, 4)
+    b, a = butter(N=4, Wn=0.25, btype="lowpass", analog=False)
+    assert np.allclose(plan.b.numpy(), b) and np.allclose(plan.a.numpy(), a)
+
+
+@pytest.mark.parametrize("method", ["scan", "chunked", "fft"])
+def test_sosfilt(gen, method):
+    sos = butter(N=5, Wn=0.2, btype="lowpass", analog=False, output="sos")
+    x = torch.rand(1000, 3, generator=gen, dtype=torch.float64)
+    y = pt.sosfilt(sos, x, method=method, chunk_size=64)
+    assert np.allclose(y.numpy(), sosfilt(sos, x.numpy(), axis=0))
+
+
+@pytest.mark.parametrize("method", ["scan", "chunked"])
+def test_sosfilt_with_initial_conditions(gen, method):
+    sos = butter(N=4, Wn=0.3, btype="lowpass", analog=False, output="sos")
+    x = torch.rand(100, 2, generator=gen, dtype=torch.float64)
+    zi = torch.rand(2, 2, 2, generator=gen, dtype=torch.float64)
+    y1, z1 = pt.sosfilt(sos, x[:60], zi=zi, method=method, chunk_size=16)
+    y2, z2 = pt.sosfilt(sos, x[60:], zi=z1, method=method, chunk_size=16)
+    y, z = sosfilt(sos, x.numpy(), axis=0, zi=zi.numpy())
+    assert np.allclose(torch.cat([y1, y2]).numpy(), y)
+    assert np.allclose(z2.numpy(), z)
+
+
+def test_lfilter_gradient(gen):
+    b, a = butter(N=2, Wn=0.4, btype="lowpass", analog=False)
+    x = torch.rand(50, generator=gen, dtype=torch.float64).requires_grad_()
+    y = pt.lfilter(b, a, x, method="scan")
+    assert np.allclose(y.detach().numpy(), lfilter(b, a, x.detach().numpy()))
+    y.sum().backward()
+    assert x.grad is not None
+
+
+@pytest.mark.skipif(
+    not os.environ.get("PHOTONTORCH_BENCHMARK"),
+    reason="set PHOTONTORCH_BENCHMARK=1 to run (and pytest -s to show) the benchmark",
+)
+@pytest.mark.parametrize("num_t", [1000, 100000])
+def test_sosfilt_benchmark(gen, num_t):
+    def timeit(func, repeat=3):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - start)
+        return best, result
+
+    sos = butter(N=4, Wn=0.25, btype="lowpass", analog=False, output="sos")
+    b, a = butter(N=4, Wn=0.25, btype="lowpass", analog=False)
+    x = torch.rand(num_t, 16, generator=gen, dtype=torch.float64)
+    reference, y = timeit(lambda: lfilter(b, a, x.numpy(), axis=0))
+    print("\nnum_t=%i, scipy.signal.lfilter: %.2e s" % (num_t, reference))
+    with torch.no_grad():
+        for method in ["scan", "chunked", "fft"]:
+            duration, y_method = timeit(lambda: pt.sosfilt(sos, x, method=method))
+            print("    %-7s: %.2e s (%.2fx)" % (method, duration, duration / reference))
+            assert np.allclose(y_method.numpy(), y)
+
+
 ###############
 ## Run Tests ##
 ###############
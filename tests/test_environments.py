@@ -89,6 +89,17 @@ def test_environment_with_many_timesteps():
     assert env.t1 == pytest.approx(1e-9)
 
 
+def test_environment_tensor_cache():
+    env = pt.Environment(wl=[1.5e-6, 1.55e-6])
+    wl = env.tensor("wl")
+    assert wl.dtype == torch.float64
+    assert env.tensor("wl") is wl
+    assert env.tensor("wl", dtype=torch.float32) is not wl
+    np.testing.assert_array_almost_equal(env.tensor("f").numpy(), env.f)
+    with pytest.raises(ValueError):
+        env.tensor("c")
+
+
 ###############
 ## Run Tests ##
 ###############
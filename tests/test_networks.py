@@ -167,6 +167,133 @@ def test_forward_with_detector(nw, tenv, lpdet):
         nw(1, detector=lpdet)
 
 
+def test_forward_with_max_memory(gen, nw, tenv):
+    with tenv:
+        nw.initialize()
+        source = torch.rand(tenv.num_t, tenv.num_wl, nw.num_sources, 5, generator=gen)
+        detected = nw(source)
+        unit_memory = nw._forward_memory(num_batches=1, num_wl=1)
+        chunked = nw(source, max_memory=2 * unit_memory)
+        assert chunked.shape == detected.shape
+        assert torch.allclose(chunked, detected)
+        unit_memory = nw._forward_memory(num_batches=1, num_wl=1, power=False)
+        chunked = nw(source, power=False, max_memory=unit_memory)
+        assert torch.allclose(chunked, nw(source, power=False))
+
+
+def test_forward_memory_of_recorded_fields(nw, tenv):
+    with tenv:
+        nw.initialize()
+        memory = nw._forward_memory(num_batches=1)
+        assert nw._forward_memory(num_batches=1, record=[0, 3]) < memory
+        assert nw._forward_memory(num_batches=1, detectors=[]) < memory
+        assert nw._forward_memory(num_batches=1, probes=[0]) > memory
+
+
+def test_forward_with_too_small_max_memory(nw, tenv):
+    with tenv:
+        nw.initialize()
+        with pytest.raises(ValueError):
+            nw(1, max_memory=nw._forward_memory(num_batches=1, num_wl=1) - 1)
+
+
+def test_forward_with_decimation(nw, tenv):
+    with tenv:
+        detected = nw(source=1)
+        decimated = nw(source=1, decimation=3, detectors=[0])
+        assert decimated.shape[0] == (tenv.num_t + 2) // 3
+        assert decimated.shape[2] == 1
+        assert torch.allclose(decimated, detected[::3, :, :1])
+        sampled = nw(source=1, sample_at=[1, 4])
+        assert torch.allclose(sampled, detected[[1, 4]])
+        with pytest.raises(ValueError):
+            nw(source=1, decimation=2, sample_at=[1, 4])
+        with pytest.raises(ValueError):
+            nw(source=1, detectors=[nw.num_detectors])
+
+
+def test_forward_with_probes(nw, tenv):
+    with tenv:
+        detected = nw(source=1)
+        _, probed = nw(source=1, probes=["d:0", 0])
+        assert probed.shape == (tenv.num_t, tenv.num_wl, 2, 1)
+        assert torch.allclose(probed[:, :, :1], detected)
+        with pytest.raises(ValueError):
+            nw(source=1, probes=["x:0"])
+
+
+def test_forward_with_detector_chunk(nw, tenv):
+    detector = pt.LowpassDetector(
+        samplerate=tenv.samplerate,
+        cutoff_frequency=0.1 * tenv.samplerate,
+        streaming=True,
+    )
+    with tenv:
+        detected = nw(source=1, detector=detector)
+        fused = nw(source=1, detector=detector, detector_chunk=3, decimation=2)
+        assert torch.allclose(fused, detected[::2], atol=1e-6)
+        fused = nw(source=1, detector=detector, detector_chunk=2)
+        assert torch.allclose(fused, detected, atol=1e-6)
+        with pytest.raises(ValueError):
+            nw(source=1, detector=pt.LowpassDetector(), detector_chunk=3)
+
+
+def test_forward_with_generic_detector_chunk(nw, tenv):
+    class Squared(object):
+        streaming = True
+
+        def reset(self):
+            pass
+
+        def __call__(self, x):
+            return x ** 2
+
+    with tenv:
+        detected = nw(source=1, detector=Squared())
+        fused = nw(source=1, detector=Squared(), detector_chunk=3)
+        assert torch.allclose(fused, detected)
+
+
+def test_forward_with_detector_chunk_and_probes(nw, tenv):
+    detector = pt.LowpassDetector(
+        samplerate=tenv.samplerate,
+        cutoff_frequency=0.1 * tenv.samplerate,
+        streaming=True,
+    )
+    with tenv:
+        _, probed = nw(source=1, probes=[0], power=False)
+        fused, fused_probed = nw(
+            source=1, detector=detector, detector_chunk=3, probes=[0], power=False
+        )
+        assert fused.shape == (tenv.num_t, tenv.num_wl, nw.num_detectors, 1)
+        assert fused_probed.shape == (2, tenv.num_t, tenv.num_wl, 1, 1)
+        assert torch.allclose(fused_probed, probed)
+
+
+def test_plan(nw, tenv):
+    with tenv:
+        plan = nw.plan(num_batches=3, max_memory=nw.plan().memory["forward"])
+        nw.initialize()
+        assert plan.num_mc == nw.num_mc
+        assert plan.num_ml == nw.num_ml
+        assert plan.buffer_shape[1] == nw.buffermask.shape[1]
+        assert plan.memory["forward"] == nw._forward_memory(num_batches=3)
+        assert plan.strategy["batch_chunk"] == 1
+        assert plan.strategy["wl_chunk"] == tenv.num_wl
+        assert plan.strategy["num_chunks"] == 3
+        assert plan.strategy["fits"]
+        assert nw.plan(num_batches=3).strategy["num_chunks"] == 1
+        assert not nw.plan(max_memory=1).strategy["fits"]
+
+
+def test_plan_has_no_side_effects(nw, tenv):
+    wg = nw.components["wg"]
+    env = wg.env
+    with tenv:
+        nw.plan()
+    assert wg.env is env
+
+
 def test_network_connection_with_equal_ports(wg):
     with pytest.raises(IndexError):
         nw = pt.Network(components={"wg1": wg, "wg2": wg}, connections=["wg1:1:wg1:1"])
@@ -177,6 +304,255 @@ def test_network_connection_with_too_high_port_index(wg):
         nw = pt.Network(components={"wg1": wg, "wg2": wg}, connections=["wg1:1:wg2:2"])
 
 
+def test_network_compiled_connections(wg):
+    nw = pt.Network(
+        components={"wg1": wg, "wg2": wg},
+        connections=["wg1 : 1:wg2:0", "wg1:0:1", "wg2:1:0"],
+    )
+    netlist = nw._compile_connections()
+    assert nw.connections == ["wg1:1:wg2:0", "wg1:0:1", "wg2:1:0"]
+    assert netlist.names == ["wg1", "wg2"]
+    assert netlist.edges.tolist() == [[0, 1, 1, 0]]
+    assert netlist.outputs.tolist() == [[0, 0, 1], [1, 1, 0]]
+    assert nw._compile_connections() is netlist
+    assert nw.port_order.tolist() == [3, 0, 1, 2]
+    assert nw.C[1, 2] == nw.C[2, 1] == 1
+
+
+def test_network_deferred_buffers():
+    def build(nw):
+        for i in range(5):
+            nw.add_component("wg%i" % i, pt.Waveguide())
+        for i in range(4):
+            nw.link("wg%i:1" % i, "0:wg%i" % (i + 1))
+        nw.link(0, "0:wg0")
+        nw.link("wg4:1", 1)
+
+    nw1 = pt.Network()
+    build(nw1)
+    nw2 = pt.Network()
+    with nw2.deferred_buffers():
+        build(nw2)
+        assert nw2._buffers_outdated
+    assert not nw2._buffers_outdated
+    assert nw1.connections == nw2.connections
+    assert torch.all(nw1.C == nw2.C)
+    assert torch.all(nw1.port_order == nw2.port_order)
+    assert torch.all(nw1.free_ports_at == nw2.free_ports_at)
+
+
+def test_network_template_cache():
+    cache = pt.networks.template_cache
+    cache.clear()
+    nw1 = pt.ClementsNxN(N=4, capacity=3)
+    misses = cache.misses
+    nw2 = pt.ClementsNxN(N=4, capacity=3)
+    assert cache.hits > 0 and cache.misses == misses
+    for name in ("C", "port_order", "free_ports_at"):
+        assert torch.all(getattr(nw1, name) == getattr(nw2, name))
+        assert getattr(nw1, name).data_ptr() != getattr(nw2, name).data_ptr()
+    assert nw1.num_free_ports == nw2.num_free_ports == 8
+    check_unitarity(nw2.terminate())
+
+
+def test_network_template_cache_normalizes_connections():
+    class Chain(pt.Network):
+        _cache_template = True
+
+        def __init__(self, sep=":"):
+            components = {"wg0": pt.Waveguide(), "wg1": pt.Waveguide()}
+            connections = [sep.join(["wg0", "1", "wg1", "0"])]
+            super(Chain, self).__init__(components, connections)
+
+    cache = pt.networks.template_cache
+    cache.clear()
+    Chain()
+    Chain(sep=" : ")
+    assert cache.hits == 1
+
+
+def test_network_shared_S():
+    class CountingWaveguide(pt.Waveguide):
+        calls = 0
+        _share_S = True
+
+        def set_S(self, S):
+            CountingWaveguide.calls += 1
+            return super(CountingWaveguide, self).set_S(S)
+
+    wgs = {"wg%i" % i: CountingWaveguide(phase=0.3, trainable=False) for i in range(3)}
+    wgs["wg3"] = CountingWaveguide(phase=0.3, length=2e-5, trainable=False)
+    nw = pt.Network(wgs, ["wg0:1:wg1:0", "wg1:1:wg2:0", "wg2:1:wg3:0"])
+    with pt.Environment(wl=[1.5e-6, 1.55e-6], num_t=1, freqdomain=True):
+        nw.initialize()
+    assert CountingWaveguide.calls == 2
+    assert torch.all(nw.S[:, :, 2:4, 2:4] == nw.S[:, :, :2, :2])
+    assert torch.all(nw.S[:, :, 4:6, 4:6] == nw.S[:, :, :2, :2])
+    assert not torch.all(nw.S[:, :, 6:, 6:] == nw.S[:, :, :2, :2])
+
+
+def test_network_shared_S_requires_opt_in():
+    class BiasedWaveguide(pt.Waveguide):
+        def __init__(self, bias, **kwargs):
+            super(BiasedWaveguide, self).__init__(**kwargs)
+            self._bias = bias
+
+        def set_S(self, S):
+            super(BiasedWaveguide, self).set_S(S)
+            S[0] = S[0] + self._bias
+
+    wgs = {"wg%i" % i: BiasedWaveguide(0.1 * i, trainable=False) for i in range(2)}
+    nw = pt.Network(wgs, ["wg0:1:wg1:0"])
+    with pt.Environment(wl=1.55e-6, num_t=1, freqdomain=True):
+        nw.initialize()
+    assert not torch.all(nw.S[:, :, 2:, 2:] == nw.S[:, :, :2, :2])
+
+
+def test_network_batched_S():
+    components = {
+        "wg0": pt.Waveguide(phase=0.1, length=1e-5),
+        "mzi0": pt.Mzi(phi=0.2, theta=0.3),
+        "wg1": pt.Waveguide(phase=0.4, length=2e-5, loss=3.0),
+        "mzi1": pt.Mzi(phi=0.5, theta=0.6, length=2e-5, loss=1e4),
+        "dc": pt.DirectionalCoupler(),
+    }
+    nw = pt.Network(components, ["wg0:1:mzi0:0", "mzi0:1:wg1:0", "wg1:1:mzi1:0"])
+    with pt.Environment(wl=[1.5e-6, 1.55e-6], num_t=1, freqdomain=True):
+        nw.initialize()
+        idx = 0
+        for comp in nw.components.values():
+            n = comp.num_ports
+            S = torch.zeros((2, 2, n, n))
+            comp.set_S(S)
+            block = nw.S[:, :, idx : idx + n, idx : idx + n]
+            np.testing.assert_array_almost_equal(block.detach(), S.detach())
+            idx += n
+
+
+@pytest.mark.parametrize("loss", [0.0, 1e4])
+def test_flat_clements_equals_clements(loss):
+    N, capacity = 4, 3
+    clements = pt.ClementsNxN(
+        N=N,
+        capacity=capacity,
+        wg_factory=lambda: pt.Waveguide(
+            phase=2 * np.pi * np.random.rand(), loss=loss, trainable=True
+        ),
+        mzi_factory=lambda: pt.Mzi(
+            phi=2 * np.pi * np.random.rand(),
+            theta=2 * np.pi * np.random.rand(),
+            loss=loss,
+            trainable=True,
+        ),
+    )
+    flat = pt.FlatClementsNxN(N=N, capacity=capacity, loss=loss)
+    assert flat.num_ports == clements.num_ports
+    assert flat.num_free_ports == clements.num_free_ports
+
+    # copy the phases of the clements network into the flat mesh:
+    layers = list(clements.components.values())
+    for m, (c, l) in enumerate(zip(flat.mzi_columns, flat.mzi_lanes)):
+        c, l = int(c), int(l)
+        if c // 2 < capacity // 2:
+            mzi = layers[c // 2].components["mzi%i" % l]
+        else:
+            mzi = layers[-1].components["mzi%i" % (l // 2)]
+        flat.phi.data[m] = mzi.phi.data
+        flat.theta.data[m] = mzi.theta.data
+    for e, c in enumerate(flat.edge_columns):
+        c = int(c)
+        name = "wg0" if c // 2 < capacity // 2 else "wg_"
+        flat.edge_phase.data[e] = layers[c // 2].components[name].phase.data
+    for l in range(N):
+        flat.phase.data[l] = layers[-1].components["wg%i" % l].phase.data
+
+    if not loss:
+        check_unitarity(flat.terminate())
+    with pt.Environment(num_t=1, freqdomain=True):
+        source = torch.tensor(
+            np.stack([np.eye(N), np.zeros((N, N))], 0),
+            dtype=torch.get_default_dtype(),
+            names=["c", "s", "b"],
+        )
+        R1 = clements.terminate()(source, power=False)
+        R2 = flat.terminate()(source, power=False)
+    np.testing.assert_array_almost_equal(R1.detach().numpy(), R2.detach().numpy())
+
+
+@pytest.mark.parametrize(
+    "mesh",
+    [
+        lambda: pt.ClementsNxN(N=4, capacity=3),
+        lambda: pt.ClementsNxN(N=3),
+        lambda: pt.FlatClementsNxN(N=4, capacity=3),
+        lambda: pt.ReckNxN(N=3),
+        lambda: pt.RingNetwork(N=2, capacity=3),
+    ],
+)
+def test_mesh_transfer_matrix(mesh):
+    mesh = mesh()
+    with pt.Environment(wl=[1.5e-6, 1.55e-6], num_t=1, freqdomain=True):
+        T = mesh.transfer_matrix()
+        nw = mesh.terminate()
+        source = torch.tensor(
+            np.stack([np.eye(mesh.N), np.zeros((mesh.N, mesh.N))], 0),
+            dtype=torch.get_default_dtype(),
+            names=["c", "s", "b"],
+        )
+        R = nw(source, power=False)[:, 0].rename(None)
+    assert T.shape == (2, 2, mesh.N, mesh.N)
+    np.testing.assert_array_almost_equal(T.detach().numpy(), R.detach().numpy())
+
+
+@pytest.mark.parametrize(
+    "mesh",
+    [
+        lambda: pt.ClementsNxN(N=4),
+        lambda: pt.ClementsNxN(N=3, capacity=4),
+        lambda: pt.FlatClementsNxN(N=5),
+        lambda: pt.ReckNxN(N=4),
+    ],
+)
+def test_mesh_load_unitary(mesh):
+    mesh = mesh()
+    N = mesh.N
+    Q, _ = np.linalg.qr(np.random.randn(N, N) + 1j * np.random.randn(N, N))
+    U = torch.tensor(np.stack([Q.real, Q.imag], 0))
+    mesh.load_unitary(U, wl=1.5e-6)
+    with pt.Environment(wl=[1.5e-6], num_t=1, freqdomain=True):
+        T = mesh.transfer_matrix()[:, 0]
+    np.testing.assert_array_almost_equal(T.detach().numpy(), U.numpy(), decimal=5)
+
+
+def test_decomposition_batch():
+    Q, _ = np.linalg.qr(np.random.randn(3, 4, 4) + 1j * np.random.randn(3, 4, 4))
+    U = torch.tensor(np.stack([Q.real, Q.imag], 0))
+    mesh = pt.FlatClementsNxN(N=4)
+    wls = torch.tensor([1.54e-6, 1.55e-6, 1.56e-6], dtype=torch.float64)
+    phase0 = pt.networks.clements._propagation_phase(mesh, wls)
+    phases = pt.clements_decomposition(U, phase0=phase0)
+    phi, theta, phase = phases
+    assert phi.shape == theta.shape == (3, 6) and phase.shape == (3, 4)
+    mesh.edge_phase.data.zero_()
+    for i in range(3):  # each unitary is implemented at its own wavelength
+        pt.networks.clements._load_phases(
+            [mesh.phi, mesh.theta, mesh.phase], [p[i] for p in phases],
+        )
+        with pt.Environment(wl=wls.tolist(), num_t=1, freqdomain=True):
+            T = mesh.transfer_matrix()[:, i]
+        np.testing.assert_array_almost_equal(
+            T.detach().numpy(), U[:, i].numpy(), decimal=5
+        )
+
+    phases = pt.reck_decomposition(U[:, :, None], phase0=phase0[:, None])
+    phi, theta, phase = phases
+    assert phi.shape == theta.shape == (3, 1, 6) and phase.shape == (3, 1, 4)
+    for i in range(3):  # the batch equals the decomposition of each unitary
+        single = pt.reck_decomposition(U[:, i], phase0=phase0[i])
+        for p, q in zip(phases, single):
+            np.testing.assert_array_almost_equal(p[i, 0].numpy(), q.numpy())
+
+
 def test_reck_unitarity(reck):
     check_unitarity(reck)
 
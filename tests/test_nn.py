@@ -83,6 +83,14 @@ def test_buffer_repr():
     assert s.startswith("Buffer")
 
 
+def test_buffer_operations_return_tensors():
+    module = pt.nn.Module()
+    module.buffer = pt.Buffer(data=torch.tensor([0.5]))
+    module.derived = 2 * module.buffer
+    assert type(module.derived) is torch.Tensor
+    assert list(dict(module.named_buffers())) == ["buffer"]
+
+
 def test_ber():
     berfunc = pt.BERLoss(bitrate=50e9, samplerate=160e9)  # uneven sample rate
     streamgenerator = pt.BitStreamGenerator(bitrate=50e9, samplerate=160e9)
@@ -94,6 +102,28 @@ def test_ber():
     assert ber == 0.1
 
 
+def test_ber_fractional_sampling():
+    bitrate, samplerate, rb = 50e9, 160e9, 5  # 3.2 samples per bit
+    streamgenerator = pt.BitStreamGenerator(bitrate=bitrate, samplerate=samplerate)
+    bits = np.random.RandomState(seed=1).rand(2, 50) > 0.5
+    prediction, target = streamgenerator(bits[0]), streamgenerator(bits[1])
+    for latency, warmup in [(0.0, 0), (1.25, 2), (-0.6, 1)]:
+        berfunc = pt.BERLoss(
+            latency=latency, warmup=warmup, bitrate=bitrate, samplerate=samplerate
+        )
+        # reference: replicate each sample rb times and slice every s-th sample
+        s = int(rb * samplerate / bitrate + 0.5)
+        l = int(latency * s + 0.5)
+        w = warmup * s
+        shape = (-1,) + tuple(prediction.shape[1:])
+        p = torch.stack([prediction] * rb, 1).reshape(shape)[w + s // 2 + l :: s]
+        t = torch.stack([target] * rb, 1).reshape(shape)[w + s // 2 :: s]
+        m = min(p.shape[0], t.shape[0])
+        wrong_bits = (p[:m] > 0.5) != (t[:m] > target.mean(0))
+        expected = wrong_bits.to(torch.float64).mean().item()
+        assert berfunc(prediction, target) == pytest.approx(expected)
+
+
 def test_mse():
     msefunc = pt.MSELoss(bitrate=50e9, samplerate=160e9)  # uneven sample rate
     streamgenerator = pt.BitStreamGenerator(bitrate=50e9, samplerate=160e9)
@@ -106,6 +136,101 @@ def test_mse():
     assert mse.requires_grad
 
 
+def test_accumulators():
+    berfunc = pt.BERLoss(latency=1.25, warmup=2, bitrate=50e9, samplerate=160e9)
+    msefunc = pt.MSELoss(latency=1.25, warmup=2, bitrate=50e9, samplerate=160e9)
+    beracc = pt.BERAccumulator(
+        latency=1.25, warmup=2, bitrate=50e9, samplerate=160e9, target_threshold=0.5
+    )
+    mseacc = pt.MSEAccumulator(latency=1.25, warmup=2, bitrate=50e9, samplerate=160e9)
+    streamgenerator = pt.BitStreamGenerator(bitrate=50e9, samplerate=160e9)
+    bits = np.random.RandomState(seed=0).rand(2, 200) > 0.5
+    prediction, target = streamgenerator(bits[0]), streamgenerator(bits[1])
+    for i in range(0, prediction.shape[0], 37):
+        beracc.update(prediction[i : i + 37], target[i : i + 37])
+        mseacc.update(prediction[i : i + 37], target[i : i + 37])
+    assert np.allclose(beracc.ber, berfunc(prediction, target))
+    assert np.allclose(mseacc.mse, msefunc(prediction, target).item())
+    lower, upper = beracc.confidence_interval(0.95)
+    assert lower < beracc.ber < upper
+    with pytest.raises(RuntimeError):
+        mseacc.update(torch.zeros(10, 1, 2, 1), torch.zeros(10, 1, 3, 1))
+
+
+def test_estimate_latency():
+    streamgenerator = pt.BitStreamGenerator(bitrate=40e9, samplerate=160e9)
+    bits = np.random.RandomState(seed=0).rand(100) > 0.5
+    target = streamgenerator(bits)
+    prediction = torch.cat([torch.zeros(6), target[:-6]])
+    lag, latency = pt.estimate_latency(
+        prediction, target, bitrate=40e9, samplerate=160e9, max_latency=5
+    )
+    assert lag.shape == (1, 1, 1)
+    assert lag.item() == 6
+    assert abs(latency.item() - 1.5) < 0.1
+
+
+def test_bitstream_generator_stream():
+    streamgenerator = pt.BitStreamGenerator(
+        bitrate=50e9, samplerate=160e9, cutoff_frequency=40e9, seed=3
+    )
+    bits = np.random.RandomState(seed=0).rand(100) > 0.5
+    stream = streamgenerator(bits)
+    chunks = list(streamgenerator.stream(bits, chunk_size=33))
+    assert all(chunk.shape[0] == 33 for chunk in chunks[:-1])
+    assert torch.allclose(torch.cat(chunks), stream)
+
+
+def test_prbs():
+    bits = pt.prbs(7, num_bits=2 * 127)
+    assert (bits[:127] == bits[127:]).all()
+    assert bits[:127].sum() == 64
+    chunks = list(pt.prbs_chunks(15, chunk_size=1000, num_bits=2500))
+    assert (np.concatenate(chunks) == pt.prbs(15, num_bits=2500)).all()
+
+
+def test_ridge_readout():
+    torch.manual_seed(0)
+    states = torch.rand(50, 1, 3, 2)
+    weight = torch.tensor([0.5, -1.0, 2.0])
+    target = (states[:, 0] * weight[None, :, None]).sum(1) + 0.3
+    readout = pt.RidgeReadout(alpha=0.0, warmup=5)
+    readout.accumulate(states[:20], target[:20])
+    readout.accumulate(states[20:], target[20:])
+    readout.solve()
+    assert torch.allclose(readout.weight[:, 0], weight, atol=1e-4)
+    assert torch.allclose(readout.bias, torch.tensor([0.3]), atol=1e-4)
+    assert torch.allclose(readout(states)[:, 0], target, atol=1e-4)
+
+
+def test_matrix_layer_mmi():
+    weights = np.array([[0.6, 0.8], [0.8, -0.6]])
+    layer = pt.MatrixLayer(pt.Mmi(weights=weights, trainable=False))
+    x = torch.rand(5, 2, dtype=torch.get_default_dtype())
+    y = layer(x)
+    assert y.shape == (2, 5, 2)
+    np.testing.assert_array_almost_equal(y[0].numpy(), x.numpy() @ weights)
+    np.testing.assert_array_almost_equal(y[1].numpy(), np.zeros((5, 2)))
+
+
+def test_matrix_layer_cache():
+    mesh = pt.ClementsNxN(N=3)
+    layer = pt.MatrixLayer(mesh)
+    x = torch.rand(2, 4, 3, dtype=torch.get_default_dtype())
+    with torch.no_grad():
+        matrix = layer.matrix
+        assert layer.matrix is matrix
+        y = layer(x, power=True)
+        mesh.components["layer0"].components["mzi0"].phi.add_(1.0)
+        assert layer.matrix is not matrix
+    with pt.Environment(wl=1.55e-6, num_t=1, freqdomain=True):
+        T = mesh.transfer_matrix()[:, 0]
+    assert torch.allclose(layer.matrix, T)
+    layer(x, power=True).sum().backward()
+    assert mesh.components["layer0"].components["mzi0"].phi.grad is not None
+    assert y.shape == (4, 3)
+
+
 ###############
 ## Run Tests ##
 ###############